@@ -0,0 +1,211 @@
+"""
+Adaptive (AIMD) concurrency control for CDN and S3 transfers.
+
+Each host class (Instagram CDN, Shopify CDN, S3, anything else) gets its own
+limiter. While requests succeed with healthy latency the limit grows
+additively (about +1 per window of completions); a throttling response
+(429/503, S3 SlowDown) halves it. Workers block in slot() until their host
+has room, so the thread pool can be sized generously and the limiters find
+the best sustainable rate for each host. Coroutines use async_slot(), which
+waits on the event loop instead of blocking it.
+
+Also holds the retry policy shared by every downloader: only transient
+statuses are retried, with full-jitter exponential backoff between attempts.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from urllib.parse import urlparse
+
+# Statuses worth retrying - 404/403/410 are permanent and retried never
+RETRYABLE_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+THROTTLE_STATUSES = frozenset({429, 503})
+S3_THROTTLE_CODES = frozenset({'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded', '503'})
+
+ASYNC_POLL_SECONDS = 0.01  # how often async_slot() checks a full limiter for room
+
+DEFAULT_HOST_LIMITS = {
+    'instagram-cdn': {'initial': 8, 'min': 1, 'max': 48},
+    'shopify-cdn': {'initial': 8, 'min': 1, 'max': 32},
+    's3': {'initial': 16, 'min': 2, 'max': 64},
+    'default': {'initial': 4, 'min': 1, 'max': 16},
+}
+
+def is_retryable_status(status):
+    return status in RETRYABLE_STATUSES
+
+def backoff_delay(attempt, base=0.5, cap=20.0):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2^attempt))"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def host_class(url_or_host):
+    """Map a URL (or the literal 's3') to the limiter that governs it"""
+    if url_or_host == 's3':
+        return 's3'
+    host = urlparse(url_or_host).hostname or url_or_host
+    if host.endswith('cdninstagram.com') or host.endswith('fbcdn.net'):
+        return 'instagram-cdn'
+    if host == 'cdn.shopify.com' or host.endswith('.myshopify.com'):
+        return 'shopify-cdn'
+    if host.endswith('amazonaws.com'):
+        return 's3'
+    return 'default'
+
+def _is_throttle_error(error):
+    """True for botocore throttling errors"""
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in S3_THROTTLE_CODES
+
+class AIMDLimiter:
+    """Counting limiter whose capacity follows additive-increase / multiplicative-decrease"""
+
+    def __init__(self, name, initial, min_limit, max_limit, decrease=0.5, latency_tolerance=2.0):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.completed = 0
+        self.throttled = 0
+        self.ewma_latency = None      # fast average - what latency looks like right now
+        self.baseline_latency = None  # slow average - what latency normally looks like
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def try_acquire(self):
+        """Take a slot if one is free, without waiting"""
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency, throttled, sample=True):
+        """Return a slot; sample=False for responses whose latency says nothing (404s, errors)"""
+        with self._cond:
+            self.in_flight -= 1
+            self.completed += 1
+
+            if throttled:
+                self.throttled += 1
+                # One decrease per round trip - a burst of 429s from the same window is one signal
+                now = time.monotonic()
+                if now - self._last_decrease > (self.ewma_latency or 0.1):
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = now
+            elif sample:
+                if self.ewma_latency is None:
+                    self.ewma_latency = self.baseline_latency = latency
+                else:
+                    self.ewma_latency = 0.8 * self.ewma_latency + 0.2 * latency
+                    self.baseline_latency = 0.98 * self.baseline_latency + 0.02 * latency
+                # Grow only while current latency stays near normal (no queueing building up at the host)
+                if self.ewma_latency <= self.baseline_latency * self.latency_tolerance:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+            self._cond.notify_all()
+
+class _Slot:
+    """Handle yielded by TransferScheduler.slot(); set .status to the HTTP status seen"""
+
+    def __init__(self):
+        self.status = None
+
+class TransferScheduler:
+    """Per-host AIMD limiters shared by every worker in a migration run"""
+
+    def __init__(self, host_limits=None):
+        self.host_limits = dict(DEFAULT_HOST_LIMITS)
+        self.host_limits.update(host_limits or {})
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    @property
+    def max_workers(self):
+        """Threads needed to saturate the largest CDN limit and the S3 limit at once"""
+        cdn_max = max(limits['max'] for name, limits in self.host_limits.items() if name != 's3')
+        return cdn_max + self.host_limits['s3']['max']
+
+    def limiter(self, url_or_host):
+        name = host_class(url_or_host)
+        with self._lock:
+            if name not in self._limiters:
+                limits = self.host_limits.get(name, self.host_limits['default'])
+                self._limiters[name] = AIMDLimiter(name, limits['initial'], limits['min'], limits['max'])
+            return self._limiters[name]
+
+    @contextmanager
+    def slot(self, url_or_host):
+        """Hold one concurrency slot for the host of url_or_host ('s3' for uploads)"""
+        limiter = self.limiter(url_or_host)
+        limiter.acquire()
+        with self._held(limiter) as handle:
+            yield handle
+
+    @asynccontextmanager
+    async def async_slot(self, url_or_host):
+        """slot() for coroutines: polls for room instead of blocking the event loop"""
+        limiter = self.limiter(url_or_host)
+        while not limiter.try_acquire():
+            await asyncio.sleep(ASYNC_POLL_SECONDS)
+        with self._held(limiter) as handle:
+            yield handle
+
+    @contextmanager
+    def _held(self, limiter):
+        """Time an acquired slot and release it with the outcome"""
+        handle = _Slot()
+        start = time.monotonic()
+        throttled = False
+        failed = False
+        try:
+            yield handle
+        except Exception as e:
+            throttled = limiter.name == 's3' and _is_throttle_error(e)
+            failed = True
+            raise
+        finally:
+            throttled = throttled or handle.status in THROTTLE_STATUSES
+            sample = not failed and (handle.status is None or handle.status < 400)
+            limiter.release(time.monotonic() - start, throttled, sample)
+
+    def stats(self):
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {
+            limiter.name: {
+                'limit': round(limiter.limit, 1),
+                'completed': limiter.completed,
+                'throttled': limiter.throttled,
+                'latency_ms': round((limiter.ewma_latency or 0) * 1000)
+            }
+            for limiter in limiters
+        }
+
+    def print_stats(self):
+        for name, stats in self.stats().items():
+            print(f"🎚️  {name}: limit {stats['limit']}, {stats['completed']} requests, "
+                  f"{stats['throttled']} throttled, ~{stats['latency_ms']} ms")
+
+def scheduler_slot(scheduler, url_or_host):
+    """scheduler.slot(...) or a no-op context when running without a scheduler"""
+    if scheduler is None:
+        return nullcontext(_Slot())
+    return scheduler.slot(url_or_host)
+
+def async_scheduler_slot(scheduler, url_or_host):
+    """scheduler.async_slot(...) or a no-op async context when running without a scheduler"""
+    if scheduler is None:
+        return nullcontext(_Slot())
+    return scheduler.async_slot(url_or_host)
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Apify API, so the scrapers run without a token or network.
+
+Serves the endpoints the scrapers call, replaying fixture files as datasets:
+
+    POST /v2/acts/<actor>/runs                           start a run
+    POST /v2/acts/<actor>/run-sync-get-dataset-items     run and return the items in one call
+    GET  /v2/actor-runs/<id>, /v2/acts/<actor>/runs/<id> run status (honours waitForFinish)
+    GET  /v2/actor-runs                                  run list (RunWaiter's batched checks)
+    POST /v2/actor-runs/<id>/abort                       abort a run
+    GET  /v2/actor-runs/<id>/log                         a one-line log (ApifyClient streams it)
+    GET  /v2/datasets/<id>/items, /v2/actor-runs/<id>/dataset/items
+                                                         items with offset/limit/desc and the
+                                                         X-Apify-Pagination-* headers
+
+Each actor replays one fixture: a JSON list such as instagram_data.json or a
+JSON lines file, registered as ACTOR=PATH, or ACTOR:RESULTS_TYPE=PATH for one
+resultsType only (e.g. the profile details verify_instagram_followers asks
+for). The run input trims it the way the actor would: resultsLimit, maxItems
+or maxCrawlPages cap it and onlyPostsNewerThan drops older posts. Every
+response waits --latency-ms, runs take --run-seconds to finish, --fail-rate of
+runs end FAILED and --error-rate of requests get a 503, drawn from --seed so a
+benchmark sees the same failures every time.
+
+Point the scrapers at it with APIFY_API_BASE:
+
+    python scripts/apify_mock.py --fixture apify~instagram-scraper=viewer/public/instagram_data.json
+    APIFY_API_BASE=http://127.0.0.1:8765/v2 APIFY_API_TOKEN=mock python scripts/scrape_brand_instagram.py isme ismeswim
+
+From Python, start_mock() returns the running server; its api_base is the
+value for APIFY_API_BASE.
+"""
+
+import argparse
+import gzip
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from apify_runs import INSTAGRAM_SCRAPER, LONG_POLL_SECONDS, SUCCEEDED, TERMINAL_STATUSES
+
+DEFAULT_FIXTURE = 'viewer/public/instagram_data.json'
+DEFAULT_PORT = 8765
+LIMIT_FIELDS = ('resultsLimit', 'maxItems', 'maxCrawlPages')
+
+def load_fixture(path):
+    """Items of a JSON list or JSON lines file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def replay_items(items, run_input):
+    """The fixture items a run with run_input returns, trimmed the way the actors trim their output"""
+    since = run_input.get('onlyPostsNewerThan')
+    if since:
+        items = [item for item in items if (item.get('timestamp') or '') > since]
+    limit = next((run_input[field] for field in LIMIT_FIELDS if run_input.get(field)), None)
+    return list(items[:int(limit)] if limit else items)
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+class ApifyMockHandler(BaseHTTPRequestHandler):
+    """The Apify API endpoints listed in the module docstring; configured and reset by start_mock()"""
+    protocol_version = 'HTTP/1.1'
+    fixtures = {}
+    latency = 0.0
+    run_seconds = 2.0
+    fail_rate = 0.0
+    error_rate = 0.0
+    random = random.Random(0)
+    runs = {}
+    datasets = {}
+    ids = itertools.count(1)
+    stats = {}
+    lock = threading.Lock()
+
+    # apify-client 1.x calls actors /acts, later versions /actors
+    ROUTES = (
+        ('POST', r'/v2/act(?:or)?s/([^/]+)/runs', '_start_run'),
+        ('POST', r'/v2/act(?:or)?s/([^/]+)/run-sync-get-dataset-items', '_run_sync'),
+        ('GET', r'/v2/actor-runs', '_list_runs'),
+        ('GET', r'/v2/(?:act(?:or)?s/[^/]+/runs|actor-runs)/([^/]+)', '_get_run'),
+        ('POST', r'/v2/(?:act(?:or)?s/[^/]+/runs|actor-runs)/([^/]+)/abort', '_abort_run'),
+        ('GET', r'/v2/(?:act(?:or)?s/[^/]+/runs|actor-runs)/([^/]+)/dataset/items', '_run_items'),
+        ('GET', r'/v2/(?:act(?:or)?s/[^/]+/runs|actor-runs)/([^/]+)/log', '_run_log'),
+        ('GET', r'/v2/datasets/([^/]+)/items', '_dataset_items'),
+    )
+
+    # --- plumbing
+
+    def _reply(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status, error_type, message):
+        self._reply(status, {'error': {'type': error_type, 'message': message}})
+
+    def _body(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        # ApifyClient gzips run inputs
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        return json.loads(body) if body else {}
+
+    def _count(self, name, amount=1):
+        with ApifyMockHandler.lock:
+            ApifyMockHandler.stats[name] = ApifyMockHandler.stats.get(name, 0) + amount
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        # Read the body before replying, so an error reply doesn't leave it in the keep-alive stream
+        body = self._body() if method == 'POST' else None
+        self._count('requests')
+        time.sleep(self.latency)
+
+        if not query.get('token') and not self.headers.get('Authorization'):
+            return self._error(401, 'token-not-provided', "Authentication token was not provided")
+        with ApifyMockHandler.lock:
+            inject_error = self.random.random() < self.error_rate
+        if inject_error:
+            self._count('errors_injected')
+            return self._error(503, 'server-error', "Injected failure (apify_mock --error-rate)")
+
+        for route_method, pattern, name in self.ROUTES:
+            match = re.fullmatch(pattern, url.path.rstrip('/'))
+            if route_method == method and match:
+                return getattr(self, name)(*match.groups(), query=query, body=body)
+        self._error(404, 'page-not-found', f"{method} {url.path} is not mocked")
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def log_message(self, *args):
+        pass
+
+    # --- runs
+
+    def _status(self, run):
+        if run['aborted']:
+            return 'ABORTED'
+        if time.time() - run['started'] < self.run_seconds:
+            return 'RUNNING'
+        return 'FAILED' if run['fails'] else SUCCEEDED
+
+    def _run_data(self, run):
+        status = self._status(run)
+        return {
+            'id': run['id'], 'actId': run['actor'], 'userId': 'mock-user', 'actorTaskId': None,
+            'status': status, 'startedAt': _iso(run['started']),
+            'finishedAt': _iso(run['started'] + self.run_seconds) if status in TERMINAL_STATUSES else None,
+            'buildId': 'mock-build', 'buildNumber': '0.0.1', 'meta': {'origin': 'API'}, 'stats': {},
+            'options': {'build': 'latest', 'timeoutSecs': 0, 'memoryMbytes': 1024, 'diskMbytes': 2048},
+            'defaultDatasetId': run['dataset_id'], 'defaultKeyValueStoreId': f"store-{run['id']}",
+            'defaultRequestQueueId': f"queue-{run['id']}",
+        }
+
+    def _new_run(self, actor, run_input):
+        """Register a run of actor, or return None when no fixture is registered for it"""
+        actor = actor.replace('/', '~')
+        fixture = self.fixtures.get(f"{actor}:{run_input.get('resultsType')}", self.fixtures.get(actor))
+        if fixture is None:
+            return None
+        with ApifyMockHandler.lock:
+            number = next(self.ids)
+            run = {'id': f"mockrun{number:010d}", 'actor': actor, 'dataset_id': f"mockdataset{number:06d}",
+                   'started': time.time(), 'aborted': False, 'fails': self.random.random() < self.fail_rate}
+            ApifyMockHandler.runs[run['id']] = run
+            ApifyMockHandler.datasets[run['dataset_id']] = replay_items(fixture, run_input)
+        self._count('runs')
+        return run
+
+    def _wait(self, run, seconds):
+        deadline = time.time() + seconds
+        while self._status(run) not in TERMINAL_STATUSES and time.time() < deadline:
+            time.sleep(0.05)
+
+    def _start_run(self, actor, query, body):
+        run = self._new_run(actor, body)
+        if run is None:
+            return self._error(404, 'record-not-found', f"No fixture for actor {actor}")
+        self._reply(201, {'data': self._run_data(run)})
+
+    def _run_sync(self, actor, query, body):
+        run = self._new_run(actor, body)
+        if run is None:
+            return self._error(404, 'record-not-found', f"No fixture for actor {actor}")
+        self._wait(run, float(query.get('timeout', 300)))
+        status = self._status(run)
+        if status != SUCCEEDED:
+            return self._error(400 if status in TERMINAL_STATUSES else 408, 'run-failed',
+                               f"Actor run {run['id']} finished with status {status}")
+        items = self.datasets[run['dataset_id']]
+        self._count('items', len(items))
+        self._reply(201, items)
+
+    def _get_run(self, run_id, query, body):
+        run = self.runs.get(run_id)
+        if run is None:
+            return self._error(404, 'record-not-found', f"Actor run {run_id} was not found")
+        self._wait(run, min(float(query.get('waitForFinish', 0)), LONG_POLL_SECONDS))
+        self._reply(200, {'data': self._run_data(run)})
+
+    def _abort_run(self, run_id, query, body):
+        run = self.runs.get(run_id)
+        if run is None:
+            return self._error(404, 'record-not-found', f"Actor run {run_id} was not found")
+        if self._status(run) not in TERMINAL_STATUSES:
+            run['aborted'] = True
+        self._reply(200, {'data': self._run_data(run)})
+
+    def _run_log(self, run_id, query, body):
+        # Newer ApifyClients stream the run's log while call() waits
+        log = f"Mock run {run_id} replaying a fixture\n".encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(log)))
+        self.end_headers()
+        self.wfile.write(log)
+
+    def _list_runs(self, query, body):
+        desc = query.get('desc', '').lower() in ('1', 'true')
+        runs = sorted(self.runs.values(), key=lambda run: run['started'], reverse=desc)
+        offset = int(query.get('offset', 0))
+        limit = int(query.get('limit', 1000))
+        items = [self._run_data(run) for run in runs[offset:offset + limit]]
+        self._reply(200, {'data': {'total': len(runs), 'offset': offset, 'limit': limit, 'count': len(items),
+                                   'desc': desc, 'items': items}})
+
+    # --- datasets
+
+    def _run_items(self, run_id, query, body):
+        run = self.runs.get(run_id)
+        if run is None:
+            return self._error(404, 'record-not-found', f"Actor run {run_id} was not found")
+        self._dataset_items(run['dataset_id'], query, body)
+
+    def _dataset_items(self, dataset_id, query, body):
+        items = self.datasets.get(dataset_id)
+        if items is None:
+            return self._error(404, 'record-not-found', f"Dataset {dataset_id} was not found")
+        desc = query.get('desc', '').lower() in ('1', 'true')
+        offset = int(query.get('offset', 0))
+        limit = int(query.get('limit') or 0) or len(items)
+        page = (items[::-1] if desc else items)[offset:offset + limit]
+        self._count('items', len(page))
+        self._reply(200, page, {
+            'X-Apify-Pagination-Total': str(len(items)), 'X-Apify-Pagination-Offset': str(offset),
+            'X-Apify-Pagination-Limit': str(limit), 'X-Apify-Pagination-Count': str(len(page)),
+            'X-Apify-Pagination-Desc': str(desc).lower(),
+        })
+
+def start_mock(fixtures=None, port=0, latency=0.0, run_seconds=2.0, fail_rate=0.0, error_rate=0.0, seed=0):
+    """
+    Serve the mock on a background thread (port 0 picks a free port)
+
+    Args:
+        fixtures: {'ACTOR' or 'ACTOR:RESULTS_TYPE': path or list of items};
+                  default: the Instagram scraper replaying DEFAULT_FIXTURE
+        latency: Seconds added to every response
+        run_seconds: Seconds from starting a run until it finishes
+        fail_rate, error_rate: Fraction of runs that end FAILED / of requests answered with a 503
+
+    Returns:
+        The server; server.api_base is the value for APIFY_API_BASE, server.shutdown() stops it
+    """
+    fixtures = fixtures or {INSTAGRAM_SCRAPER: DEFAULT_FIXTURE}
+    ApifyMockHandler.fixtures = {actor.replace('/', '~'): load_fixture(items) if isinstance(items, str) else items
+                                 for actor, items in fixtures.items()}
+    ApifyMockHandler.latency = latency
+    ApifyMockHandler.run_seconds = run_seconds
+    ApifyMockHandler.fail_rate = fail_rate
+    ApifyMockHandler.error_rate = error_rate
+    ApifyMockHandler.random = random.Random(seed)
+    ApifyMockHandler.runs = {}
+    ApifyMockHandler.datasets = {}
+    ApifyMockHandler.ids = itertools.count(1)
+    ApifyMockHandler.stats = {}
+
+    server = _Server(('127.0.0.1', port), ApifyMockHandler)
+    server.api_base = f"http://127.0.0.1:{server.server_port}/v2"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def print_stats():
+    stats = ApifyMockHandler.stats
+    print(f"📊 Mock served {stats.get('requests', 0)} requests, {stats.get('runs', 0)} runs, "
+          f"{stats.get('items', 0)} items ({stats.get('errors_injected', 0)} injected errors)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Apify API that replays fixtures")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--fixture', action='append', default=None, metavar='ACTOR[:RESULTS_TYPE]=PATH',
+                        help=f"Items an actor's runs replay, JSON list or JSON lines (repeatable; default: "
+                             f"{INSTAGRAM_SCRAPER}={DEFAULT_FIXTURE})")
+    parser.add_argument('--latency-ms', type=int, default=0, help="Delay added to every response (default: 0)")
+    parser.add_argument('--run-seconds', type=float, default=2.0,
+                        help="Time from starting a run until it finishes (default: 2)")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of runs that end FAILED (default: 0)")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Fraction of requests answered with a 503 (default: 0)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the injected failures (default: 0)")
+    args = parser.parse_args()
+
+    fixtures = None
+    if args.fixture:
+        fixtures = {}
+        for spec in args.fixture:
+            actor, _, path = spec.partition('=')
+            if not path:
+                parser.error(f"--fixture expects ACTOR=PATH, got {spec}")
+            fixtures[actor] = path
+
+    server = start_mock(fixtures, args.port, args.latency_ms / 1000, args.run_seconds, args.fail_rate,
+                        args.error_rate, args.seed)
+    for actor, items in ApifyMockHandler.fixtures.items():
+        print(f"🎭 {actor}: {len(items)} items")
+    print(f"🚀 Mock Apify API on {server.api_base}")
+    print(f"   export APIFY_API_BASE={server.api_base} APIFY_API_TOKEN=mock")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print_stats()
+
+if __name__ == "__main__":
+    main()
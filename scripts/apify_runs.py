@@ -0,0 +1,472 @@
+"""
+Run many Apify actors at once and hand over each dataset as soon as its run finishes.
+
+The scrapers used to call run-sync-get-dataset-items, which holds one HTTP
+request open for the whole actor run (up to 300 s), so checking ten accounts
+meant ten runs back to back. ApifyRunManager starts every run through the
+async runs endpoint instead, tracks them all from one asyncio event loop and
+calls on_dataset(run, items) for each run the moment its dataset is ready -
+items streams the dataset page by page, and jsonl_path saves it as it goes.
+The API calls themselves go through the pooled keep-alive sessions on worker
+threads.
+
+    manager = ApifyRunManager(token)
+    for username in usernames:
+        manager.add(INSTAGRAM_SCRAPER, instagram_input(username), label=f"@{username}", on_dataset=save)
+    manager.run()
+
+RunWaiter is the one place that waits for runs to finish (the manager and
+wait_for_run() both use it). Instead of sleeping a fixed 5-10 s between status
+calls, it long-polls with the API's waitForFinish parameter, so the response
+arrives as soon as the run finishes - about one call per minute per run. Past
+max_long_polls runs at once, the extra runs are checked together from the run
+list (one call per tick for all of them, reading only its newest page - runs
+that aren't on it get a GET each), polling every second while statuses
+change and backing off to max_interval while they're all just running.
+
+Datasets are read with iter_dataset_items(): pages of page_size items fetched
+a few at a time in parallel and yielded in order, so a 1000-post scrape or a
+500-page crawl never sits in memory as one response. With ijson installed
+(pip install ijson) each page is parsed incrementally from the socket too.
+JsonlTee writes items to a JSON lines file as they stream past.
+
+Every call goes to apify_api_base(): https://api.apify.com/v2 unless the
+APIFY_API_BASE environment variable points the scrapers somewhere else, such
+as the local stand-in in apify_mock.py.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from adaptive_scheduler import backoff_delay
+from http_pool import get_session
+
+APIFY_API_BASE = 'https://api.apify.com/v2'
+INSTAGRAM_SCRAPER = 'apify~instagram-scraper'
+
+DEFAULT_MAX_RUNS = 8          # runs in flight at once (the account's memory limit caps this too)
+DEFAULT_RUN_TIMEOUT = 900     # seconds before a run is aborted and reported as failed
+LONG_POLL_SECONDS = 60        # the API holds a waitForFinish request for at most 60 s
+DEFAULT_MAX_LONG_POLLS = 8    # runs long-polled individually; the rest share batched list checks
+RUN_LIST_LIMIT = 1000         # most runs the run list returns per call
+DATASET_PAGE_SIZE = 1000      # items per dataset page request
+DEFAULT_PAGE_FETCHES = 4      # dataset pages downloaded at once
+
+SUCCEEDED = 'SUCCEEDED'
+FAILED_STATUSES = frozenset({'FAILED', 'ABORTED', 'TIMED-OUT'})
+TERMINAL_STATUSES = FAILED_STATUSES | {SUCCEEDED}
+
+def apify_api_base():
+    """Base URL of the Apify API, overridable with APIFY_API_BASE (read on every call, after load_dotenv)"""
+    return os.getenv('APIFY_API_BASE', APIFY_API_BASE).rstrip('/')
+
+def apify_client_url():
+    """api_url for ApifyClient, which appends /v2 itself"""
+    base = apify_api_base()
+    return base[:-len('/v2')] if base.endswith('/v2') else base
+
+def run_sync_url(actor):
+    """run-sync-get-dataset-items endpoint of actor"""
+    return f"{apify_api_base()}/acts/{actor}/run-sync-get-dataset-items"
+
+def instagram_input(username, results_type='posts', max_posts=1000):
+    """apify/instagram-scraper input for one profile"""
+    return {
+        "directUrls": [f"https://www.instagram.com/{username}/"],
+        "resultsType": results_type,
+        "resultsLimit": max_posts,
+        "addParentData": False
+    }
+
+def apify_request(token, method, path, api_base=None, timeout=60, **kwargs):
+    """Blocking Apify API call; returns the parsed JSON body or raises RuntimeError"""
+    params = dict(kwargs.pop('params', None) or {}, token=token)
+    url = f"{(api_base or apify_api_base()).rstrip('/')}{path}"
+    response = get_session().request(method, url, params=params, timeout=timeout, **kwargs)
+    if response.status_code not in [200, 201]:
+        raise RuntimeError(f"HTTP {response.status_code} from {path}: {response.text[:200]}")
+    return response.json()
+
+def _parse_items(response):
+    """Items of one dataset page, parsed as the bytes arrive when ijson is installed"""
+    try:
+        import ijson
+    except ImportError:
+        return response.json()
+    response.raw.decode_content = True
+    return list(ijson.items(response.raw, 'item', use_float=True))
+
+def fetch_dataset_page(token, path, offset, limit, api_base=None):
+    """
+    One page of dataset items
+
+    Returns:
+        (items, total) - total is the dataset's item count, or None if the API didn't say
+    """
+    url = f"{(api_base or apify_api_base()).rstrip('/')}{path}"
+    response = get_session().get(url, stream=True, timeout=300,
+                                 params={'token': token, 'offset': offset, 'limit': limit, 'format': 'json'})
+    with response:
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code} from {path}: {response.text[:200]}")
+        total = response.headers.get('X-Apify-Pagination-Total')
+        return _parse_items(response), int(total) if total is not None else None
+
+def iter_dataset_items(token, dataset_id=None, run_id=None, page_size=DATASET_PAGE_SIZE,
+                       max_parallel_pages=DEFAULT_PAGE_FETCHES, api_base=None):
+    """
+    Yield the items of a dataset (or of a run's default dataset) in order
+
+    The first page reports the total; the remaining pages are fetched up to
+    max_parallel_pages ahead of the consumer, so at most that many pages are in memory.
+    """
+    path = f"/datasets/{dataset_id}/items" if dataset_id else f"/actor-runs/{run_id}/dataset/items"
+    items, total = fetch_dataset_page(token, path, 0, page_size, api_base)
+    yield from items
+
+    if total is None:
+        # No pagination headers - keep reading until a short page
+        offset = len(items)
+        while len(items) == page_size:
+            items, _ = fetch_dataset_page(token, path, offset, page_size, api_base)
+            offset += len(items)
+            yield from items
+        return
+
+    with ThreadPoolExecutor(max_workers=max_parallel_pages) as executor:
+        pages = deque()
+        for offset in range(page_size, total, page_size):
+            pages.append(executor.submit(fetch_dataset_page, token, path, offset, page_size, api_base))
+            if len(pages) >= max_parallel_pages:
+                yield from pages.popleft().result()[0]
+        while pages:
+            yield from pages.popleft().result()[0]
+
+class JsonlTee:
+    """Passes items through, appending each one to a JSON lines file; count is how many went by"""
+
+    def __init__(self, items, path):
+        self.items = items
+        self.path = path
+        self.count = 0
+
+    def __iter__(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            for item in self.items:
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+                self.count += 1
+                yield item
+        print(f"💾 {self.count} items saved to {self.path}")
+
+class RunWaiter:
+    """Thread-safe waiter for actor runs that keeps status calls to a minimum (see module docstring)"""
+
+    def __init__(self, token, api_base=None, max_long_polls=DEFAULT_MAX_LONG_POLLS,
+                 min_interval=1.0, max_interval=5.0):
+        self.token = token
+        self.api_base = api_base
+        self.max_long_polls = max_long_polls
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.calls = 0
+        self._long_polls = 0
+        self._batched = {}
+        self._poller = None
+        self._lock = threading.Lock()
+
+    def _get(self, path, timeout=30, **params):
+        with self._lock:
+            self.calls += 1
+        return apify_request(self.token, 'GET', path, self.api_base, timeout=timeout, params=params)
+
+    def status(self, run_id, wait=0):
+        """Run data, held by the API until the run finishes or wait seconds pass"""
+        return self._get(f"/actor-runs/{run_id}", timeout=wait + 30, waitForFinish=wait)['data']
+
+    def statuses(self, run_ids):
+        """Data of many runs from the newest page of the run list - usually one call for all of them"""
+        wanted = set(run_ids)
+        found = {}
+        page = self._get('/actor-runs', desc=1, limit=min(RUN_LIST_LIMIT, max(100, 2 * len(wanted))))['data']
+        for item in page['items']:
+            if item['id'] in wanted:
+                found[item['id']] = item
+                wanted.discard(item['id'])
+        for run_id in wanted:
+            # Pushed off the newest page (e.g. by other runs on the account) - ask for it directly
+            # rather than paging through the whole run history
+            found[run_id] = self.status(run_id)
+        return found
+
+    def wait(self, run_id, max_wait=DEFAULT_RUN_TIMEOUT):
+        """
+        Block until run_id finishes or max_wait seconds pass
+
+        Returns:
+            The run's last known data (check data['status']), or None if it was never read
+        """
+        with self._lock:
+            long_poll = self._long_polls < self.max_long_polls
+            if long_poll:
+                self._long_polls += 1
+        if not long_poll:
+            return self._wait_batched(run_id, max_wait)
+        try:
+            return self._long_poll(run_id, max_wait)
+        finally:
+            with self._lock:
+                self._long_polls -= 1
+
+    def _long_poll(self, run_id, max_wait):
+        deadline = time.monotonic() + max_wait
+        data = None
+        failures = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return data
+            try:
+                data = self.status(run_id, wait=max(1, min(LONG_POLL_SECONDS, int(remaining))))
+                failures = 0
+            except Exception as e:
+                failures += 1
+                print(f"⚠️  Status check for run {run_id} failed: {e}")
+                time.sleep(min(backoff_delay(failures), max(0, remaining)))
+                continue
+            if data['status'] in TERMINAL_STATUSES:
+                return data
+
+    def _wait_batched(self, run_id, max_wait):
+        entry = {'finished': threading.Event(), 'data': None}
+        with self._lock:
+            self._batched[run_id] = entry
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_batch, daemon=True)
+                self._poller.start()
+        entry['finished'].wait(max_wait)
+        with self._lock:
+            self._batched.pop(run_id, None)
+        return entry['data']
+
+    def _poll_batch(self):
+        """Check every batched run with one list call per tick until none are left"""
+        interval = self.min_interval
+        failures = 0
+        while True:
+            with self._lock:
+                if not self._batched:
+                    self._poller = None
+                    return
+                pending = dict(self._batched)
+            try:
+                found = self.statuses(pending)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                print(f"⚠️  Batched status check failed: {e}")
+                time.sleep(backoff_delay(failures))
+                continue
+
+            changed = False
+            for run_id, data in found.items():
+                entry = pending[run_id]
+                changed = changed or entry['data'] is None or entry['data']['status'] != data['status']
+                entry['data'] = data
+                if data['status'] in TERMINAL_STATUSES:
+                    entry['finished'].set()
+            # Tick fast while runs are starting or finishing, back off while they're all just running
+            interval = self.min_interval if changed else min(self.max_interval, interval * 1.5)
+            time.sleep(interval)
+
+    def wait_all(self, run_ids, max_wait=DEFAULT_RUN_TIMEOUT, on_finished=None):
+        """
+        Wait for several runs at once
+
+        Args:
+            on_finished: Called as on_finished(run_id, data) as each run finishes
+
+        Returns:
+            {run_id: last known data}
+        """
+        results = {}
+
+        def wait_one(run_id):
+            results[run_id] = self.wait(run_id, max_wait)
+            if on_finished is not None:
+                on_finished(run_id, results[run_id])
+
+        with ThreadPoolExecutor(max_workers=max(1, len(run_ids))) as executor:
+            list(executor.map(wait_one, run_ids))
+        return results
+
+def wait_for_run(token, run_id, max_wait=600, label="Run", api_base=None):
+    """Block until an actor run finishes, printing the outcome; True if it SUCCEEDED"""
+    print(f"⏳ Waiting for {label.lower()} to complete...")
+    data = RunWaiter(token, api_base).wait(run_id, max_wait)
+    status = data['status'] if data else None
+    if status == SUCCEEDED:
+        print(f"✅ {label} completed successfully!")
+        return True
+    if status in FAILED_STATUSES:
+        print(f"❌ {label} {status}")
+        return False
+    print(f"⏰ Timeout waiting for {label.lower()} to complete (status: {status})")
+    return False
+
+class ApifyRun:
+    """One actor run tracked by ApifyRunManager"""
+
+    def __init__(self, actor, run_input, label=None, on_dataset=None, jsonl_path=None):
+        self.actor = actor
+        self.run_input = run_input
+        self.label = label or actor
+        self.on_dataset = on_dataset
+        self.jsonl_path = jsonl_path
+        self.run_id = None
+        self.dataset_id = None
+        self.status = None
+        self.items = None
+        self.item_count = 0
+        self.error = None
+        self.seconds = None
+
+    @property
+    def streamed(self):
+        """True when the dataset goes to on_dataset / jsonl_path instead of being kept in items"""
+        return self.on_dataset is not None or self.jsonl_path is not None
+
+    @property
+    def succeeded(self):
+        return self.status == SUCCEEDED and self.error is None
+
+class ApifyRunManager:
+    """Starts actor runs concurrently and collects their datasets from one event loop"""
+
+    def __init__(self, token, max_runs=DEFAULT_MAX_RUNS, run_timeout=DEFAULT_RUN_TIMEOUT,
+                 api_base=None, waiter=None):
+        self.token = token
+        self.max_runs = max_runs
+        self.run_timeout = run_timeout
+        self.api_base = api_base
+        self.waiter = waiter or RunWaiter(token, api_base)
+        self.runs = []
+        self._executor = None
+
+    def add(self, actor, run_input, label=None, on_dataset=None, jsonl_path=None):
+        """
+        Queue a run of actor (e.g. 'apify~instagram-scraper')
+
+        Without on_dataset or jsonl_path the items are collected into run.items.
+
+        Args:
+            on_dataset: Called as on_dataset(run, items) on a worker thread as soon as this
+                        run finishes, while the other runs keep going. items is an iterator
+                        that downloads the dataset page by page as it is consumed.
+            jsonl_path: Save the dataset to this JSON lines file as it streams past
+        """
+        run = ApifyRun(actor, run_input, label, on_dataset, jsonl_path)
+        self.runs.append(run)
+        return run
+
+    async def _in_thread(self, function, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: function(*args, **kwargs))
+
+    async def _call(self, method, path, **kwargs):
+        return await self._in_thread(apify_request, self.token, method, path, self.api_base, **kwargs)
+
+    async def _start(self, run):
+        data = (await self._call('POST', f"/acts/{run.actor}/runs", json=run.run_input))['data']
+        run.run_id = data['id']
+        run.dataset_id = data['defaultDatasetId']
+        run.status = data['status']
+        print(f"🚀 {run.label}: run {run.run_id} started")
+
+    async def _wait(self, run):
+        data = await self._in_thread(self.waiter.wait, run.run_id, self.run_timeout)
+        if data:
+            run.status = data['status']
+        if run.status not in TERMINAL_STATUSES:
+            try:
+                # Don't leave a run burning compute units that nobody will collect
+                await self._call('POST', f"/actor-runs/{run.run_id}/abort")
+            except Exception as e:
+                print(f"⚠️  {run.label}: couldn't abort run {run.run_id}: {e}")
+            raise TimeoutError(f"run still {run.status} after {self.run_timeout}s - aborted")
+
+    async def _track(self, run, slots):
+        async with slots:
+            started = time.monotonic()
+            try:
+                await self._start(run)
+                await self._wait(run)
+                if run.status != SUCCEEDED:
+                    raise RuntimeError(f"run {run.status}")
+                if not run.streamed:
+                    # The caller asked for the items themselves (run_actor)
+                    run.items = await self._in_thread(lambda: list(self._dataset(run)))
+            except Exception as e:
+                run.error = str(e)
+                print(f"❌ {run.label}: {run.error}")
+            run.seconds = time.monotonic() - started
+
+        if run.error is not None:
+            return
+        if run.streamed:
+            try:
+                # Off the event loop, so reading one dataset doesn't hold up tracking the others
+                await self._in_thread(self._deliver, run)
+            except Exception as e:
+                run.error = f"{'on_dataset' if run.on_dataset is not None else 'saving the dataset'} failed: {e}"
+                print(f"❌ {run.label}: {run.error}")
+                return
+        print(f"✅ {run.label}: {run.item_count} items, run took {run.seconds:.0f}s")
+
+    def _dataset(self, run):
+        """The run's dataset items as they download, counted in run.item_count"""
+        for item in iter_dataset_items(self.token, dataset_id=run.dataset_id, api_base=self.api_base):
+            run.item_count += 1
+            yield item
+
+    def _deliver(self, run):
+        """Stream the dataset through the JSON lines file and into on_dataset"""
+        dataset = self._dataset(run)
+        items = iter(JsonlTee(dataset, run.jsonl_path)) if run.jsonl_path is not None else dataset
+        try:
+            if run.on_dataset is not None:
+                run.on_dataset(run, items)
+            else:
+                for _ in items:
+                    pass
+        finally:
+            # on_dataset may stop early (e.g. at already-ingested posts) - stop fetching pages too
+            items.close()
+            dataset.close()
+
+    async def run_async(self):
+        """Start every queued run (at most max_runs at a time) and wait for all of them"""
+        slots = asyncio.Semaphore(self.max_runs)
+        # Waiting runs each hold a thread, so size the pool for all of them plus the other calls
+        with ThreadPoolExecutor(max_workers=2 * self.max_runs + 4) as self._executor:
+            await asyncio.gather(*(self._track(run, slots) for run in self.runs if run.status is None))
+        return self.runs
+
+    def run(self):
+        """Blocking run_async() for synchronous scripts"""
+        return asyncio.run(self.run_async())
+
+    def print_summary(self):
+        succeeded = sum(1 for run in self.runs if run.succeeded)
+        slowest = max((run.seconds or 0 for run in self.runs), default=0)
+        print(f"🏁 Apify: {succeeded}/{len(self.runs)} runs succeeded "
+              f"({self.max_runs} at a time, slowest {slowest:.0f}s, {self.waiter.calls} status calls)")
+
+def run_actor(token, actor, run_input, label=None, **manager_options):
+    """Run one actor through the async runs endpoint; returns its dataset items or None"""
+    manager = ApifyRunManager(token, **manager_options)
+    run = manager.add(actor, run_input, label)
+    manager.run()
+    return run.items if run.succeeded else None
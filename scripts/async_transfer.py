@@ -0,0 +1,167 @@
+"""
+asyncio transfer engine for CDN → S3 migrations.
+
+Alternative to the ThreadPoolExecutor path: one event loop drives hundreds
+of downloads (aiohttp) and uploads (aiobotocore) at once, bounded by a
+semaphore instead of a fixed thread count. Videos are the exception: they are
+streamed into multipart uploads on worker threads rather than read into memory.
+
+Requires: pip install aiohttp aiobotocore
+"""
+
+import asyncio
+from s3_transfer import stream_to_s3, content_type_for_key, DEFAULT_HEADERS
+from migration_manifest import STATUS_DONE, STATUS_FAILED
+from transfer_metrics import measure, error_status
+from adaptive_scheduler import async_scheduler_slot, is_retryable_status, backoff_delay
+
+DEFAULT_CONCURRENCY = 200
+
+def check_engine(engine, **features):
+    """
+    Raise ValueError when engine is 'async' and a feature only the threads engine has is on
+
+    Args:
+        features: e.g. dedup=True, derivatives=None - the truthy ones are the features in use
+    """
+    enabled = [name for name, value in features.items() if value]
+    if engine == 'async' and enabled:
+        raise ValueError(f"The async engine doesn't support {', '.join(enabled)}; use the threads engine")
+
+async def _download(http, url, max_retries, metrics, scheduler=None):
+    """Download url, retrying transient failures with jittered backoff; returns bytes or None"""
+    with measure(metrics, 'download', url) as event:
+        for attempt in range(max_retries):
+            event.retries = attempt
+            try:
+                async with async_scheduler_slot(scheduler, url) as slot:
+                    async with http.get(url) as response:
+                        slot.status = event.status = response.status
+                        if response.status == 200:
+                            data = await response.read()
+                            event.size, event.ok = len(data), True
+                            return data
+                # 404/403 won't fix themselves - only retry throttling and server errors
+                if not is_retryable_status(response.status) or attempt == max_retries - 1:
+                    print(f"❌ Failed to download {url}: Status {response.status}")
+                    return None
+            except Exception as e:
+                if attempt == max_retries - 1:
+                    print(f"❌ Error downloading {url}: {e}")
+                    return None
+            await asyncio.sleep(backoff_delay(attempt))
+        return None
+
+async def _stream_video(video_client, url, bucket_name, s3_key, region, manifest, metrics):
+    """Stream one video into a multipart upload on a worker thread"""
+    size = await asyncio.to_thread(stream_to_s3, url, video_client, bucket_name, s3_key, metrics=metrics)
+    if manifest is not None:
+        manifest.record(s3_key, url, s3_key if size is not None else None, size,
+                        STATUS_DONE if size is not None else STATUS_FAILED)
+    if size is None:
+        return None, None
+    return url, f"https://{bucket_name}.s3.{region}.amazonaws.com/{s3_key}"
+
+async def _transfer(http, s3_client, semaphore, url, bucket_name, s3_key, region, max_retries, manifest,
+                    should_stop, deferred, metrics, video_client, scheduler):
+    """Download one image and upload it to S3 while holding a concurrency slot"""
+    async with semaphore:
+        if should_stop is not None and should_stop():
+            deferred.append((url, s3_key))
+            return None
+        if s3_key.endswith('.mp4'):
+            return await _stream_video(video_client, url, bucket_name, s3_key, region, manifest, metrics)
+        image_data = await _download(http, url, max_retries, metrics, scheduler)
+        if not image_data:
+            if manifest is not None:
+                manifest.record(s3_key, url, None, None, STATUS_FAILED)
+            return None, None
+
+        try:
+            with measure(metrics, 'upload', s3_key) as event:
+                event.size = len(image_data)
+                try:
+                    async with async_scheduler_slot(scheduler, 's3'):
+                        response = await s3_client.put_object(
+                            Bucket=bucket_name,
+                            Key=s3_key,
+                            Body=image_data,
+                            ContentType=content_type_for_key(s3_key),
+                            CacheControl='public, max-age=31536000'
+                        )
+                except Exception as e:
+                    # Set before measure() records the failed event
+                    event.status = error_status(e)
+                    raise
+                event.status, event.ok = 200, True
+                event.retries = response['ResponseMetadata'].get('RetryAttempts', 0)
+        except Exception as e:
+            print(f"❌ Error uploading to S3 {s3_key}: {e}")
+            if manifest is not None:
+                manifest.record(s3_key, url, None, None, STATUS_FAILED)
+            return None, None
+
+    if manifest is not None:
+        manifest.record(s3_key, url, s3_key, len(image_data), STATUS_DONE)
+    return url, f"https://{bucket_name}.s3.{region}.amazonaws.com/{s3_key}"
+
+async def _run(tasks, bucket_name, region, concurrency, max_retries, on_complete, manifest, should_stop, deferred,
+               metrics, scheduler):
+    import aiohttp
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session as get_aio_session
+
+    semaphore = asyncio.BoundedSemaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=30)
+    s3_config = AioConfig(max_pool_connections=concurrency)
+
+    video_client = None
+    if any(s3_key.endswith('.mp4') for _, s3_key in tasks):
+        import boto3
+        video_client = boto3.client('s3', region_name=region)
+
+    results = []
+    async with aiohttp.ClientSession(connector=connector, headers=DEFAULT_HEADERS, timeout=timeout) as http:
+        async with get_aio_session().create_client('s3', region_name=region, config=s3_config) as s3_client:
+            coros = [
+                _transfer(http, s3_client, semaphore, url, bucket_name, s3_key, region, max_retries, manifest,
+                          should_stop, deferred, metrics, video_client, scheduler)
+                for url, s3_key in tasks
+            ]
+            for next_done in asyncio.as_completed(coros):
+                result = await next_done
+                if result is None:
+                    continue
+                results.append(result)
+                if on_complete:
+                    on_complete(result)
+    return results
+
+def run_async_transfers(tasks, bucket_name, region, concurrency=DEFAULT_CONCURRENCY, max_retries=3, on_complete=None,
+                        manifest=None, should_stop=None, deferred=None, metrics=None, scheduler=None):
+    """
+    Run (url, s3_key) transfers on an asyncio event loop
+
+    Args:
+        tasks: List of (source_url, s3_key) pairs
+        concurrency: Maximum transfers in flight at once
+        on_complete: Optional callback invoked with each (old_url, new_url) result
+        manifest: Optional MigrationManifest to record each outcome in
+        should_stop: Optional callable; once it returns True, transfers are no longer started
+        deferred: List collecting the (url, s3_key) pairs skipped because of should_stop
+        metrics: Optional TransferMetrics recording each download and upload
+        scheduler: Optional TransferScheduler whose per-host limits apply on top of concurrency
+
+    Returns:
+        List of (old_url, new_url) tuples in completion order, (None, None) for failures -
+        the same shape process_image returns on the thread path
+    """
+    try:
+        import aiohttp  # noqa: F401
+        import aiobotocore  # noqa: F401
+    except ImportError:
+        raise RuntimeError("The async engine needs aiohttp and aiobotocore: pip install aiohttp aiobotocore")
+
+    return asyncio.run(_run(tasks, bucket_name, region, concurrency, max_retries, on_complete, manifest,
+                            should_stop, deferred, metrics, scheduler))
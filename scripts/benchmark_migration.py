@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for migrate_instagram_to_s3.
+
+Runs the real migration code against two local stand-ins instead of
+Instagram and AWS:
+
+- a fake CDN serving synthetic images of a configurable size and latency
+- a minimal S3-compatible endpoint that accepts PutObject and multipart
+  uploads and discards the bytes, so the numbers measure our transfer path
+  rather than a storage emulator
+
+The fixture mirrors instagram_data.json: the same posts, with every media URL
+(duplicates included) pointed at the fake CDN. Each mode x concurrency case
+runs in a fresh subprocess so peak RSS is per case. Results are appended to
+a JSON lines file tagged with the git commit, and --compare prints the change
+against an earlier commit.
+
+Example:
+    python scripts/benchmark_migration.py --modes threads,stream,async --concurrency 4,16,64
+    python scripts/benchmark_migration.py --compare            # vs. the previous commit in the results
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_FIXTURE = 'viewer/public/instagram_data.json'
+DEFAULT_RESULTS_PATH = 'benchmark_results.jsonl'
+MODES = ('threads', 'stream', 'async', 'dedup')
+BENCH_BUCKET = 'benchmark-bucket'
+BODY_CHUNK = 64 * 1024
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+class FakeCDNHandler(BaseHTTPRequestHandler):
+    """GET /img/<n>.jpg -> image_size bytes after latency seconds, unique per n"""
+    protocol_version = 'HTTP/1.1'
+    image_size = 200 * 1024
+    latency = 0.02
+    payload = b''
+    bytes_served = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        # Distinct prefix per URL so dedup mode sees distinct images
+        prefix = urlparse(self.path).path.encode('utf-8').ljust(64, b'\0')[:64]
+        body_size = max(self.image_size, len(prefix))
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(body_size))
+        self.end_headers()
+        self.wfile.write(prefix)
+        remaining = body_size - len(prefix)
+        while remaining > 0:
+            chunk = self.payload[:min(remaining, len(self.payload))]
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+        with FakeCDNHandler.lock:
+            FakeCDNHandler.bytes_served += body_size
+
+    def log_message(self, *args):
+        pass
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    """Just enough of the S3 REST API for put_object and multipart uploads; bodies are discarded"""
+    protocol_version = 'HTTP/1.1'
+    objects = 0
+    bytes_received = 0
+    lock = threading.Lock()
+
+    def _drain_body(self):
+        """Read and discard the request body, returning its size"""
+        size = 0
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                chunk_size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                if chunk_size == 0:
+                    self.rfile.readline()
+                    break
+                self.rfile.read(chunk_size + 2)
+                size += chunk_size
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining > 0:
+                remaining -= len(self.rfile.read(min(remaining, BODY_CHUNK)))
+            size = int(self.headers.get('Content-Length', 0))
+        # aws-chunked bodies carry framing; the decoded size is sent alongside
+        return int(self.headers.get('x-amz-decoded-content-length', size))
+
+    def _reply(self, status=200, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        size = self._drain_body()
+        query = parse_qs(urlparse(self.path).query)
+        with FakeS3Handler.lock:
+            FakeS3Handler.bytes_received += size
+            if 'uploadId' not in query:
+                FakeS3Handler.objects += 1
+        self._reply(headers={'ETag': f'"{uuid.uuid4().hex}"'})
+
+    def do_POST(self):
+        self._drain_body()
+        query = parse_qs(urlparse(self.path).query, keep_blank_values=True)
+        if 'uploads' in query:
+            body = (f'<InitiateMultipartUploadResult><Bucket>{BENCH_BUCKET}</Bucket><Key>k</Key>'
+                    f'<UploadId>{uuid.uuid4().hex}</UploadId></InitiateMultipartUploadResult>')
+        else:
+            with FakeS3Handler.lock:
+                FakeS3Handler.objects += 1
+            body = (f'<CompleteMultipartUploadResult><Bucket>{BENCH_BUCKET}</Bucket><Key>k</Key>'
+                    f'<ETag>"{uuid.uuid4().hex}"</ETag></CompleteMultipartUploadResult>')
+        self._reply(body=body.encode('utf-8'), headers={'Content-Type': 'application/xml'})
+
+    def do_DELETE(self):
+        self._reply(204)
+
+    def do_GET(self):
+        if 'list-type' in urlparse(self.path).query:
+            body = (f'<ListBucketResult><Name>{BENCH_BUCKET}</Name><KeyCount>0</KeyCount>'
+                    f'<IsTruncated>false</IsTruncated></ListBucketResult>')
+            self._reply(body=body.encode('utf-8'), headers={'Content-Type': 'application/xml'})
+            return
+        body = b'<Error><Code>NoSuchKey</Code><Message>Not found</Message></Error>'
+        self._reply(404, body, {'Content-Type': 'application/xml'})
+
+    def do_HEAD(self):
+        self._reply(404)
+
+    def log_message(self, *args):
+        pass
+
+def start_server(handler):
+    server = _Server(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def build_fixture(source_path, cdn_base, output_path, scale=1):
+    """
+    Copy the posts in source_path with every media URL pointed at the fake CDN
+
+    Returns:
+        (number of media tasks, number of distinct media URLs)
+    """
+    from task_planner import post_media
+
+    with open(source_path, 'r', encoding='utf-8') as f:
+        source_posts = json.load(f)
+
+    fake_urls = {}
+    def fake_url(url):
+        if url not in fake_urls:
+            fake_urls[url] = f"{cdn_base}/img/{len(fake_urls):06d}.jpg"
+        return fake_urls[url]
+
+    posts = []
+    tasks = 0
+    for copy in range(scale):
+        for post in source_posts:
+            # Deep copy: post_media rewrites nested containers (childPosts, latestComments) in place
+            post = json.loads(json.dumps(post))
+            post['id'] = f"{post['id']}-{copy}"
+            # The same fields the migration transfers, so nothing reaches the live CDN
+            for container, field, _ in post_media(post, post['id']):
+                container[field] = fake_url(f"{copy}:{container[field]}")
+                tasks += 1
+            posts.append(post)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(posts, f)
+    return tasks, len(fake_urls)
+
+def git_commit():
+    """Short HEAD commit, with -dirty when tracked files have uncommitted changes"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run_case_worker(case):
+    """Child process: run one migration against the stand-ins and print the result as JSON"""
+    os.environ.update({
+        'AWS_ENDPOINT_URL': case['s3_endpoint'],
+        'AWS_ACCESS_KEY_ID': 'benchmark',
+        'AWS_SECRET_ACCESS_KEY': 'benchmark',
+        # Plain Content-Length bodies; the stand-in doesn't verify checksums anyway
+        'AWS_REQUEST_CHECKSUM_CALCULATION': 'when_required',
+    })
+    import resource
+    from migrate_to_s3 import migrate_instagram_to_s3
+
+    mode = case['mode']
+    metrics_path = os.path.join(case['work_dir'], f"metrics-{uuid.uuid4().hex}.jsonl")
+
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        migrate_instagram_to_s3(
+            case['fixture'], BENCH_BUCKET, 'benchmark',
+            max_workers=case['concurrency'], concurrency=case['concurrency'],
+            stream=mode == 'stream', engine='async' if mode == 'async' else 'threads',
+            dedup=mode == 'dedup', hash_index_path=os.path.join(case['work_dir'], f"index-{uuid.uuid4().hex}.json"),
+            metrics_path=metrics_path
+        )
+    elapsed = time.perf_counter() - started
+
+    with open(metrics_path, 'r', encoding='utf-8') as f:
+        stages = json.loads(f.readlines()[-1])['stages']
+    first_stage = stages.get('stream') or stages.get('download') or {}
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+    print(json.dumps({
+        'elapsed_s': round(elapsed, 3),
+        'failed': sum(stage['failed'] for stage in stages.values()),
+        'fetch_p50_ms': first_stage.get('p50_ms'),
+        'fetch_p95_ms': first_stage.get('p95_ms'),
+        'peak_rss_mb': round(peak_rss_mb, 1)
+    }))
+
+def run_case(case):
+    """Run one case in a subprocess and combine its timings with the stand-ins' counters"""
+    FakeCDNHandler.bytes_served = 0
+    FakeS3Handler.objects = 0
+    FakeS3Handler.bytes_received = 0
+
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', json.dumps(case)],
+                               capture_output=True, text=True, cwd=case['work_dir'])
+    if completed.returncode != 0:
+        print(f"❌ {case['mode']} x {case['concurrency']} failed:\n{completed.stderr[-2000:]}")
+        return None
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    elapsed = result['elapsed_s']
+    result.update({
+        'objects_per_s': round(case['images'] / elapsed, 1),
+        'mb_per_s': round(FakeCDNHandler.bytes_served / (1024 * 1024) / elapsed, 2),
+        'objects_stored': FakeS3Handler.objects,
+        'mb_stored': round(FakeS3Handler.bytes_received / (1024 * 1024), 2)
+    })
+    return result
+
+def case_key(record):
+    case = record['case']
+    return (case['mode'], case['concurrency'], case['image_kb'], case['latency_ms'], case['images'])
+
+def load_results(results_path):
+    if not os.path.exists(results_path):
+        return []
+    with open(results_path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def print_comparison(records, history, baseline):
+    """Print objects/s and peak RSS of records against the latest matching runs of the baseline commit"""
+    current_commit = records[0]['commit'] if records else None
+    candidates = [record for record in history if record['commit'] != current_commit]
+    if baseline == 'previous':
+        if not candidates:
+            print("No earlier commit in the results to compare against")
+            return
+        baseline = candidates[-1]['commit']
+    by_key = {case_key(record): record for record in candidates if record['commit'].startswith(baseline)}
+
+    print(f"\n📊 Compared with {baseline}:")
+    for record in records:
+        before = by_key.get(case_key(record))
+        label = f"{record['case']['mode']:>8} x {record['case']['concurrency']:<4}"
+        if before is None:
+            print(f"   {label} no matching run")
+            continue
+        speed = (record['result']['objects_per_s'] / before['result']['objects_per_s'] - 1) * 100
+        rss = record['result']['peak_rss_mb'] - before['result']['peak_rss_mb']
+        flag = ' ⚠️' if speed < -10 else ''
+        print(f"   {label} {before['result']['objects_per_s']:>8} → {record['result']['objects_per_s']:>8} objects/s "
+              f"({speed:+.1f}%), peak RSS {rss:+.1f} MB{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the S3 migration path against a local fake CDN and S3")
+    parser.add_argument('--fixture', default=DEFAULT_FIXTURE,
+                        help=f"Posts JSON whose image URLs are replayed (default: {DEFAULT_FIXTURE})")
+    parser.add_argument('--scale', type=int, default=1, help="Repeat the fixture posts N times (default: 1)")
+    parser.add_argument('--modes', default='threads,stream,async',
+                        help=f"Comma-separated modes out of {', '.join(MODES)} (default: threads,stream,async)")
+    parser.add_argument('--concurrency', default='4,16,64',
+                        help="Comma-separated worker counts / async in-flight limits to sweep (default: 4,16,64)")
+    parser.add_argument('--image-kb', type=int, default=200, help="Size of each synthetic image (default: 200)")
+    parser.add_argument('--latency-ms', type=int, default=20, help="Fake CDN time to first byte (default: 20)")
+    parser.add_argument('--results', default=DEFAULT_RESULTS_PATH,
+                        help=f"JSON lines file the results are appended to (default: {DEFAULT_RESULTS_PATH})")
+    parser.add_argument('--compare', nargs='?', const='previous', default=None, metavar='COMMIT',
+                        help="Compare with the runs of COMMIT in the results file (default: the previous commit)")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_case_worker(json.loads(args.worker))
+        return
+
+    modes = [mode for mode in args.modes.split(',') if mode]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"Unknown mode(s): {', '.join(unknown)}")
+    if 'async' in modes:
+        try:
+            import aiohttp  # noqa: F401
+            import aiobotocore  # noqa: F401
+        except ImportError:
+            print("⚠️  Skipping async mode: pip install aiohttp aiobotocore")
+            modes.remove('async')
+
+    FakeCDNHandler.image_size = args.image_kb * 1024
+    FakeCDNHandler.latency = args.latency_ms / 1000
+    FakeCDNHandler.payload = random.Random(0).randbytes(BODY_CHUNK)
+    cdn = start_server(FakeCDNHandler)
+    s3 = start_server(FakeS3Handler)
+
+    commit = git_commit()
+    records = []
+    with tempfile.TemporaryDirectory(prefix='migration-bench-') as work_dir:
+        fixture = os.path.join(work_dir, 'fixture.json')
+        images, unique = build_fixture(args.fixture, f"http://127.0.0.1:{cdn.server_port}", fixture, args.scale)
+        print(f"🏁 {images} media files ({unique} distinct) of {args.image_kb} KB, {args.latency_ms} ms CDN latency, "
+              f"commit {commit}")
+
+        for mode in modes:
+            for concurrency in [int(value) for value in args.concurrency.split(',') if value]:
+                case = {'mode': mode, 'concurrency': concurrency, 'image_kb': args.image_kb,
+                        'latency_ms': args.latency_ms, 'images': images, 'fixture': fixture,
+                        'work_dir': work_dir, 's3_endpoint': f"http://127.0.0.1:{s3.server_port}"}
+                result = run_case(case)
+                if result is None:
+                    continue
+                print(f"   {mode:>8} x {concurrency:<4} {result['objects_per_s']:>8} objects/s "
+                      f"{result['mb_per_s']:>8} MB/s  p95 {result['fetch_p95_ms']} ms  "
+                      f"peak RSS {result['peak_rss_mb']} MB  {result['failed']} failed")
+                case = {name: case[name] for name in ('mode', 'concurrency', 'image_kb', 'latency_ms', 'images')}
+                records.append({'commit': commit, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                                'case': case, 'result': result})
+
+    history = load_results(args.results)
+    with open(args.results, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    print(f"💾 {len(records)} results appended to {args.results}")
+
+    if args.compare:
+        print_comparison(records, history, args.compare)
+
+    cdn.shutdown()
+    s3.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Content-addressed image storage for the S3 migrations.
+
+Images are keyed by the SHA-256 of their bytes:
+
+    {model_name}/images/ab/ab12...ef.jpg
+
+A hash index (local JSON file or s3://bucket/key) remembers which digests
+are already in the bucket, so the same picture reached through another post,
+a carousel duplicate or yesterday's run is uploaded once and then only
+referenced. It also remembers which derivatives (thumb.webp, ...) were
+uploaded next to each object, so a hit only renders the ones still missing.
+"""
+
+import hashlib
+import io
+import tempfile
+import threading
+import time
+from http_pool import get_session
+from adaptive_scheduler import scheduler_slot, backoff_delay
+from transfer_metrics import measure
+from s3_transfer import content_type_for_key, load_json, save_json, is_retryable_error, CHUNK_SIZE, DEFAULT_HEADERS
+
+DEFAULT_INDEX_PATH = 's3_hash_index.json'
+
+def content_key(model_name, digest, ext):
+    """S3 key for an object with the given SHA-256 hex digest"""
+    return f"{model_name}/images/{digest[:2]}/{digest}{ext}"
+
+class HashIndex:
+    """Thread-safe digest → S3 key index with in-flight upload coordination"""
+
+    def __init__(self, location, s3_client=None):
+        self.location = location
+        self.s3_client = s3_client
+        data = load_json(location, s3_client, default={})
+        if 'objects' in data:
+            self.entries = data['objects']
+            self.derived = data.get('derivatives', {})
+        else:
+            # Indexes written before derivatives were tracked are a flat digest -> key map
+            self.entries, self.derived = data, {}
+        self.uploads = 0
+        self.hits = 0
+        self.bytes_skipped = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def claim(self, digest, key):
+        """
+        Claim the upload of digest under key
+
+        Returns:
+            (key, True) if the caller must upload, or (existing_key, False) if
+            the bytes are already stored (or were stored by a concurrent worker)
+        """
+        while True:
+            with self._lock:
+                if digest in self.entries:
+                    self.hits += 1
+                    return self.entries[digest], False
+                pending = self._pending.get(digest)
+                if pending is None:
+                    self._pending[digest] = threading.Event()
+                    return key, True
+            # Another worker is uploading the same bytes - wait, then re-check.
+            # If that upload failed the loop lets this worker claim it instead.
+            pending.wait()
+
+    def complete(self, digest, key, success):
+        """Record the outcome of a claimed upload and wake any waiters"""
+        with self._lock:
+            if success:
+                self.entries[digest] = key
+                self.uploads += 1
+            self._pending.pop(digest).set()
+
+    def has_derivatives(self, digest, names):
+        """True if every derivative in names ('thumb.webp', ...) was uploaded next to digest's object"""
+        with self._lock:
+            return set(names) <= set(self.derived.get(digest, ()))
+
+    def add_derivatives(self, digest, names):
+        with self._lock:
+            self.derived[digest] = sorted(set(self.derived.get(digest, ())) | set(names))
+
+    def merge(self, entries, derived=None):
+        """Add digests another index stored (e.g. a shard's) without counting them as uploads here"""
+        with self._lock:
+            self.entries.update(entries)
+            for digest, names in (derived or {}).items():
+                self.derived[digest] = sorted(set(self.derived.get(digest, ())) | set(names))
+
+    def add_skipped_bytes(self, size):
+        with self._lock:
+            self.bytes_skipped += size
+
+    def save(self):
+        with self._lock:
+            data = {'objects': dict(self.entries), 'derivatives': dict(self.derived)}
+        save_json(self.location, data, self.s3_client)
+
+    def print_stats(self):
+        print(f"♻️  Dedup: {self.uploads} new uploads, {self.hits} references to existing objects "
+              f"({self.bytes_skipped / (1024 * 1024):.1f} MB not re-uploaded), "
+              f"{len(self.entries)} objects indexed")
+
+def _spool_download(url, spool_size, max_retries=3, scheduler=None, metrics=None):
+    """
+    Download url into a SpooledTemporaryFile while hashing it
+
+    Memory is bounded by spool_size; larger objects spill to disk.
+
+    Returns:
+        (file, sha256_hex, size) or (None, None, 0) on failure
+    """
+    with measure(metrics, 'download', url) as event:
+        for attempt in range(max_retries):
+            event.retries = attempt
+            spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+            digest = hashlib.sha256()
+            size = 0
+            try:
+                with scheduler_slot(scheduler, url) as slot, \
+                        get_session().get(url, headers=DEFAULT_HEADERS, timeout=30, stream=True) as response:
+                    slot.status = event.status = response.status_code
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        spool.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                spool.seek(0)
+                event.size, event.ok = size, True
+                return spool, digest.hexdigest(), size
+            except Exception as e:
+                spool.close()
+                if attempt == max_retries - 1 or not is_retryable_error(e):
+                    print(f"❌ Error downloading {url}: {e}")
+                    return None, None, 0
+            time.sleep(backoff_delay(attempt))
+        return None, None, 0
+
+def dedup_transfer(url, s3_client, bucket_name, model_name, ext, index, part_size, scheduler=None,
+                   derivatives=None, region=None, metrics=None, mirrors=None, mirror_key=None, validator=None):
+    """
+    Download url and store it content-addressed, uploading only unseen bytes
+
+    With a DerivativeBuilder, derivatives are rendered next to newly uploaded
+    objects. For objects already stored they are only described when the index
+    has them recorded, and rendered and uploaded otherwise.
+    With a MirrorSet, the bytes are also written to every mirror under mirror_key
+    (the per-post key), whether or not the bucket already had them.
+    With an ImageValidator, bytes that don't decode are rejected before they are
+    indexed, and what is stored is the validated (possibly re-compressed) image.
+
+    Returns:
+        (s3_key holding the bytes, size) or (None, 0) on failure
+    """
+    from boto3.s3.transfer import TransferConfig
+
+    spool, digest, size = _spool_download(url, part_size, scheduler=scheduler, metrics=metrics)
+    if spool is None:
+        return None, 0
+
+    content_type = None
+    if validator is not None:
+        with spool:
+            checked = validator.check(url, spool.read(), content_type_for_key(ext))
+        if checked is None:
+            return None, 0
+        # The digest stays the one of the downloaded bytes, so the same download maps to the same object
+        image_bytes, content_type = checked
+        spool, size = io.BytesIO(image_bytes), len(image_bytes)
+
+    with spool:
+        key, must_upload = index.claim(digest, content_key(model_name, digest, ext))
+        # upload_fileobj closes the spool, so keep the bytes the derivatives and mirrors need
+        if validator is None:
+            image_bytes = None
+            if derivatives is not None or mirrors is not None:
+                image_bytes = spool.read()
+                spool.seek(0)
+
+        if not must_upload:
+            index.add_skipped_bytes(size)
+            if derivatives is not None:
+                render = not index.has_derivatives(digest, derivatives.names)
+                info = derivatives.process(url, image_bytes, s3_client, bucket_name, key, region, scheduler,
+                                           upload=render)
+                if render and info is not None:
+                    index.add_derivatives(digest, derivatives.names)
+            if mirrors is not None:
+                mirrors.put(mirror_key or key, image_bytes, scheduler, content_type)
+            return key, size
+
+        success = False
+        try:
+            with measure(metrics, 'upload', key) as event, scheduler_slot(scheduler, 's3'):
+                event.size = size
+                s3_client.upload_fileobj(
+                    spool, bucket_name, key,
+                    ExtraArgs={
+                        'ContentType': content_type or content_type_for_key(key),
+                        'CacheControl': 'public, max-age=31536000'
+                    },
+                    Config=TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                                          use_threads=False)
+                )
+                event.status, event.ok = 200, True
+            success = True
+            # Before complete(), so workers waiting on this digest find its derivatives indexed
+            if derivatives is not None and derivatives.process(url, image_bytes, s3_client, bucket_name, key,
+                                                               region, scheduler) is not None:
+                index.add_derivatives(digest, derivatives.names)
+        except Exception as e:
+            print(f"❌ Error uploading to S3 {key}: {e}")
+        finally:
+            index.complete(digest, key, success)
+
+    if success and mirrors is not None:
+        mirrors.put(mirror_key or key, image_bytes, scheduler, content_type)
+
+    return (key, size) if success else (None, 0)
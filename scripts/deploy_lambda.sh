@@ -1,11 +1,24 @@
 #!/bin/bash
 # Deploy Lambda function for automated Instagram scraping
+#
+# Usage: ./deploy_lambda.sh [--slim]
+#   --slim  Smaller package for faster cold starts: Linux wheels for the runtime only, no
+#           test suites or type stubs, boto3 left to the runtime, and bytecode precompiled
+#           when the local python3 matches the runtime (/var/task is read-only, so Lambda
+#           otherwise recompiles every module on each cold start)
 
 set -e
 
 FUNCTION_NAME="instagram-scraper-daily"
 REGION="us-east-2"
 ROLE_NAME="instagram-scraper-lambda-role"
+RUNTIME="python3.12"
+SLIM=false
+if [ "$1" = "--slim" ]; then
+    SLIM=true
+fi
+# Shared helper modules imported by the Lambda function
+LAMBDA_MODULES="s3_transfer.py http_pool.py async_transfer.py content_store.py migration_manifest.py adaptive_scheduler.py transfer_pipeline.py derivatives.py image_validation.py sharded_output.py transfer_metrics.py task_planner.py storage_backends.py shard_dispatch.py scrape_state.py apify_runs.py"
 
 echo "🚀 Deploying Lambda function for automated Instagram scraping"
 
@@ -16,18 +29,40 @@ cd lambda_package
 
 # Copy Lambda function
 cp ../lambda_scrape_migrate.py lambda_function.py
+for module in $LAMBDA_MODULES; do
+    cp ../$module .
+done
 
 # Install dependencies
 echo "📥 Installing Python dependencies..."
-pip install -r ../lambda_requirements.txt -t .
+if [ "$SLIM" = true ]; then
+    pip install -r ../lambda_requirements.txt -t . --no-compile \
+        --platform manylinux2014_x86_64 --implementation cp --python-version "${RUNTIME#python}" \
+        --only-binary=:all:
+
+    echo "✂️  Trimming package..."
+    # The runtime already provides boto3
+    rm -rf boto3 boto3-* botocore botocore-* s3transfer s3transfer-*
+    find . -type d -name tests -prune -exec rm -rf {} +
+    find . -name '*.pyi' -delete
+
+    if [ "$(python3 -c 'import sys; print(f"python{sys.version_info[0]}.{sys.version_info[1]}")')" = "$RUNTIME" ]; then
+        echo "⚙️  Precompiling bytecode for $RUNTIME..."
+        python3 -m compileall -q -j 0 --invalidation-mode unchecked-hash .
+    else
+        echo "⚠️  Local python3 isn't $RUNTIME - skipping bytecode precompilation"
+    fi
+else
+    pip install -r ../lambda_requirements.txt -t .
+fi
 
 # Create deployment package
 echo "📦 Creating ZIP package..."
-zip -r ../lambda_deployment.zip . -q
+zip -r -9 ../lambda_deployment.zip . -q
 
 cd ..
 
-echo "✅ Deployment package created: lambda_deployment.zip"
+echo "✅ Deployment package created: lambda_deployment.zip ($(du -h lambda_deployment.zip | cut -f1))"
 
 # Check if Lambda function exists
 if aws lambda get-function --function-name $FUNCTION_NAME --region $REGION 2>/dev/null; then
@@ -49,7 +84,7 @@ else
 
     aws lambda create-function \
         --function-name $FUNCTION_NAME \
-        --runtime python3.12 \
+        --runtime $RUNTIME \
         --role $ROLE_ARN \
         --handler lambda_function.lambda_handler \
         --zip-file fileb://lambda_deployment.zip \
@@ -0,0 +1,193 @@
+"""
+Resized WebP/AVIF derivatives for the viewer, generated during migration.
+
+While an image is in flight its bytes are handed to a process pool that
+renders a grid thumbnail and a modal-size copy. The copies are uploaded next
+to the original:
+
+    madison-morgan/posts/<post_id>/image_000.jpg
+    madison-morgan/posts/<post_id>/image_000.thumb.webp
+    madison-morgan/posts/<post_id>/image_000.medium.webp
+
+The URLs and dimensions are recorded per source URL and written into the
+output JSON (displayVariants / imageVariants), so the grid can load a few KB
+per tile instead of the full-resolution original.
+
+Requires: pip install Pillow (AVIF needs Pillow 11.3+ or pillow-avif-plugin)
+"""
+
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from adaptive_scheduler import scheduler_slot
+from s3_transfer import content_type_for_key
+
+# Longest edge in pixels - originals smaller than this are never upscaled
+DERIVATIVE_SPECS = {
+    'thumb': {'max_size': 480, 'quality': 75},
+    'medium': {'max_size': 1080, 'quality': 82},
+}
+DEFAULT_FORMATS = ('webp',)
+
+def derivative_size(width, height, max_size):
+    """Dimensions of a derivative that fits inside max_size x max_size"""
+    scale = min(1.0, max_size / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def derivative_key(stored_key, name, fmt):
+    """image_000.jpg -> image_000.thumb.webp"""
+    return f"{os.path.splitext(stored_key)[0]}.{name}.{fmt}"
+
+def render_derivatives(image_bytes, specs, formats):
+    """
+    Decode image_bytes and encode every spec x format (runs in a worker process)
+
+    Returns:
+        (width, height, [(name, fmt, data, width, height), ...])
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        image = ImageOps.exif_transpose(source)
+        width, height = image.size
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+
+        rendered = []
+        for name, spec in specs.items():
+            size = derivative_size(width, height, spec['max_size'])
+            resized = image.resize(size, Image.LANCZOS) if size != (width, height) else image
+            for fmt in formats:
+                buffer = io.BytesIO()
+                resized.save(buffer, fmt.upper(), quality=spec['quality'])
+                rendered.append((name, fmt, buffer.getvalue(), size[0], size[1]))
+    return width, height, rendered
+
+def _image_size(image_bytes):
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        return ImageOps.exif_transpose(source).size
+
+class DerivativeBuilder:
+    """Process pool that renders derivatives, plus the URL -> variants record for the output JSON"""
+
+    def __init__(self, formats=DEFAULT_FORMATS, specs=None, max_workers=None):
+        try:
+            from PIL import features
+        except ImportError:
+            raise RuntimeError("Derivatives need Pillow: pip install Pillow")
+        for fmt in formats:
+            if not features.check(fmt):
+                raise RuntimeError(f"This Pillow build can't encode {fmt.upper()}")
+
+        self.formats = tuple(formats)
+        self.specs = specs or DERIVATIVE_SPECS
+        self.variants = {}
+        self.rendered = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        try:
+            # spawn, not fork: the parent is full of threads holding locks
+            self._executor = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        except (OSError, NotImplementedError) as e:
+            # e.g. AWS Lambda has no /dev/shm for process pool semaphores
+            print(f"⚠️  No process pool ({e}); rendering derivatives on the transfer threads")
+            self._executor = None
+
+    @property
+    def names(self):
+        """Suffixes of the derivatives rendered for every image: ['thumb.webp', 'medium.webp', ...]"""
+        return [f"{name}.{fmt}" for name in self.specs for fmt in self.formats]
+
+    def _render(self, image_bytes):
+        if self._executor is None:
+            return render_derivatives(image_bytes, self.specs, self.formats)
+        return self._executor.submit(render_derivatives, image_bytes, self.specs, self.formats).result()
+
+    def process(self, url, image_bytes, s3_client, bucket_name, stored_key, region, scheduler=None, upload=True):
+        """
+        Render and upload the derivatives of one stored image
+
+        With upload=False (the derivatives are already in the bucket next to stored_key, e.g. a
+        dedup hit the HashIndex has them for) nothing is rendered; they are described from the
+        image size.
+
+        Returns:
+            {'width', 'height', 'variants': [{'name', 'format', 'url', 'width', 'height'}]} or None
+        """
+        base_url = f"https://{bucket_name}.s3.{region}.amazonaws.com/"
+        try:
+            if upload:
+                width, height, rendered = self._render(image_bytes)
+                for name, fmt, data, _, _ in rendered:
+                    key = derivative_key(stored_key, name, fmt)
+                    with scheduler_slot(scheduler, 's3'):
+                        s3_client.put_object(
+                            Bucket=bucket_name,
+                            Key=key,
+                            Body=data,
+                            ContentType=content_type_for_key(key),
+                            CacheControl='public, max-age=31536000'
+                        )
+            else:
+                width, height = _image_size(image_bytes)
+                rendered = [
+                    (name, fmt, None) + derivative_size(width, height, spec['max_size'])
+                    for name, spec in self.specs.items() for fmt in self.formats
+                ]
+        except Exception as e:
+            # Videos, truncated files, unsupported formats - keep the original, skip the variants
+            print(f"⚠️  No derivatives for {url}: {e}")
+            with self._lock:
+                self.failed += 1
+            return None
+
+        info = {
+            'width': width,
+            'height': height,
+            'variants': [
+                {'name': name, 'format': fmt, 'url': base_url + derivative_key(stored_key, name, fmt),
+                 'width': variant_width, 'height': variant_height}
+                for name, fmt, _, variant_width, variant_height in rendered
+            ]
+        }
+        self.record(url, info)
+        if upload:
+            with self._lock:
+                self.rendered += 1
+        return info
+
+    def record(self, url, info):
+        with self._lock:
+            self.variants[url] = info
+
+    def get(self, url):
+        with self._lock:
+            return self.variants.get(url)
+
+    def adopt(self, manifest, image_tasks):
+        """Reuse the variants an earlier run recorded in the manifest for tasks it already finished"""
+        for task in image_tasks:
+            entry = manifest.completed(task[3])
+            if entry and entry.get('derivatives'):
+                self.record(task[0], entry['derivatives'])
+
+    def annotate(self, post):
+        """Add displayVariants / imageVariants to a post - call before its URLs are rewritten"""
+        with self._lock:
+            if post.get('displayUrl') in self.variants:
+                post['displayVariants'] = self.variants[post['displayUrl']]
+            if post.get('images'):
+                post['imageVariants'] = [self.variants.get(url) for url in post['images']]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def print_stats(self):
+        print(f"🖼️  Derivatives: {self.rendered} images rendered ({', '.join(self.specs)} as "
+              f"{'/'.join(self.formats)}), {self.failed} skipped")
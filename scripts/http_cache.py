@@ -0,0 +1,228 @@
+"""
+On-disk HTTP cache with conditional revalidation.
+
+Responses that carry an ETag or Last-Modified header are stored under the
+cache directory - one body file and one small metadata file per URL. The
+next fetch of the same URL sends If-None-Match / If-Modified-Since, and a
+304 is answered from disk, so an unchanged products.json page costs a few
+hundred bytes instead of a full transfer. It is meant for scraper pages:
+image downloads go through signed CDN URLs that expire, so caching them only
+fills the disk.
+
+Entries are evicted least-recently-used (by metadata mtime, touched on every
+hit) once the cache grows past its size limit. Every file is written
+atomically, so several scripts can share one cache directory. The size on
+disk is re-read before evicting and at least once a second, so every
+script's writes count towards the limit.
+
+Configure with HTTP_CACHE_DIR / HTTP_CACHE_MAX_MB or configure_cache().
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from http_pool import get_session
+
+DEFAULT_CACHE_DIR = os.environ.get('HTTP_CACHE_DIR', '.http_cache')
+DEFAULT_MAX_BYTES = int(os.environ.get('HTTP_CACHE_MAX_MB', '512')) * 1024 * 1024
+RESCAN_SECONDS = 1.0  # how often a store re-reads the size on disk, to count other processes' writes
+
+_cache_config = {'cache_dir': DEFAULT_CACHE_DIR, 'max_bytes': DEFAULT_MAX_BYTES}
+_cache = None
+_cache_lock = threading.Lock()
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+class HTTPCache:
+    """Size-bounded LRU store of response bodies keyed by URL"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        self._evicting = False
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scanned_at = time.monotonic()
+        self.total_bytes = sum(size for _, _, size in self._scan())
+
+    def _paths(self, url):
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, digest)
+        return f"{base}.body", f"{base}.meta"
+
+    def _load_meta(self, url):
+        try:
+            with open(self._paths(url)[1], 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load(self, url):
+        """Return (metadata, body) for url, or (None, None) if it isn't cached"""
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        if meta.get('url') != url or len(body) != meta.get('size'):
+            return None, None
+        return meta, body
+
+    def _store(self, url, response):
+        body = response.content
+        # Don't let one huge object flush the whole cache
+        if len(body) > self.max_bytes // 10:
+            return
+        body_path, meta_path = self._paths(url)
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_type': response.headers.get('Content-Type'),
+            'size': len(body)
+        }
+        # Atomic writes need no lock; only the bookkeeping below is shared
+        old_meta = self._load_meta(url)
+        _write_atomic(body_path, body)
+        _write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+        with self._lock:
+            self.total_bytes += len(body) - (old_meta['size'] if old_meta else 0)
+            evict = not self._evicting and (self.total_bytes > self.max_bytes or
+                                            time.monotonic() - self._scanned_at >= RESCAN_SECONDS)
+            if evict:
+                self._evicting = True
+        if evict:
+            try:
+                self._evict()
+            finally:
+                with self._lock:
+                    self._evicting = False
+
+    def _scan(self):
+        """Return (last_used, meta_path, size) for every entry on disk, from file stats alone"""
+        sizes, last_used = {}, {}
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                base, ext = os.path.splitext(entry.path)
+                try:
+                    if ext == '.body':
+                        sizes[base] = entry.stat().st_size
+                    elif ext == '.meta':
+                        last_used[base] = entry.stat().st_mtime
+                except OSError:
+                    continue
+        return [(last_used[base], f"{base}.meta", size) for base, size in sizes.items() if base in last_used]
+
+    def _evict(self):
+        """Re-read the size on disk and drop least recently used entries until it is under 90% of max_bytes"""
+        entries = self._scan()
+        total_bytes = sum(size for _, _, size in entries)
+        if total_bytes > self.max_bytes:
+            for _, meta_path, size in sorted(entries):
+                if total_bytes <= self.max_bytes * 0.9:
+                    break
+                for path in (meta_path, meta_path[:-len('.meta')] + '.body'):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total_bytes -= size
+        with self._lock:
+            self.total_bytes = total_bytes
+            self._scanned_at = time.monotonic()
+
+    def get(self, url, headers=None, **kwargs):
+        """
+        GET url through the pooled session, revalidating any cached copy
+
+        Returns:
+            A requests.Response. A 304 is turned into a 200 carrying the cached
+            body, so callers see the same thing either way; response.from_cache
+            tells them apart.
+        """
+        meta, body = self._load(url)
+        request_headers = dict(headers or {})
+        if meta:
+            if meta['etag']:
+                request_headers['If-None-Match'] = meta['etag']
+            if meta['last_modified']:
+                request_headers['If-Modified-Since'] = meta['last_modified']
+
+        response = get_session().get(url, headers=request_headers, **kwargs)
+
+        if response.status_code == 304 and meta:
+            response.status_code = 200
+            response._content = body
+            if meta['content_type'] and 'Content-Type' not in response.headers:
+                response.headers['Content-Type'] = meta['content_type']
+            response.from_cache = True
+            # Touch the entry so eviction sees it as recently used
+            try:
+                os.utime(self._paths(url)[1])
+            except OSError:
+                pass
+            with self._lock:
+                self.hits += 1
+                self.bytes_saved += len(body)
+            return response
+
+        response.from_cache = False
+        with self._lock:
+            self.misses += 1
+        if response.status_code == 200 and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+            try:
+                self._store(url, response)
+            except OSError as e:
+                print(f"⚠️  Could not cache {url}: {e}")
+        return response
+
+    def print_stats(self):
+        if not self.hits and not self.misses:
+            return
+        print(f"🗄️  HTTP cache: {self.hits} revalidated (304), {self.misses} fetched, "
+              f"{self.bytes_saved / (1024 * 1024):.1f} MB not re-downloaded, "
+              f"{self.total_bytes / (1024 * 1024):.1f} MB on disk")
+
+def configure_cache(cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """Point the shared cache at cache_dir (None disables caching)"""
+    global _cache
+    with _cache_lock:
+        _cache_config['cache_dir'] = cache_dir
+        _cache_config['max_bytes'] = max_bytes
+        _cache = None
+
+def get_cache():
+    """Return the shared HTTPCache, or None when caching is disabled or unavailable"""
+    global _cache
+    with _cache_lock:
+        if _cache is None and _cache_config['cache_dir']:
+            try:
+                _cache = HTTPCache(_cache_config['cache_dir'], _cache_config['max_bytes'])
+            except OSError as e:
+                print(f"⚠️  HTTP cache disabled: {e}")
+                _cache_config['cache_dir'] = None
+        return _cache
+
+def cached_get(url, **kwargs):
+    """Drop-in for get_session().get(url, ...) that revalidates against the shared cache"""
+    cache = get_cache()
+    if cache is None:
+        return get_session().get(url, **kwargs)
+    return cache.get(url, **kwargs)
+
+def print_cache_stats():
+    """Print a one-line cache summary if the cache was used"""
+    if _cache is not None:
+        _cache.print_stats()
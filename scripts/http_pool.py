@@ -0,0 +1,122 @@
+"""
+Shared keep-alive HTTP sessions for every download and scrape.
+
+Each worker thread gets its own requests.Session (Sessions are not
+thread-safe) with a pooled HTTPAdapter, so repeated fetches from the same
+CDN host reuse an open TCP+TLS connection instead of handshaking per image.
+pool_stats() reports how many requests actually rode on a reused connection.
+
+Sessions belong to their thread: once a thread has exited, its session is
+closed (releasing its pooled connections) the next time a session is created
+or the pool is configured, and TransferPool workers close theirs on the way
+out. Their counts are kept for pool_stats().
+"""
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 10    # keep-alive connections kept per host
+DEFAULT_POOL_HOSTS = 20   # distinct hosts cached per session
+
+_pool_config = {'pool_size': DEFAULT_POOL_SIZE, 'pool_hosts': DEFAULT_POOL_HOSTS}
+_local = threading.local()
+_sessions = {}    # thread -> its Session
+_retired = {'requests': 0, 'connections': 0}
+_sessions_lock = threading.Lock()
+
+def configure_pool(pool_size=DEFAULT_POOL_SIZE, pool_hosts=DEFAULT_POOL_HOSTS):
+    """Set the pool sizes used by sessions created after this call"""
+    _pool_config['pool_size'] = pool_size
+    _pool_config['pool_hosts'] = pool_hosts
+    close_dead_sessions()
+
+def _session_counts(session):
+    """(requests, new connections) of every host pool in session"""
+    total_requests = 0
+    total_connections = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            total_requests += pool.num_requests
+            total_connections += pool.num_connections
+    return total_requests, total_connections
+
+def _retire(session):
+    """Close session, keeping its counts for pool_stats() (call with _sessions_lock held)"""
+    total_requests, total_connections = _session_counts(session)
+    _retired['requests'] += total_requests
+    _retired['connections'] += total_connections
+    session.close()
+
+def close_dead_sessions():
+    """Close the sessions of threads that have exited, returning how many were closed"""
+    with _sessions_lock:
+        dead = [thread for thread in _sessions if not thread.is_alive()]
+        for thread in dead:
+            _retire(_sessions.pop(thread))
+    return len(dead)
+
+def close_session():
+    """Close the calling thread's session, e.g. as a worker thread finishes"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        return
+    _local.session = None
+    with _sessions_lock:
+        _sessions.pop(threading.current_thread(), None)
+        _retire(session)
+
+def get_session():
+    """Return this thread's keep-alive Session, creating it on first use"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        close_dead_sessions()
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=_pool_config['pool_hosts'],
+            pool_maxsize=_pool_config['pool_size']
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _local.session = session
+        with _sessions_lock:
+            _sessions[threading.current_thread()] = session
+    return session
+
+def pool_stats():
+    """
+    Aggregate connection reuse across every session created so far, closed ones included
+
+    Returns:
+        dict with requests, connections (new TCP connections opened),
+        reused and reuse_rate (0-1)
+    """
+    with _sessions_lock:
+        total_requests = _retired['requests']
+        total_connections = _retired['connections']
+        sessions = list(_sessions.values())
+
+    for session in sessions:
+        session_requests, session_connections = _session_counts(session)
+        total_requests += session_requests
+        total_connections += session_connections
+
+    reused = max(total_requests - total_connections, 0)
+    return {
+        'requests': total_requests,
+        'connections': total_connections,
+        'reused': reused,
+        'reuse_rate': reused / total_requests if total_requests else 0.0
+    }
+
+def print_pool_stats():
+    """Print a one-line connection reuse summary"""
+    stats = pool_stats()
+    if not stats['requests']:
+        return
+    print(f"🔌 HTTP connections: {stats['connections']} opened for {stats['requests']} requests "
+          f"({stats['reuse_rate']:.1%} reused)")
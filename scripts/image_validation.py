@@ -0,0 +1,260 @@
+"""
+Validate downloaded images before they are stored, optionally shrinking them losslessly.
+
+The CDN doesn't always answer with an image: truncated bodies and HTML error
+or login pages used to be uploaded as image/jpeg. Every downloaded image is
+handed to a process pool (decoding is CPU-bound and would stall the transfer
+threads) which:
+
+- sniffs the real format from the magic bytes, so ContentType matches the bytes
+  rather than the URL extension,
+- decodes the whole image, rejecting anything truncated or corrupt,
+- optionally strips metadata (EXIF/GPS, XMP, IPTC, comments) - ICC profiles are
+  kept, and so is EXIF when it carries a non-default orientation,
+- optionally re-compresses losslessly: still PNGs are re-encoded with optimize=True
+  and JPEGs get optimized Huffman tables via jpegtran when it is installed. The
+  smaller result is only kept if it decodes to the same pixels.
+
+Rejected images count as failed transfers, so a manifest retries them next run.
+Streamed uploads are checked with StreamedImageCheck before S3 commits them.
+
+Requires: pip install Pillow (without it only the format sniff and a structural
+end-of-file check run). JPEG re-compression needs jpegtran (libjpeg-turbo-progs).
+"""
+
+import io
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# JPEG markers dropped by strip_metadata: APP1 (EXIF, XMP), APP3-APP13 (IPTC, vendor data), COM.
+# APP0 (JFIF), APP2 (ICC profile) and APP14 (Adobe colour transform) change how pixels render.
+_JPEG_STRIPPED_MARKERS = frozenset([0xE1] + list(range(0xE3, 0xEE)) + [0xFE])
+_ISO_BMFF_TYPES = {
+    b'avif': 'image/avif', b'avis': 'image/avif',
+    b'heic': 'image/heic', b'heix': 'image/heic', b'mif1': 'image/heic',
+}
+
+class InvalidImage(ValueError):
+    """The downloaded bytes are not a complete image"""
+
+def sniff_content_type(data):
+    """Content-Type from the leading bytes, or None if they aren't a known image/video format"""
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if data[4:8] == b'ftyp':
+        # ISO base media: the major brand tells HEIF images from MP4 video
+        return _ISO_BMFF_TYPES.get(data[8:12], 'video/mp4')
+    return None
+
+def _describe(data):
+    """Short printable prefix of a rejected body, e.g. '<!DOCTYPE html>...'"""
+    return repr(data[:40].decode('utf-8', 'replace'))
+
+def _check_structure(data, content_type):
+    """Cheap end-of-file check used when Pillow isn't installed"""
+    if content_type == 'image/jpeg' and not data.rstrip(b'\x00').endswith(b'\xff\xd9'):
+        raise InvalidImage("JPEG has no end-of-image marker (truncated)")
+    if content_type == 'image/png' and data[-12:-4] != b'\x00\x00\x00\x00IEND':
+        raise InvalidImage("PNG has no IEND chunk (truncated)")
+
+def strip_jpeg_metadata(data, keep_exif=False):
+    """Drop metadata segments from a JPEG without touching the compressed image data"""
+    output = bytearray(data[:2])
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            raise InvalidImage(f"Corrupt JPEG segment at byte {position}")
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte
+            position += 1
+            continue
+        if marker == 0xDA:
+            # Start of scan - everything from here on is image data
+            break
+        length = int.from_bytes(data[position + 2:position + 4], 'big')
+        segment = data[position:position + 2 + length]
+        is_exif = marker == 0xE1 and segment[4:10] == b'Exif\x00\x00'
+        if marker not in _JPEG_STRIPPED_MARKERS or (keep_exif and is_exif):
+            output += segment
+        position += 2 + length
+    output += data[position:]
+    return bytes(output)
+
+def _jpegtran_optimize(data):
+    """Losslessly optimized JPEG from jpegtran, or None when it isn't installed or fails"""
+    jpegtran = shutil.which('jpegtran')
+    if jpegtran is None:
+        return None
+    # Metadata has already been stripped if that was asked for - keep whatever is left
+    result = subprocess.run([jpegtran, '-copy', 'all', '-optimize'],
+                            input=data, capture_output=True, timeout=60)
+    return result.stdout if result.returncode == 0 and result.stdout else None
+
+def _same_pixels(image, data):
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as candidate:
+        return candidate.mode == image.mode and candidate.size == image.size and \
+            candidate.tobytes() == image.tobytes()
+
+def check_image(data, strip_metadata=False, recompress=False):
+    """
+    Validate data and apply the requested lossless rewrites (runs in a worker process)
+
+    Returns:
+        (data, content_type) - data is the original bytes unless a rewrite made them smaller
+
+    Raises:
+        InvalidImage: the bytes are not a known format or don't decode completely
+    """
+    content_type = sniff_content_type(data)
+    if content_type is None:
+        raise InvalidImage(f"Not an image: {_describe(data)}")
+    if content_type.startswith('video/'):
+        # Videos aren't decoded, only labelled
+        return data, content_type
+
+    try:
+        from PIL import Image
+    except ImportError:
+        _check_structure(data, content_type)
+        return data, content_type
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # verify() only parses headers - load() decodes every pixel and fails on truncation
+            image.load()
+            orientation = image.getexif().get(0x0112, 1)
+            best = data
+            if content_type == 'image/jpeg':
+                if strip_metadata:
+                    best = strip_jpeg_metadata(data, keep_exif=orientation != 1)
+                if recompress:
+                    optimized = _jpegtran_optimize(best)
+                    if optimized and len(optimized) < len(best) and _same_pixels(image, optimized):
+                        best = optimized
+            elif content_type == 'image/png' and (strip_metadata or recompress) and \
+                    not getattr(image, 'is_animated', False):
+                buffer = io.BytesIO()
+                # Text chunks are dropped by the re-encode; the ICC profile is kept, and EXIF unless stripping
+                save_args = {'optimize': recompress}
+                if image.info.get('icc_profile'):
+                    save_args['icc_profile'] = image.info['icc_profile']
+                if not strip_metadata and image.info.get('exif'):
+                    save_args['exif'] = image.info['exif']
+                image.save(buffer, 'PNG', **save_args)
+                rewritten = buffer.getvalue()
+                if len(rewritten) < len(best) and _same_pixels(image, rewritten):
+                    best = rewritten
+    except InvalidImage:
+        raise
+    except Exception as e:
+        raise InvalidImage(f"Doesn't decode: {e}")
+    return best, content_type
+
+class ImageValidator:
+    """Process pool validating downloaded images, plus counters for the run summary"""
+
+    def __init__(self, strip_metadata=False, recompress=False, max_workers=None):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            print("⚠️  Pillow isn't installed; images are only checked for format and truncation")
+        if recompress and shutil.which('jpegtran') is None:
+            print("⚠️  jpegtran not found; only PNGs will be re-compressed")
+
+        self.strip_metadata = strip_metadata
+        self.recompress = recompress
+        self.validated = 0
+        self.rejected = 0
+        self.relabelled = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        try:
+            # spawn, not fork: the parent is full of threads holding locks
+            self._executor = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        except (OSError, NotImplementedError) as e:
+            # e.g. AWS Lambda has no /dev/shm for process pool semaphores
+            print(f"⚠️  No process pool ({e}); validating images on the transfer threads")
+            self._executor = None
+
+    def _check(self, data):
+        if self._executor is None:
+            return check_image(data, self.strip_metadata, self.recompress)
+        return self._executor.submit(check_image, data, self.strip_metadata, self.recompress).result()
+
+    def check(self, url, data, expected_type=None):
+        """
+        Validate one downloaded image
+
+        Args:
+            expected_type: Content-Type the key extension implies, to count relabelled objects
+
+        Returns:
+            (data, content_type) to store, or None if the image was rejected
+        """
+        try:
+            checked, content_type = self._check(data)
+        except InvalidImage as e:
+            print(f"❌ Rejected {url}: {e}")
+            with self._lock:
+                self.rejected += 1
+            return None
+
+        with self._lock:
+            self.validated += 1
+            self.bytes_saved += len(data) - len(checked)
+            if expected_type is not None and content_type != expected_type:
+                self.relabelled += 1
+        return checked, content_type
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def print_stats(self):
+        rewrites = [name for name, enabled in (('metadata stripped', self.strip_metadata),
+                                               ('re-compressed', self.recompress)) if enabled]
+        print(f"🔎 Validation: {self.validated} images ok, {self.rejected} rejected, "
+              f"{self.relabelled} Content-Types corrected"
+              + (f", {self.bytes_saved / (1024 * 1024):.1f} MB saved ({', '.join(rewrites)})" if rewrites else ""))
+
+class StreamedImageCheck:
+    """
+    accept hook for stream_to_s3: validates the teed bytes before the streamed object is committed
+
+    The streamed object is only kept when the validator leaves it as it is. After the
+    transfer, result holds the validator's (data, content_type) (None if it rejected the
+    image or never ran) and rewritten tells that this data still has to be stored.
+    """
+
+    def __init__(self, validator, url, tee, expected_type):
+        self.validator = validator
+        self.url = url
+        self.tee = tee
+        self.expected_type = expected_type
+        self.result = None
+        self.rewritten = False
+
+    def __call__(self):
+        self.tee.seek(0)
+        data = self.tee.read()
+        self.result = self.validator.check(self.url, data, self.expected_type)
+        if self.result is None:
+            return False
+        checked, content_type = self.result
+        # Rewrites are only kept when smaller, so an unchanged length means unchanged bytes
+        self.rewritten = len(checked) != len(data) or content_type != self.expected_type
+        return not self.rewritten
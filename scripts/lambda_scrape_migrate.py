@@ -1,15 +1,40 @@
 """
 AWS Lambda function for automated Instagram scraping and S3 migration
 Triggers daily via EventBridge
+
+Cold starts: boto3 and apify_client (most of the import time) are imported on
+first use, and the S3/Apify clients, the transfer threads with their keep-alive
+HTTP sessions and the adaptive concurrency limits live at module scope, so warm
+invocations of the same container reuse them instead of rebuilding them.
 """
 
+import time
+
+_INIT_STARTED = time.perf_counter()
+
 import json
+import tempfile
 import os
-import requests
-import boto3
-from apify_client import ApifyClient
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
+from s3_transfer import stream_to_s3, content_type_for_key, load_json, save_json, DEFAULT_PART_SIZE
+from storage_backends import S3Backend
+from adaptive_scheduler import TransferScheduler, scheduler_slot, is_retryable_status, backoff_delay
+from http_pool import get_session, configure_pool, pool_stats, print_pool_stats, DEFAULT_POOL_SIZE
+from async_transfer import run_async_transfers, check_engine, DEFAULT_CONCURRENCY
+from transfer_pipeline import TransferPool, run_pipeline, DEFAULT_QUEUE_SIZE
+from content_store import HashIndex, dedup_transfer
+from derivatives import DerivativeBuilder
+from image_validation import ImageValidator, StreamedImageCheck
+from shard_dispatch import run_shard
+from task_planner import TransferPlanner, post_media, post_media_urls, rewrite_media, media_kind, fan_out
+from transfer_metrics import TransferMetrics, measure, error_status, print_emf, DEFAULT_NAMESPACE
+from sharded_output import write_sharded_json, DEFAULT_PAGE_SIZE
+from apify_runs import apify_client_url
+from migration_manifest import MigrationManifest, STATUS_DONE, STATUS_FAILED
+from scrape_state import ScrapeState, merge_posts
 
 def get_image_extension(url):
     """Extract image extension from URL or default to jpg"""
@@ -20,216 +45,713 @@ def get_image_extension(url):
         return ext.lower()
     return '.jpg'
 
-def generate_image_key(url, model_name, post_id, image_index):
-    """Generate a unique S3 key for the image"""
-    ext = get_image_extension(url)
-    return f"{model_name}/posts/{post_id}/image_{image_index:03d}{ext}"
-
-def download_image(url, max_retries=3):
-    """Download image from URL with retries"""
+def download_image(url, max_retries=3, scheduler=None, metrics=None):
+    """Download image from URL, retrying transient failures with jittered backoff"""
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
     }
 
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=30)
-            if response.status_code == 200:
-                return response.content
-            else:
-                if attempt == max_retries - 1:
+    with measure(metrics, 'download', url) as event:
+        for attempt in range(max_retries):
+            event.retries = attempt
+            try:
+                with scheduler_slot(scheduler, url) as slot:
+                    response = get_session().get(url, headers=headers, timeout=30)
+                    slot.status = response.status_code
+                event.status = response.status_code
+                if response.status_code == 200:
+                    event.size, event.ok = len(response.content), True
+                    return response.content
+                # 404/403 won't fix themselves - only retry throttling and server errors
+                if not is_retryable_status(response.status_code) or attempt == max_retries - 1:
                     print(f"Failed to download {url}: Status {response.status_code}")
+                    return None
+            except Exception as e:
+                if attempt == max_retries - 1:
+                    print(f"Error downloading {url}: {e}")
+                    return None
+            time.sleep(backoff_delay(attempt))
+        return None
+
+def upload_to_s3(s3_client, bucket_name, key, image_data, scheduler=None, metrics=None, content_type=None):
+    """Upload image data to the bucket's storage backend (content_type defaults to a guess from the key extension)"""
+    backend = S3Backend(bucket_name, s3_client=s3_client)
+    with measure(metrics, 'upload', key) as event:
+        event.size = len(image_data)
+        try:
+            response = backend.put(key, image_data, scheduler, content_type)
+            event.status, event.ok = 200, True
+            event.retries = response['ResponseMetadata'].get('RetryAttempts', 0)
+            return True
         except Exception as e:
-            if attempt == max_retries - 1:
-                print(f"Error downloading {url}: {e}")
-    return None
-
-def upload_to_s3(s3_client, bucket_name, key, image_data):
-    """Upload image data to S3"""
-    try:
-        content_type = 'image/jpeg'
-        if key.endswith('.png'):
-            content_type = 'image/png'
-        elif key.endswith('.webp'):
-            content_type = 'image/webp'
-
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=key,
-            Body=image_data,
-            ContentType=content_type,
-            CacheControl='public, max-age=31536000'
-        )
-        return True
-    except Exception as e:
-        print(f"Error uploading to S3 {key}: {e}")
-        return False
+            event.status = error_status(e)
+            print(f"Error uploading to S3 {key}: {e}")
+            return False
 
 def process_image(args):
     """Process a single image: download and upload to S3"""
-    url, s3_client, bucket_name, s3_key, region = args
-
-    # Download image immediately
-    image_data = download_image(url)
-    if not image_data:
+    url, s3_client, bucket_name, s3_key, region, options = args
+    manifest = options.get('manifest')
+    scheduler = options.get('scheduler')
+    derivatives = options.get('derivatives')
+    metrics = options.get('metrics')
+    validator = options.get('validator')
+    kind = media_kind(s3_key)
+    if kind != 'image':
+        # Videos and commenters' profile pictures get no viewer variants
+        derivatives = None
+
+    if kind == 'video':
+        # Videos can be hundreds of MB: always stream them into a multipart upload, whatever the mode
+        size = stream_to_s3(url, s3_client, bucket_name, s3_key, part_size=options['part_size'],
+                            scheduler=scheduler, metrics=metrics)
+        stored_key = s3_key if size is not None else None
+    elif options.get('hash_index') is not None:
+        # Content-addressed mode: hash the bytes and only upload digests the index hasn't seen
+        stored_key, size = dedup_transfer(url, s3_client, bucket_name, options['model_name'],
+                                          get_image_extension(url), options['hash_index'], options['part_size'],
+                                          scheduler=scheduler, derivatives=derivatives, region=region,
+                                          metrics=metrics, validator=validator)
+    elif options.get('stream'):
+        # Streaming mode keeps Lambda memory bounded by the part size, not the largest image
+        # Validation and derivatives need the whole image, so tee it into a spool that spills to disk past one part
+        needs_bytes = validator is not None or derivatives is not None
+        tee = tempfile.SpooledTemporaryFile(max_size=options['part_size']) if needs_bytes else None
+        check = StreamedImageCheck(validator, url, tee, content_type_for_key(s3_key)) \
+            if validator is not None else None
+        size = stream_to_s3(url, s3_client, bucket_name, s3_key, part_size=options['part_size'],
+                            scheduler=scheduler, tee=tee, metrics=metrics, accept=check)
+        stored_key = s3_key if size is not None else None
+        content_type = None
+        if check is not None and check.result is not None:
+            image_data, content_type = check.result
+            # The validator changed the bytes or the Content-Type, so the stream was discarded for its version
+            if check.rewritten and upload_to_s3(s3_client, bucket_name, s3_key, image_data, scheduler=scheduler,
+                                                metrics=metrics, content_type=content_type):
+                stored_key, size = s3_key, len(image_data)
+        elif stored_key and tee is not None:
+            tee.seek(0)
+            image_data = tee.read()
+        if stored_key and tee is not None:
+            if derivatives is not None:
+                derivatives.process(url, image_data, s3_client, bucket_name, stored_key, region, scheduler)
+        if tee is not None:
+            tee.close()
+    else:
+        # Download image immediately, then upload to S3
+        stored_key, size = None, None
+        content_type = None
+        image_data = download_image(url, scheduler=scheduler, metrics=metrics)
+        if image_data and validator is not None:
+            checked = validator.check(url, image_data, content_type_for_key(s3_key))
+            image_data, content_type = checked if checked else (None, None)
+        if image_data and upload_to_s3(s3_client, bucket_name, s3_key, image_data, scheduler=scheduler,
+                                       metrics=metrics, content_type=content_type):
+            stored_key, size = s3_key, len(image_data)
+            if derivatives is not None:
+                derivatives.process(url, image_data, s3_client, bucket_name, stored_key, region, scheduler)
+
+    if manifest is not None:
+        manifest.record(s3_key, url, stored_key, size, STATUS_DONE if stored_key else STATUS_FAILED,
+                        derivatives=derivatives.get(url) if derivatives is not None else None)
+
+    if stored_key is None:
         return None, None
+    return url, f"https://{bucket_name}.s3.{region}.amazonaws.com/{stored_key}"
+
+# Created on the first invocation of a container and reused by the warm ones after it
+_warm = {}
+_warm_lock = threading.Lock()
+_invocations = 0
+
+def warm_cached(key, factory):
+    """Module-scope object for key, created with factory() the first time it is asked for"""
+    with _warm_lock:
+        if key not in _warm:
+            _warm[key] = factory()
+        return _warm[key]
+
+def _new_s3_client(region, max_pool_connections=None):
+    import boto3
+
+    if max_pool_connections is None:
+        return boto3.client('s3', region_name=region)
+    from botocore.config import Config
+
+    # botocore's adaptive retry mode adds client-side rate limiting when S3 says SlowDown
+    s3_config = Config(retries={'mode': 'adaptive', 'max_attempts': 10},
+                       max_pool_connections=max_pool_connections)
+    return boto3.client('s3', region_name=region, config=s3_config)
+
+def create_s3_client(region, scheduler=None):
+    """S3 client sized for the transfer workers (boto3 clients are thread-safe, so one per config)"""
+    max_pool_connections = scheduler.host_limits['s3']['max'] if scheduler is not None else None
+    return warm_cached(('s3', region, max_pool_connections),
+                       lambda: _new_s3_client(region, max_pool_connections))
+
+def get_apify_client(apify_token):
+    """ApifyClient for apify_token, imported and created once per container"""
+    def create():
+        from apify_client import ApifyClient
+        return ApifyClient(apify_token, api_url=apify_client_url())
+    return warm_cached(('apify', apify_token, apify_client_url()), create)
+
+def get_scheduler():
+    """Per-host AIMD limits, kept warm so the next invocation starts from what this one learned"""
+    return warm_cached('scheduler', TransferScheduler)
+
+def get_transfer_pool(max_workers, queue_size):
+    """
+    Transfer threads kept alive between invocations
 
-    # Upload to S3
-    if upload_to_s3(s3_client, bucket_name, s3_key, image_data):
-        # Generate S3 URL
-        s3_url = f"https://{bucket_name}.s3.{region}.amazonaws.com/{s3_key}"
-        return url, s3_url
+    Each thread holds its own keep-alive requests.Session, so a warm invocation
+    finds its CDN connections already open instead of handshaking again.
+    """
+    return warm_cached(('pool', max_workers, queue_size), lambda: TransferPool(max_workers, queue_size))
 
-    return None, None
+def invocation_timing(handler_started, cold_start):
+    """Module init vs handler duration of this invocation (init is only paid on a cold start)"""
+    return {
+        'cold_start': cold_start,
+        'init_ms': round(INIT_SECONDS * 1000) if cold_start else 0,
+        'handler_ms': round((time.perf_counter() - handler_started) * 1000)
+    }
 
-def scrape_and_migrate(username, bucket_name, model_name, apify_token, region='us-east-2', max_posts=100):
-    """Main function to scrape Instagram and immediately migrate to S3"""
+def report_timing(timing, function_name, namespace=DEFAULT_NAMESPACE):
+    """Log the invocation timing, as a readable line and as CloudWatch EMF"""
+    print(f"⏱️  {'Cold' if timing['cold_start'] else 'Warm'} start: init {timing['init_ms']} ms, "
+          f"handler {timing['handler_ms']} ms")
+    print_emf(namespace, {'Function': function_name}, {
+        'InitDuration': (timing['init_ms'], 'Milliseconds'),
+        'HandlerDuration': (timing['handler_ms'], 'Milliseconds'),
+        'ColdStart': (int(timing['cold_start']), 'Count')
+    })
+
+def scrape_and_migrate(username, bucket_name, model_name, apify_token, region='us-east-2', max_posts=100,
+                       stream=False, part_size=DEFAULT_PART_SIZE, pool_size=DEFAULT_POOL_SIZE,
+                       engine='threads', concurrency=DEFAULT_CONCURRENCY, dedup=False, incremental=True,
+                       adaptive=False, queue_size=DEFAULT_QUEUE_SIZE, should_stop=None, resume_from=None,
+                       s3_client=None, scheduler=None, pool=None, derivative_formats=None,
+                       page_size=DEFAULT_PAGE_SIZE, metrics_namespace=DEFAULT_NAMESPACE, validate=False,
+                       strip_metadata=False, recompress=False):
+    """
+    Main function to scrape Instagram and immediately migrate to S3
 
-    print(f"Starting scrape for @{username}...")
+    should_stop is polled before each transfer starts; once it returns True the remaining
+    images are written to a checkpoint and the result's 'continuation' points at it.
+    Passing that location back as resume_from skips the scrape and finishes those images.
 
-    # Initialize clients
-    client = ApifyClient(apify_token)
-    s3_client = boto3.client('s3', region_name=region)
-
-    # Prepare Actor input
-    run_input = {
-        "directUrls": [f"https://www.instagram.com/{username}/"],
-        "resultsType": "posts",
-        "resultsLimit": max_posts,
-    }
+    s3_client, scheduler and pool let several accounts share one S3 client, one set of
+    per-host limits and one TransferPool; otherwise the container's cached client and
+    limits are used and the pipeline starts its own pool.
 
-    # Run the Actor
-    print("Running Apify scraper...")
-    run = client.actor("apify/instagram-scraper").call(run_input=run_input)
+    Besides {model}/instagram_data.json the posts are written as page shards of page_size
+    under {model}/instagram_data/ for the viewer.
 
-    # Get dataset
-    dataset_id = run["defaultDatasetId"]
-    print(f"Scrape complete! Dataset: {dataset_id}")
+    Per-stage transfer metrics (latency percentiles, throughput, retries) are logged in
+    CloudWatch Embedded Metric Format under metrics_namespace with a Model dimension.
 
-    # Fetch all items
-    posts = []
-    print("Fetching posts from dataset...")
-    for item in client.dataset(dataset_id).iterate_items():
-        posts.append(item)
+    validate rejects downloads that don't decode and sets ContentType from the actual
+    format; strip_metadata and recompress (both imply validate) shrink images losslessly.
 
-    print(f"Found {len(posts)} posts")
+    incremental also keeps a high-water mark per account in {model}/scrape_state.json:
+    the actor is only asked for posts newer than the last one ingested, and the new posts
+    are upserted into the stored instagram_data.json instead of replacing it. Stored posts
+    whose media never made it to the bucket are queued again with them.
+    """
 
-    # Collect all images to process
-    image_tasks = []
-    url_to_post_map = {}
+    validate = validate or strip_metadata or recompress
+    check_engine(engine, dedup=dedup, derivatives=derivative_formats, validation=validate)
 
-    for post_idx, post in enumerate(posts):
-        post_id = post.get('id', f'post_{post_idx}')
+    print(f"Starting scrape for @{username}...")
 
-        # Process displayUrl
-        if 'displayUrl' in post and post['displayUrl']:
-            s3_key = generate_image_key(post['displayUrl'], model_name, post_id, 0)
-            image_tasks.append((post['displayUrl'], s3_client, bucket_name, s3_key, region))
-            url_to_post_map[post['displayUrl']] = (post_idx, 0, 'displayUrl')
+    # Initialize clients
+    client = get_apify_client(apify_token)
+    if scheduler is None and adaptive:
+        scheduler = get_scheduler()
+    if s3_client is None:
+        s3_client = create_s3_client(region, scheduler)
+        configure_pool(pool_size=pool_size)
+    # Lambda disk is ephemeral, so the digest index lives next to the images in the bucket
+    hash_index = HashIndex(f"s3://{bucket_name}/{model_name}/hash_index.json", s3_client) if dedup else None
+    manifest = MigrationManifest(f"s3://{bucket_name}/{model_name}/migration_manifest.json", s3_client) if incremental else None
+    derivatives = DerivativeBuilder(derivative_formats) if derivative_formats else None
+    metrics = TransferMetrics()
+    validator = ImageValidator(strip_metadata, recompress) if validate else None
+    state = ScrapeState(f"s3://{bucket_name}/{model_name}/scrape_state.json", s3_client) if incremental else None
+    json_key = f"{model_name}/instagram_data.json"
+    stored_posts = load_json(f"s3://{bucket_name}/{json_key}", s3_client, default=[]) if state else []
+    transfer_options = {'stream': stream, 'part_size': part_size, 'hash_index': hash_index,
+                        'model_name': model_name, 'manifest': manifest, 'scheduler': scheduler,
+                        'derivatives': derivatives, 'metrics': metrics, 'validator': validator}
+
+    checkpoint_location = f"s3://{bucket_name}/{model_name}/continuation.json"
+    checkpoint = load_json(resume_from, s3_client) if resume_from else None
+
+    if checkpoint:
+        # Continuation of an invocation that ran out of time - the dataset is already scraped
+        dataset_id = checkpoint['dataset_id']
+        print(f"Resuming dataset {dataset_id}: {len(checkpoint['pending'])} images left")
+    else:
+        # Prepare Actor input
+        run_input = {
+            "directUrls": [f"https://www.instagram.com/{username}/"],
+            "resultsType": "posts",
+            "resultsLimit": max_posts,
+        }
+        if state is not None:
+            run_input = state.scrape_input(username, run_input)
 
-        # Process images array
-        if 'images' in post and post['images']:
-            for img_idx, img_url in enumerate(post['images']):
-                s3_key = generate_image_key(img_url, model_name, post_id, img_idx)
-                image_tasks.append((img_url, s3_client, bucket_name, s3_key, region))
-                url_to_post_map[img_url] = (post_idx, img_idx, 'images')
+        # Run the Actor
+        print("Running Apify scraper...")
+        run = client.actor("apify/instagram-scraper").call(run_input=run_input)
 
-    print(f"Processing {len(image_tasks)} images...")
+        # Get dataset
+        dataset_id = run["defaultDatasetId"]
+        print(f"Scrape complete! Dataset: {dataset_id}")
 
-    # Process images in parallel
+    posts = []
     url_mapping = {}
+    already_done = []
+    deferred = []
     successful = 0
     failed = 0
+    planner = TransferPlanner()
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(process_image, task) for task in image_tasks]
+    # The mark this scrape was filtered against; a continuation filters its dataset the same way
+    since_mark = checkpoint.get('since_mark') if checkpoint else state.mark(username) if state else None
 
-        for future in as_completed(futures):
-            old_url, new_url = future.result()
-            if old_url and new_url:
-                url_mapping[old_url] = new_url
-                successful += 1
-            else:
-                failed += 1
+    # Seed up front so each post is checked against the bucket as it streams in
+    if manifest is not None and not checkpoint:
+        manifest.seed_from_bucket(bucket_name, f"{model_name}/")
+
+    stored_url_prefix = f"https://{bucket_name}.s3."
 
-    print(f"Upload complete: {successful}/{len(image_tasks)} successful")
+    def post_tasks(post_idx, post):
+        """Record a dataset item and return the image tasks it still needs"""
+        posts.append(post)
+        post_id = post.get('id', f'post_{post_idx}')
+        tasks = []
+
+        # Images, videos, carousel children and commenters' profile pictures
+        for container, field, key in post_media(post, post_id):
+            if container[field].startswith(stored_url_prefix):
+                # A retried stored post only needs the media that isn't in the bucket yet
+                continue
+            s3_key = f"{model_name}/{key}"
+            tasks.append((container[field], s3_client, bucket_name, s3_key, region, transfer_options))
+
+        # displayUrl is usually images[0] - transfer each distinct image once
+        tasks = planner.plan(tasks)
+
+        # Only schedule images that yesterday's (or an interrupted) run didn't store
+        if manifest is not None:
+            if derivatives is not None:
+                derivatives.adopt(manifest, tasks)
+            tasks, done = manifest.schedule(tasks)
+            already_done.extend(done)
+            for old_url, stored_key in done:
+                url_mapping[old_url] = f"https://{bucket_name}.s3.{region}.amazonaws.com/{stored_key}"
+        return tasks
+
+    def checkpoint_tasks(task_idx, task):
+        """Rebuild a process_image task from a checkpointed (url, s3_key) pair"""
+        url, s3_key = task
+        return [(url, s3_client, bucket_name, s3_key, region, transfer_options)]
+
+    dataset = client.dataset(dataset_id)
+    if checkpoint:
+        url_mapping.update(checkpoint['url_mapping'])
+        if derivatives is not None:
+            for url, info in checkpoint.get('variants', {}).items():
+                derivatives.record(url, info)
+        scraped = dataset.iterate_items()
+        posts.extend(state.new_posts(username, scraped, mark=since_mark) if since_mark else scraped)
+        items, expand = checkpoint['pending'], checkpoint_tasks
+    elif state is not None:
+        # Only the posts newer than the mark, plus stored posts still pointing at the CDN
+        retry = state.retry_posts(username, stored_posts, stored_url_prefix, post_media_urls)
+        items, expand = planner.planned(chain(state.new_posts(username, dataset.iterate_items()), retry)), post_tasks
+    else:
+        items, expand = planner.planned(dataset.iterate_items()), post_tasks
+
+    try:
+        if engine == 'async':
+            # The event loop takes its task list up front, so collect the dataset first
+            print("Fetching posts from dataset...")
+            image_tasks = [task for item_idx, item in enumerate(items) for task in expand(item_idx, item)]
+            print(f"Processing {len(image_tasks)} images...")
+            results = run_async_transfers(
+                [(task[0], task[3]) for task in image_tasks], bucket_name, region,
+                concurrency=concurrency, manifest=manifest, should_stop=should_stop, deferred=deferred,
+                metrics=metrics, scheduler=scheduler
+            )
+        else:
+            # Pipeline: each post's images start transferring as soon as its dataset item arrives
+            print("Streaming posts from dataset into transfer workers...")
+            results = run_pipeline(
+                items, expand, process_image,
+                max_workers=scheduler.max_workers if scheduler else 10, queue_size=queue_size,
+                should_stop=should_stop, deferred=deferred, pool=pool
+            )
+            deferred = [(task[0], task[3]) for task in deferred]
+    finally:
+        if manifest is not None:
+            manifest.save()
+        if derivatives is not None:
+            derivatives.close()
+        if validator is not None:
+            validator.close()
+
+    skipped = len(already_done)
+    print(f"Found {len(posts)} posts, skipped {skipped} images already migrated")
+
+    for old_url, new_url in results:
+        if old_url and new_url:
+            url_mapping[old_url] = new_url
+            successful += 1
+        else:
+            failed += 1
+
+    print(f"Upload complete: {successful}/{len(results)} successful")
+    if hash_index is not None:
+        hash_index.save()
+        hash_index.print_stats()
+    if derivatives is not None:
+        derivatives.print_stats()
+    if validator is not None:
+        validator.print_stats()
+    metrics.emit_emf(metrics_namespace, {'Model': model_name})
+    print_pool_stats()
+    if scheduler is not None:
+        scheduler.print_stats()
+
+    # Point every duplicate reference at the copy that was transferred
+    referenced_urls = [url for post in posts for url in post_media_urls(post)]
+    fan_out(url_mapping, referenced_urls)
+    if derivatives is not None:
+        fan_out(derivatives.variants, referenced_urls)
 
     # Update posts with S3 URLs
     for post in posts:
-        if 'displayUrl' in post and post['displayUrl'] in url_mapping:
-            post['displayUrl'] = url_mapping[post['displayUrl']]
+        if derivatives is not None:
+            derivatives.annotate(post)
 
-        if 'images' in post and post['images']:
-            post['images'] = [
-                url_mapping.get(url, url) for url in post['images']
-            ]
+        rewrite_media(post, url_mapping)
+
+    # Upsert this run's posts into the stored ones by post id
+    all_posts = merge_posts(stored_posts, posts) if state is not None else posts
 
     # Save to S3 as JSON
-    json_key = f"{model_name}/instagram_data.json"
     s3_client.put_object(
         Bucket=bucket_name,
         Key=json_key,
-        Body=json.dumps(posts, indent=2, ensure_ascii=False),
+        Body=json.dumps(all_posts, separators=(',', ':'), ensure_ascii=False),
         ContentType='application/json'
     )
-
-    print(f"Saved JSON to s3://{bucket_name}/{json_key}")
+    pages_location = f"s3://{bucket_name}/{model_name}/instagram_data"
+    index = write_sharded_json(all_posts, pages_location, page_size=page_size, s3_client=s3_client)
+
+    print(f"Saved JSON to s3://{bucket_name}/{json_key} ({len(index['pages'])} pages under {pages_location}/)")
+
+    # Only now that the posts are stored is it safe to skip them next time
+    if state is not None:
+        state.advance(username, posts)
+        state.save()
+
+    continuation = None
+    if deferred:
+        # Out of time - hand the rest to the next invocation
+        save_json(checkpoint_location, {
+            'dataset_id': dataset_id,
+            'pending': deferred,
+            'url_mapping': url_mapping,
+            'since_mark': since_mark,
+            'variants': derivatives.variants if derivatives is not None else {}
+        }, s3_client)
+        continuation = checkpoint_location
+        print(f"Time budget used up: {len(deferred)} images checkpointed to {checkpoint_location}")
 
     return {
-        'posts': len(posts),
-        'images_total': len(image_tasks),
+        'posts': len(all_posts),
+        'posts_updated': len(posts),
+        'images_total': len(results) + len(deferred) + skipped,
+        'images_skipped': skipped,
         'images_successful': successful,
-        'images_failed': failed
+        'images_failed': failed,
+        'images_deferred': len(deferred),
+        'continuation': continuation,
+        'http_connection_reuse': round(pool_stats()['reuse_rate'], 3),
+        'concurrency': scheduler.stats() if scheduler else None,
+        'metrics': metrics.summary()
     }
 
-def lambda_handler(event, context):
+class LocalContext:
+    """Stand-in for the Lambda context object when running the handler locally"""
+
+    def __init__(self, timeout_seconds=900):
+        self.timeout_seconds = timeout_seconds
+        self.function_name = 'local'
+        self.invoked_function_arn = 'local'
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+def invoke_lambda(event, context):
+    """Start the next invocation of this function asynchronously"""
+    import boto3
+
+    warm_cached('lambda', lambda: boto3.client('lambda')).invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType='Event',
+        Payload=json.dumps(event)
+    )
+
+def invoke_inline(event, context):
+    """Run the continuation in this process with a fresh time budget - for local testing"""
+    return lambda_handler(event, LocalContext(context.timeout_seconds), invoker=invoke_inline)
+
+CONTINUATION_INVOKERS = {
+    'lambda': invoke_lambda,
+    'inline': invoke_inline,
+    'none': lambda event, context: None
+}
+
+def run_shard_event(spec):
+    """Transfer one shard of a migration fanned out by shard_dispatch.LambdaDispatcher"""
+    scheduler = get_scheduler() if spec.get('adaptive') else None
+    s3_client = create_s3_client(spec['region'], scheduler)
+    print(f"Lambda shard {spec['shard'] + 1}/{spec['shards']}: {len(spec['tasks'])} transfers")
+    return run_shard(spec, process_image, s3_client=s3_client, scheduler=scheduler)
+
+def load_accounts(event, s3_client):
+    """
+    Accounts to process in this invocation
+
+    Taken from event["accounts"], else from ACCOUNTS_CONFIG (a JSON list or an
+    s3://bucket/key holding one), else the single INSTAGRAM_USERNAME/MODEL_NAME pair.
+    Each account is a dict with username and model_name, and optionally bucket_name
+    and max_posts (defaulting to S3_BUCKET_NAME / MAX_POSTS).
+    """
+    if event.get('accounts'):
+        accounts = event['accounts']
+    elif os.environ.get('ACCOUNTS_CONFIG'):
+        config = os.environ['ACCOUNTS_CONFIG']
+        accounts = load_json(config, s3_client) if config.startswith('s3://') else json.loads(config)
+    else:
+        accounts = [{
+            'username': os.environ['INSTAGRAM_USERNAME'],
+            'model_name': os.environ['MODEL_NAME'],
+            'continuation': event.get('continuation')
+        }]
+
+    return [{
+        'username': account['username'],
+        'model_name': account['model_name'],
+        'bucket_name': account.get('bucket_name') or os.environ['S3_BUCKET_NAME'],
+        'max_posts': int(account.get('max_posts') or os.environ.get('MAX_POSTS', '100')),
+        'continuation': account.get('continuation')
+    } for account in accounts]
+
+def lambda_handler(event, context, invoker=None):
     """
     AWS Lambda handler function
 
     Environment variables required:
     - APIFY_API_TOKEN: Your Apify API token
+    - APIFY_API_BASE: Apify API base URL (default: https://api.apify.com/v2), e.g. an apify_mock.py server
     - INSTAGRAM_USERNAME: Instagram username to scrape
     - S3_BUCKET_NAME: S3 bucket name
     - MODEL_NAME: Model name for folder structure
     - AWS_REGION: AWS region (default: us-east-2)
     - MAX_POSTS: Maximum posts to scrape (default: 100)
+    - ACCOUNTS_CONFIG: JSON list of accounts (or s3://bucket/key of one) instead of
+      INSTAGRAM_USERNAME/MODEL_NAME - see load_accounts(). An "accounts" list in the event wins.
+    - ACCOUNT_CONCURRENCY: Accounts scraped at once (default: 4)
+    - TRANSFER_WORKERS: Transfer threads shared by all accounts (default: 10)
+    - STREAM_UPLOADS: 'true' to stream downloads into multipart uploads (default: false)
+    - UPLOAD_PART_SIZE_MB: Multipart part size when streaming (default: 8)
+    - HTTP_POOL_SIZE: Keep-alive connections per host per worker (default: 10)
+    - TRANSFER_ENGINE: 'threads' or 'async' (default: threads; async needs aiohttp + aiobotocore)
+    - ASYNC_CONCURRENCY: Transfers in flight with the async engine (default: 200)
+    - DEDUP_IMAGES: 'true' to store images content-addressed and upload each unique image once
+    - DERIVATIVE_FORMATS: e.g. 'webp' or 'webp,avif' to upload resized thumb/medium copies (needs Pillow)
+    - VALIDATE_IMAGES: 'true' to reject downloads that don't decode and set ContentType from the bytes
+    - STRIP_METADATA: 'true' to drop EXIF/XMP/IPTC before storing (implies VALIDATE_IMAGES)
+    - RECOMPRESS_IMAGES: 'true' to re-compress losslessly when smaller (implies VALIDATE_IMAGES)
+    - INCREMENTAL: 'false' to ignore the migration manifest and scrape marks, re-scraping and re-uploading
+      everything (default: true)
+    - ADAPTIVE_CONCURRENCY: 'true' for per-host AIMD concurrency with backoff on throttling
+    - PIPELINE_QUEUE_SIZE: Image tasks buffered between the dataset stream and the workers (default: 100)
+    - TIME_RESERVE_SECONDS: Stop starting transfers when less than this much time is left (default: 60)
+    - CONTINUATION_INVOKER: 'lambda' (re-invoke this function), 'inline' (local testing) or 'none'
+    - MAX_CONTINUATIONS: Follow-up invocations allowed per run (default: 10)
+
+    When the time budget runs out, the remaining images are checkpointed to S3 and the
+    next invocation receives {"accounts": [...], "continuation_count": n}, where each
+    unfinished account carries the s3:// location of its checkpoint as "continuation".
+
+    An event of the form {"shard": {...}} skips scraping and runs one shard of a migration
+    sharded by migrate_to_s3.py --shards N --dispatch lambda:<this function>; the shard's
+    report is returned as-is (see shard_dispatch.run_shard).
+
+    The response body's "timing" reports module init vs handler duration; the same numbers
+    are logged as InitDuration / HandlerDuration / ColdStart EMF metrics.
     """
+    global _invocations
+    handler_started = time.perf_counter()
+    cold_start = _invocations == 0
+    _invocations += 1
+    function_name = getattr(context, 'function_name', 'local')
+    metrics_namespace = os.environ.get('METRICS_NAMESPACE', DEFAULT_NAMESPACE)
+
+    if event and event.get('shard'):
+        # Errors propagate, so the dispatcher sees a FunctionError and counts the shard as failed
+        report = run_shard_event(event['shard'])
+        report['timing'] = invocation_timing(handler_started, cold_start)
+        report_timing(report['timing'], function_name, metrics_namespace)
+        return report
 
     try:
         # Get configuration from environment variables
+        event = event or {}
         apify_token = os.environ['APIFY_API_TOKEN']
-        username = os.environ['INSTAGRAM_USERNAME']
-        bucket_name = os.environ['S3_BUCKET_NAME']
-        model_name = os.environ['MODEL_NAME']
         region = os.environ.get('AWS_REGION', 'us-east-2')
-        max_posts = int(os.environ.get('MAX_POSTS', '100'))
-
-        print(f"Lambda triggered for @{username}")
-
-        # Run scrape and migrate
-        result = scrape_and_migrate(
-            username=username,
-            bucket_name=bucket_name,
-            model_name=model_name,
-            apify_token=apify_token,
-            region=region,
-            max_posts=max_posts
-        )
-
+        account_concurrency = int(os.environ.get('ACCOUNT_CONCURRENCY', '4'))
+        transfer_workers = int(os.environ.get('TRANSFER_WORKERS', '10'))
+        stream = os.environ.get('STREAM_UPLOADS', 'false').lower() == 'true'
+        part_size = int(os.environ.get('UPLOAD_PART_SIZE_MB', '8')) * 1024 * 1024
+        pool_size = int(os.environ.get('HTTP_POOL_SIZE', str(DEFAULT_POOL_SIZE)))
+        engine = os.environ.get('TRANSFER_ENGINE', 'threads')
+        concurrency = int(os.environ.get('ASYNC_CONCURRENCY', str(DEFAULT_CONCURRENCY)))
+        dedup = os.environ.get('DEDUP_IMAGES', 'false').lower() == 'true'
+        derivative_formats = [fmt for fmt in os.environ.get('DERIVATIVE_FORMATS', '').split(',') if fmt] or None
+        validate = os.environ.get('VALIDATE_IMAGES', 'false').lower() == 'true'
+        strip_metadata = os.environ.get('STRIP_METADATA', 'false').lower() == 'true'
+        recompress = os.environ.get('RECOMPRESS_IMAGES', 'false').lower() == 'true'
+        incremental = os.environ.get('INCREMENTAL', 'true').lower() == 'true'
+        adaptive = os.environ.get('ADAPTIVE_CONCURRENCY', 'false').lower() == 'true'
+        queue_size = int(os.environ.get('PIPELINE_QUEUE_SIZE', str(DEFAULT_QUEUE_SIZE)))
+        page_size = int(os.environ.get('PAGE_SIZE', str(DEFAULT_PAGE_SIZE)))
+        reserve_ms = int(os.environ.get('TIME_RESERVE_SECONDS', '60')) * 1000
+        max_continuations = int(os.environ.get('MAX_CONTINUATIONS', '10'))
+        invoker = invoker or CONTINUATION_INVOKERS[os.environ.get('CONTINUATION_INVOKER', 'lambda')]
+        # A misconfigured function fails loudly instead of quietly running another engine
+        check_engine(engine, DEDUP_IMAGES=dedup, DERIVATIVE_FORMATS=derivative_formats,
+                     VALIDATE_IMAGES=validate or strip_metadata or recompress)
+
+        continuation_count = event.get('continuation_count', 0)
+        should_stop = None
+        if context is not None:
+            # Leave enough time for in-flight transfers, the JSON and the checkpoint to finish
+            should_stop = lambda: context.get_remaining_time_in_millis() < reserve_ms
+
+        # One S3 client, one set of per-host limits and one pool of transfer threads for every account,
+        # all kept for the next warm invocation
+        scheduler = get_scheduler() if adaptive else None
+        s3_client = create_s3_client(region, scheduler)
+        configure_pool(pool_size=pool_size)
+
+        accounts = load_accounts(event, s3_client)
+        usernames = ', '.join(f"@{account['username']}" for account in accounts)
+        if continuation_count:
+            print(f"Lambda continuation #{continuation_count} for {usernames}")
+        else:
+            print(f"Lambda triggered for {usernames}")
+
+        def run_account(account):
+            """Scrape and migrate one account, turning a failure into an error entry"""
+            try:
+                result = scrape_and_migrate(
+                    username=account['username'],
+                    bucket_name=account['bucket_name'],
+                    model_name=account['model_name'],
+                    apify_token=apify_token,
+                    region=region,
+                    max_posts=account['max_posts'],
+                    stream=stream,
+                    part_size=part_size,
+                    pool_size=pool_size,
+                    engine=engine,
+                    concurrency=concurrency,
+                    dedup=dedup,
+                    incremental=incremental,
+                    adaptive=adaptive,
+                    queue_size=queue_size,
+                    should_stop=should_stop,
+                    resume_from=account['continuation'],
+                    s3_client=s3_client,
+                    scheduler=scheduler,
+                    pool=pool,
+                    derivative_formats=derivative_formats,
+                    page_size=page_size,
+                    metrics_namespace=metrics_namespace,
+                    validate=validate,
+                    strip_metadata=strip_metadata,
+                    recompress=recompress
+                )
+                return {'username': account['username'], 'model_name': account['model_name'],
+                        'status': 'ok', **result}
+            except Exception as e:
+                print(f"Error for @{account['username']}: {str(e)}")
+                return {'username': account['username'], 'model_name': account['model_name'],
+                        'status': 'error', 'error': str(e)}
+
+        # Actor runs are mostly waiting on Apify, so run them side by side
+        pool = get_transfer_pool(scheduler.max_workers if scheduler else transfer_workers, queue_size)
+        with ThreadPoolExecutor(max_workers=max(1, min(account_concurrency, len(accounts)))) as executor:
+            results = list(executor.map(run_account, accounts))
+
+        unfinished = [
+            dict(account, continuation=result['continuation'])
+            for account, result in zip(accounts, results)
+            if result['status'] == 'ok' and result['continuation']
+        ]
+        if unfinished:
+            made_progress = any(result['status'] == 'ok' and result['images_successful'] + result['images_failed'] > 0
+                                for result in results)
+            if not made_progress:
+                print("No images finished in this invocation - not continuing (raise the timeout or lower TIME_RESERVE_SECONDS)")
+            elif continuation_count >= max_continuations:
+                print(f"Reached MAX_CONTINUATIONS={max_continuations} - resume later with the checkpoint")
+            else:
+                invoker({
+                    'accounts': unfinished,
+                    'continuation_count': continuation_count + 1
+                }, context)
+
+        failures = sum(1 for result in results if result['status'] == 'error')
+        if failures == len(results):
+            status_code, message = 500, 'Error during scrape and migration'
+        elif failures:
+            status_code, message = 207, f'Scrape and migration completed with {failures} failed account(s)'
+        else:
+            status_code, message = 200, 'Scrape and migration completed successfully'
+
+        timing = invocation_timing(handler_started, cold_start)
+        report_timing(timing, function_name, metrics_namespace)
         return {
-            'statusCode': 200,
+            'statusCode': status_code,
             'body': json.dumps({
-                'message': 'Scrape and migration completed successfully',
-                'result': result
+                'message': message,
+                'accounts': results,
+                'timing': timing
             })
         }
 
     except Exception as e:
         print(f"Error: {str(e)}")
+        timing = invocation_timing(handler_started, cold_start)
+        report_timing(timing, function_name, metrics_namespace)
         return {
             'statusCode': 500,
             'body': json.dumps({
                 'message': 'Error during scrape and migration',
-                'error': str(e)
+                'error': str(e),
+                'timing': timing
             })
         }
+
+# Everything above ran during the Lambda init phase
+INIT_SECONDS = time.perf_counter() - _INIT_STARTED
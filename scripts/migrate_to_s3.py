@@ -1,20 +1,38 @@
 #!/usr/bin/env python3
 """
 Script to migrate Instagram images from CDN URLs to AWS S3.
-Usage: python migrate_to_s3.py <json_file> <bucket_name> <model_name>
-Example: python migrate_to_s3.py instagram_data.json madison-morgan-instagram madison-morgan
+Usage: python migrate_to_s3.py <json_file> <bucket_name> <model_name> [region]
+       [--stream] [--part-size-mb N] [--pool-size N] [--engine threads|async] [--concurrency N]
+       [--dedup] [--hash-index PATH] [--manifest [PATH]] [--adaptive]
+       [--shards N] [--dispatch process|process:N|lambda:FUNCTION]
+Example: python migrate_to_s3.py instagram_data.json madison-morgan-instagram madison-morgan --stream
 """
 
 import json
+import time
+import tempfile
 import sys
 import os
-import requests
+import argparse
 import boto3
+from botocore.config import Config
 from urllib.parse import urlparse
 from pathlib import Path
-import hashlib
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
+from s3_transfer import stream_to_s3, content_type_for_key, DEFAULT_PART_SIZE
+from adaptive_scheduler import TransferScheduler, scheduler_slot, is_retryable_status, backoff_delay
+from http_pool import get_session, configure_pool, print_pool_stats, DEFAULT_POOL_SIZE
+from async_transfer import run_async_transfers, check_engine, DEFAULT_CONCURRENCY
+from content_store import HashIndex, dedup_transfer, DEFAULT_INDEX_PATH
+from derivatives import DerivativeBuilder
+from storage_backends import S3Backend, open_mirrors
+from image_validation import ImageValidator, StreamedImageCheck
+from shard_dispatch import open_dispatcher, run_sharded
+from task_planner import TransferPlanner, post_media, post_media_urls, rewrite_media, media_kind, fan_out
+from transfer_metrics import TransferMetrics, measure, error_status, DEFAULT_METRICS_PATH
+from sharded_output import write_sharded_json, print_output_stats, DEFAULT_PAGE_SIZE
+from migration_manifest import MigrationManifest, STATUS_DONE, STATUS_FAILED, DEFAULT_MANIFEST_PATH
 
 def get_image_extension(url):
     """Extract image extension from URL or default to jpg"""
@@ -25,73 +43,186 @@ def get_image_extension(url):
         return ext.lower()
     return '.jpg'
 
-def generate_image_key(url, model_name, post_id, image_index):
-    """Generate a unique S3 key for the image"""
-    ext = get_image_extension(url)
-    return f"{model_name}/posts/{post_id}/image_{image_index:03d}{ext}"
-
-def download_image(url, max_retries=3):
-    """Download image from URL with retries"""
+def download_image(url, max_retries=3, scheduler=None, metrics=None):
+    """Download image from URL, retrying transient failures with jittered backoff"""
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
     }
 
-    for attempt in range(max_retries):
+    with measure(metrics, 'download', url) as event:
+        for attempt in range(max_retries):
+            event.retries = attempt
+            try:
+                with scheduler_slot(scheduler, url) as slot:
+                    response = get_session().get(url, headers=headers, timeout=30)
+                    slot.status = response.status_code
+                event.status = response.status_code
+                if response.status_code == 200:
+                    event.size, event.ok = len(response.content), True
+                    return response.content
+                # 404/403 won't fix themselves - only retry throttling and server errors
+                if not is_retryable_status(response.status_code) or attempt == max_retries - 1:
+                    print(f"Failed to download {url}: Status {response.status_code}")
+                    return None
+            except Exception as e:
+                if attempt == max_retries - 1:
+                    print(f"Error downloading {url}: {e}")
+                    return None
+            time.sleep(backoff_delay(attempt))
+        return None
+
+def upload_to_s3(s3_client, bucket_name, key, image_data, scheduler=None, metrics=None, content_type=None):
+    """Upload image data to the bucket's storage backend (content_type defaults to a guess from the key extension)"""
+    backend = S3Backend(bucket_name, s3_client=s3_client)
+    with measure(metrics, 'upload', key) as event:
+        event.size = len(image_data)
         try:
-            response = requests.get(url, headers=headers, timeout=30)
-            if response.status_code == 200:
-                return response.content
-            else:
-                print(f"Failed to download {url}: Status {response.status_code}")
+            response = backend.put(key, image_data, scheduler, content_type)
+            event.status, event.ok = 200, True
+            event.retries = response['ResponseMetadata'].get('RetryAttempts', 0)
+            return True
         except Exception as e:
-            if attempt == max_retries - 1:
-                print(f"Error downloading {url}: {e}")
-                return None
-    return None
-
-def upload_to_s3(s3_client, bucket_name, key, image_data):
-    """Upload image data to S3"""
-    try:
-        content_type = 'image/jpeg'
-        if key.endswith('.png'):
-            content_type = 'image/png'
-        elif key.endswith('.webp'):
-            content_type = 'image/webp'
-
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=key,
-            Body=image_data,
-            ContentType=content_type,
-            CacheControl='public, max-age=31536000'
-        )
-        return True
-    except Exception as e:
-        print(f"Error uploading to S3 {key}: {e}")
-        return False
+            event.status = error_status(e)
+            print(f"Error uploading to S3 {key}: {e}")
+            return False
 
 def process_image(args):
     """Process a single image: download and upload to S3"""
-    url, s3_client, bucket_name, s3_key, region = args
+    url, s3_client, bucket_name, s3_key, region, options = args
+    manifest = options.get('manifest')
+    scheduler = options.get('scheduler')
+    derivatives = options.get('derivatives')
+    metrics = options.get('metrics')
+    mirrors = options.get('mirrors')
+    validator = options.get('validator')
+    kind = media_kind(s3_key)
+    if kind != 'image':
+        # Videos and commenters' profile pictures get no viewer variants and no mirror copies
+        derivatives = mirrors = None
 
-    # Download image
-    image_data = download_image(url)
-    if not image_data:
-        return None, None
+    if kind == 'video':
+        # Videos can be hundreds of MB: always stream them into a multipart upload, whatever the mode
+        size = stream_to_s3(url, s3_client, bucket_name, s3_key, part_size=options['part_size'],
+                            scheduler=scheduler, metrics=metrics)
+        stored_key = s3_key if size is not None else None
+    elif options.get('hash_index') is not None:
+        # Content-addressed mode: hash the bytes and only upload digests the index hasn't seen
+        stored_key, size = dedup_transfer(url, s3_client, bucket_name, options['model_name'],
+                                          get_image_extension(url), options['hash_index'], options['part_size'],
+                                          scheduler=scheduler, derivatives=derivatives, region=region,
+                                          metrics=metrics, mirrors=mirrors, mirror_key=s3_key,
+                                          validator=validator)
+    elif options.get('stream'):
+        # Streaming mode: pipe the response into a multipart upload, never holding the whole image
+        # Validation, derivatives and mirrors need the whole image, so tee it into a spool that spills to disk
+        # past one part
+        needs_bytes = validator is not None or derivatives is not None or mirrors is not None
+        tee = tempfile.SpooledTemporaryFile(max_size=options['part_size']) if needs_bytes else None
+        check = StreamedImageCheck(validator, url, tee, content_type_for_key(s3_key)) \
+            if validator is not None else None
+        size = stream_to_s3(url, s3_client, bucket_name, s3_key, part_size=options['part_size'],
+                            scheduler=scheduler, tee=tee, metrics=metrics, accept=check)
+        stored_key = s3_key if size is not None else None
+        content_type = None
+        if check is not None and check.result is not None:
+            image_data, content_type = check.result
+            # The validator changed the bytes or the Content-Type, so the stream was discarded for its version
+            if check.rewritten and upload_to_s3(s3_client, bucket_name, s3_key, image_data, scheduler=scheduler,
+                                                metrics=metrics, content_type=content_type):
+                stored_key, size = s3_key, len(image_data)
+        elif stored_key and tee is not None:
+            tee.seek(0)
+            image_data = tee.read()
+        if stored_key and tee is not None:
+            if derivatives is not None:
+                derivatives.process(url, image_data, s3_client, bucket_name, stored_key, region, scheduler)
+            if mirrors is not None:
+                mirrors.put(s3_key, image_data, scheduler, content_type)
+        if tee is not None:
+            tee.close()
+    else:
+        # Download image, then upload to S3
+        stored_key, size = None, None
+        content_type = None
+        image_data = download_image(url, scheduler=scheduler, metrics=metrics)
+        if image_data and validator is not None:
+            checked = validator.check(url, image_data, content_type_for_key(s3_key))
+            image_data, content_type = checked if checked else (None, None)
+        if image_data and upload_to_s3(s3_client, bucket_name, s3_key, image_data, scheduler=scheduler,
+                                       metrics=metrics, content_type=content_type):
+            stored_key, size = s3_key, len(image_data)
+            if derivatives is not None:
+                derivatives.process(url, image_data, s3_client, bucket_name, stored_key, region, scheduler)
+            if mirrors is not None:
+                mirrors.put(s3_key, image_data, scheduler, content_type)
 
-    # Upload to S3
-    if upload_to_s3(s3_client, bucket_name, s3_key, image_data):
-        # Generate S3 URL
-        s3_url = f"https://{bucket_name}.s3.{region}.amazonaws.com/{s3_key}"
-        return url, s3_url
+    if manifest is not None:
+        manifest.record(s3_key, url, stored_key, size, STATUS_DONE if stored_key else STATUS_FAILED,
+                        derivatives=derivatives.get(url) if derivatives is not None else None)
 
-    return None, None
+    if stored_key is None:
+        return None, None
+    return url, f"https://{bucket_name}.s3.{region}.amazonaws.com/{stored_key}"
+
+def migrate_instagram_to_s3(json_file, bucket_name, model_name, region='us-east-2', max_workers=10,
+                            stream=False, part_size=DEFAULT_PART_SIZE, pool_size=DEFAULT_POOL_SIZE,
+                            engine='threads', concurrency=DEFAULT_CONCURRENCY, dedup=False,
+                            hash_index_path=DEFAULT_INDEX_PATH, manifest_path=None, adaptive=False,
+                            derivative_formats=None, page_size=DEFAULT_PAGE_SIZE, metrics_path=None,
+                            mirror_targets=None, validate=False, strip_metadata=False,
+                            recompress=False, shards=0, dispatch='process'):
+    """
+    Main function to migrate Instagram images to S3
 
-def migrate_instagram_to_s3(json_file, bucket_name, model_name, region='us-east-2', max_workers=10):
-    """Main function to migrate Instagram images to S3"""
+    Args:
+        stream: Pipe downloads straight into multipart uploads instead of buffering whole images
+        part_size: Multipart part size in bytes when streaming (bounds memory per transfer)
+        pool_size: Keep-alive connections kept per host in each worker's HTTP session
+        engine: 'threads' (ThreadPoolExecutor) or 'async' (asyncio + aiohttp/aiobotocore)
+        concurrency: Transfers in flight at once with the async engine
+        dedup: Store images content-addressed ({model}/images/<sha256>) and upload each unique image once
+        hash_index_path: Local path or s3://bucket/key of the digest index used by dedup
+        manifest_path: Local path or s3://bucket/key of a migration manifest. When set, images a
+                       previous run already stored are skipped and an interrupted run resumes.
+        adaptive: Let per-host AIMD limiters pick the concurrency instead of max_workers
+        derivative_formats: Formats (e.g. ['webp']) to render thumb/medium copies in for the viewer;
+                            None skips derivatives
+        page_size: Posts per page shard of the paginated output written next to the JSON
+        metrics_path: JSON lines file receiving one event per download/upload plus a per-stage summary
+        mirror_targets: Extra storage targets (e.g. ['comfyui:/workspace/model/input_images']) that get
+                        every image in the same pass; see storage_backends
+        validate: Check every download decodes (rejecting HTML error pages and truncated bodies) and set
+                  ContentType from the actual format; runs in a process pool
+        strip_metadata: Also drop EXIF/XMP/IPTC metadata before storing (implies validate)
+        recompress: Also re-compress losslessly, keeping the result only when smaller (implies validate)
+        shards: Split the transfers into this many shards run in parallel by the dispatcher (0 or 1: no sharding)
+        dispatch: Where shards run - 'process', 'process:N' (at most N at a time) or 'lambda:FUNCTION_NAME';
+                  see shard_dispatch
+    """
+    validate = validate or strip_metadata or recompress
+    check_engine(engine, dedup=dedup, derivatives=derivative_formats, mirrors=mirror_targets, validation=validate,
+                 shards=shards > 1)
 
     # Initialize S3 client
-    s3_client = boto3.client('s3', region_name=region)
+    scheduler = TransferScheduler() if adaptive else None
+    if scheduler is not None:
+        # botocore's adaptive retry mode adds client-side rate limiting when S3 says SlowDown
+        s3_config = Config(retries={'mode': 'adaptive', 'max_attempts': 10},
+                           max_pool_connections=scheduler.host_limits['s3']['max'])
+        s3_client = boto3.client('s3', region_name=region, config=s3_config)
+    else:
+        s3_client = boto3.client('s3', region_name=region)
+    configure_pool(pool_size=pool_size)
+    hash_index = HashIndex(hash_index_path, s3_client) if dedup else None
+    manifest = MigrationManifest(manifest_path, s3_client) if manifest_path else None
+    derivatives = DerivativeBuilder(derivative_formats) if derivative_formats else None
+    metrics = TransferMetrics(metrics_path)
+    mirrors = open_mirrors(mirror_targets, region)
+    validator = ImageValidator(strip_metadata, recompress) if validate else None
+    transfer_options = {'stream': stream, 'part_size': part_size, 'hash_index': hash_index,
+                        'model_name': model_name, 'manifest': manifest, 'scheduler': scheduler,
+                        'derivatives': derivatives, 'metrics': metrics, 'mirrors': mirrors,
+                        'validator': validator}
 
     # Read JSON file
     print(f"Reading {json_file}...")
@@ -100,72 +231,187 @@ def migrate_instagram_to_s3(json_file, bucket_name, model_name, region='us-east-
 
     print(f"Found {len(posts)} posts")
 
-    # Collect all images to process
+    # Collect every media URL to process: images, videos, carousel children and commenters' profile pictures
     image_tasks = []
-    url_to_post_map = {}  # Map URL to (post_index, image_index, field_name)
 
-    for post_idx, post in enumerate(posts):
-        # Process displayUrl
-        if 'displayUrl' in post and post['displayUrl']:
-            s3_key = generate_image_key(post['displayUrl'], model_name, post['id'], 0)
-            image_tasks.append((post['displayUrl'], s3_client, bucket_name, s3_key, region))
-            url_to_post_map[post['displayUrl']] = (post_idx, 0, 'displayUrl')
+    for post in posts:
+        for container, field, key in post_media(post, post['id']):
+            s3_key = f"{model_name}/{key}"
+            image_tasks.append((container[field], s3_client, bucket_name, s3_key, region, transfer_options))
+
+    # displayUrl is usually images[0] - transfer each distinct image once
+    planner = TransferPlanner()
+    image_tasks = planner.plan(image_tasks)
+    planner.print_plan()
 
-        # Process images array
-        if 'images' in post and post['images']:
-            for img_idx, img_url in enumerate(post['images']):
-                s3_key = generate_image_key(img_url, model_name, post['id'], img_idx)
-                image_tasks.append((img_url, s3_client, bucket_name, s3_key, region))
-                url_to_post_map[img_url] = (post_idx, img_idx, 'images')
+    url_mapping = {}
+    total_images = len(image_tasks)
+
+    # Skip images a previous (or interrupted) run already stored
+    if manifest is not None:
+        manifest.seed_from_bucket(bucket_name, f"{model_name}/")
+        if derivatives is not None:
+            derivatives.adopt(manifest, image_tasks)
+        image_tasks, done = manifest.schedule(image_tasks)
+        for old_url, stored_key in done:
+            url_mapping[old_url] = f"https://{bucket_name}.s3.{region}.amazonaws.com/{stored_key}"
+        print(f"Skipping {len(done)} images already migrated")
 
-    print(f"Processing {len(image_tasks)} images...")
+    dispatcher = open_dispatcher(dispatch, process_image, region) if shards > 1 else None
+    mode = f"async, {concurrency} in flight" if engine == 'async' else ('streaming' if stream else 'threads')
+    if dispatcher is not None:
+        mode = f"{mode}, {shards} shards"
+    print(f"Processing {len(image_tasks)} images ({mode})...")
 
     # Process images in parallel
-    url_mapping = {}
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(process_image, task) for task in image_tasks]
+    try:
+        if dispatcher is not None:
+            # Each shard runs the threads path below with its own clients and reports back here
+            shard_spec = {'bucket_name': bucket_name, 'region': region, 'model_name': model_name,
+                          'stream': stream, 'part_size': part_size, 'pool_size': pool_size,
+                          'max_workers': max_workers, 'adaptive': adaptive,
+                          'hash_index_path': hash_index_path if dedup else None,
+                          'derivative_formats': derivative_formats, 'mirror_targets': mirror_targets,
+                          'validate': validate, 'strip_metadata': strip_metadata, 'recompress': recompress}
+            results = run_sharded(dispatcher, image_tasks, shards, shard_spec)
+        elif engine == 'async':
+            with tqdm(total=len(image_tasks), desc="Uploading images") as pbar:
+                results = run_async_transfers(
+                    [(task[0], task[3]) for task in image_tasks], bucket_name, region,
+                    concurrency=concurrency, on_complete=lambda result: pbar.update(), manifest=manifest,
+                    metrics=metrics, scheduler=scheduler
+                )
+        else:
+            with ThreadPoolExecutor(max_workers=scheduler.max_workers if scheduler else max_workers) as executor:
+                futures = [executor.submit(process_image, task) for task in image_tasks]
+                results = [future.result() for future in tqdm(as_completed(futures), total=len(futures), desc="Uploading images")]
+    finally:
+        # Persist progress even if the run is interrupted, so the next run resumes here
+        if manifest is not None:
+            manifest.save()
+        if derivatives is not None:
+            derivatives.close()
+        if validator is not None:
+            validator.close()
+        metrics.close()
+
+    for old_url, new_url in results:
+        if old_url and new_url:
+            url_mapping[old_url] = new_url
 
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Uploading images"):
-            old_url, new_url = future.result()
-            if old_url and new_url:
-                url_mapping[old_url] = new_url
+    if hash_index is not None:
+        hash_index.save()
+        hash_index.print_stats()
+    if validator is not None:
+        validator.print_stats()
+    if derivatives is not None:
+        derivatives.print_stats()
+
+    # Point every duplicate reference at the copy that was transferred
+    referenced_urls = [url for post in posts for url in post_media_urls(post)]
+    fan_out(url_mapping, referenced_urls)
+    if derivatives is not None:
+        fan_out(derivatives.variants, referenced_urls)
 
     # Update posts with S3 URLs
     print("Updating JSON with S3 URLs...")
     for post in posts:
-        if 'displayUrl' in post and post['displayUrl'] in url_mapping:
-            post['displayUrl'] = url_mapping[post['displayUrl']]
+        if derivatives is not None:
+            derivatives.annotate(post)
 
-        if 'images' in post and post['images']:
-            post['images'] = [
-                url_mapping.get(url, url) for url in post['images']
-            ]
+        rewrite_media(post, url_mapping)
 
     # Save updated JSON
     output_file = json_file.replace('.json', '_s3.json')
     print(f"Saving updated JSON to {output_file}...")
     with open(output_file, 'w') as f:
-        json.dump(posts, f, indent=2)
+        json.dump(posts, f, separators=(',', ':'))
+    output_dir = output_file[:-len('.json')]
+    index = write_sharded_json(posts, output_dir, page_size=page_size)
 
     print(f"\n✅ Migration complete!")
-    print(f"   - Processed: {len(image_tasks)} images")
+    print(f"   - Processed: {total_images} images ({total_images - len(image_tasks)} already migrated)")
     print(f"   - Uploaded: {len(url_mapping)} images successfully")
     print(f"   - Updated JSON saved to: {output_file}")
+    print_output_stats(index, output_dir)
+    if mirrors is not None:
+        mirrors.print_stats()
+    metrics.print_summary()
+    print_pool_stats()
+    if scheduler is not None:
+        scheduler.print_stats()
     print(f"\nS3 Bucket: https://s3.console.aws.amazon.com/s3/buckets/{bucket_name}")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        print("Usage: python migrate_to_s3.py <json_file> <bucket_name> <model_name> [region]")
-        print("Example: python migrate_to_s3.py instagram_data.json madison-morgan-instagram madison-morgan")
-        sys.exit(1)
-
-    json_file = sys.argv[1]
-    bucket_name = sys.argv[2]
-    model_name = sys.argv[3]
-    region = sys.argv[4] if len(sys.argv) > 4 else 'us-east-2'
+    parser = argparse.ArgumentParser(description="Migrate Instagram images from CDN URLs to AWS S3")
+    parser.add_argument('json_file')
+    parser.add_argument('bucket_name')
+    parser.add_argument('model_name')
+    parser.add_argument('region', nargs='?', default='us-east-2')
+    parser.add_argument('--workers', type=int, default=10, help="Parallel transfers (default: 10)")
+    parser.add_argument('--stream', action='store_true',
+                        help="Stream downloads into S3 multipart uploads instead of buffering whole images")
+    parser.add_argument('--part-size-mb', type=int, default=DEFAULT_PART_SIZE // (1024 * 1024),
+                        help="Multipart part size in MB when streaming (min 5, default: 8)")
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help="Keep-alive connections per host per worker session (default: 10)")
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads',
+                        help="Transfer engine: thread pool or asyncio (default: threads)")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Transfers in flight with --engine async (default: 200)")
+    parser.add_argument('--dedup', action='store_true',
+                        help="Content-addressed layout: upload each unique image once, reference it from every post")
+    parser.add_argument('--hash-index', default=DEFAULT_INDEX_PATH,
+                        help=f"Digest index for --dedup, local path or s3://bucket/key (default: {DEFAULT_INDEX_PATH})")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="AIMD per-host concurrency (Instagram CDN / Shopify CDN / S3) with jittered backoff "
+                             "on throttling, instead of a fixed worker count")
+    parser.add_argument('--manifest', nargs='?', const=DEFAULT_MANIFEST_PATH, default=None,
+                        help=f"Resume/skip already-migrated images using a manifest, local path or "
+                             f"s3://bucket/key (default when given without a value: {DEFAULT_MANIFEST_PATH})")
+    parser.add_argument('--derivatives', nargs='?', const='webp', default=None, metavar='FORMATS',
+                        help="Also upload resized thumb/medium copies for the viewer, comma-separated formats "
+                             "(default when given without a value: webp; e.g. webp,avif). Needs Pillow")
+    parser.add_argument('--metrics', nargs='?', const=DEFAULT_METRICS_PATH, default=None, metavar='PATH',
+                        help=f"Append per-transfer latency/bytes/status events and a per-stage summary as JSON lines "
+                             f"(default when given without a value: {DEFAULT_METRICS_PATH})")
+    parser.add_argument('--mirror', action='append', default=None, metavar='TARGET',
+                        help="Also write every image to TARGET (repeatable): comfyui:/path/to/input_images for a flat "
+                             "ComfyUI input folder, file:/path, s3://bucket or s3+https://host/bucket?profile=name")
+    parser.add_argument('--validate', action='store_true',
+                        help="Reject downloads that don't decode (HTML error pages, truncated bodies) and set "
+                             "ContentType from the actual image format")
+    parser.add_argument('--strip-metadata', action='store_true',
+                        help="Drop EXIF/XMP/IPTC metadata before storing (implies --validate)")
+    parser.add_argument('--recompress', action='store_true',
+                        help="Re-compress losslessly (PNG optimize, jpegtran for JPEG) when smaller "
+                             "(implies --validate)")
+    parser.add_argument('--shards', type=int, default=0,
+                        help="Split the transfers into N shards run in parallel (worker processes or Lambda "
+                             "invocations, see --dispatch) and merge their results")
+    parser.add_argument('--dispatch', default='process', metavar='TARGET',
+                        help="Where --shards run: process (one worker process each), process:N (at most N at a "
+                             "time) or lambda:FUNCTION_NAME (default: process)")
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f"Posts per page shard written next to the output JSON (default: {DEFAULT_PAGE_SIZE})")
+    args = parser.parse_args()
+    try:
+        check_engine(args.engine, dedup=args.dedup, derivatives=args.derivatives, mirrors=args.mirror,
+                     validation=args.validate or args.strip_metadata or args.recompress, shards=args.shards > 1)
+    except ValueError as e:
+        parser.error(f"{e} (drop --engine async or the option)")
 
-    if not os.path.exists(json_file):
-        print(f"Error: {json_file} not found")
+    if not os.path.exists(args.json_file):
+        print(f"Error: {args.json_file} not found")
         sys.exit(1)
 
-    migrate_instagram_to_s3(json_file, bucket_name, model_name, region)
+    migrate_instagram_to_s3(args.json_file, args.bucket_name, args.model_name, args.region,
+                            max_workers=args.workers, stream=args.stream,
+                            part_size=args.part_size_mb * 1024 * 1024, pool_size=args.pool_size,
+                            engine=args.engine, concurrency=args.concurrency, dedup=args.dedup,
+                            hash_index_path=args.hash_index, manifest_path=args.manifest,
+                            adaptive=args.adaptive,
+                            derivative_formats=args.derivatives.split(',') if args.derivatives else None,
+                            page_size=args.page_size, metrics_path=args.metrics, mirror_targets=args.mirror,
+                            validate=args.validate, strip_metadata=args.strip_metadata, recompress=args.recompress,
+                            shards=args.shards, dispatch=args.dispatch)
@@ -0,0 +1,130 @@
+"""
+Persisted manifest for resumable, incremental S3 migrations.
+
+Every image task is identified by its logical key - the per-post key from
+task_planner.post_media(), e.g. madison-morgan/posts/<post_id>/image_000.jpg -
+and the manifest records its source URL, post ID, the S3 key actually
+holding the bytes (differs in --dedup mode), size and status.
+
+The manifest lives in a local JSON file or an object in the bucket. It is
+seeded in bulk from a paginated ListObjectsV2 of the model prefix (one call
+per 1000 keys instead of a HEAD per image) and checkpointed while the run
+is in progress, so an interrupted run picks up where it stopped and daily
+runs only schedule new or failed images.
+"""
+
+import threading
+from datetime import datetime, timezone
+from s3_transfer import load_json, save_json
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+DEFAULT_MANIFEST_PATH = 's3_migration_manifest.json'
+CHECKPOINT_EVERY = 25
+
+class MigrationManifest:
+    """Thread-safe record of migrated images keyed by logical S3 key"""
+
+    def __init__(self, location, s3_client=None, checkpoint_every=CHECKPOINT_EVERY):
+        self.location = location
+        self.s3_client = s3_client
+        self.checkpoint_every = checkpoint_every
+        self.items = load_json(location, s3_client, default={}).get('items', {})
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def seed_from_bucket(self, bucket_name, prefix):
+        """
+        Reconcile the manifest with what is actually in the bucket
+
+        Keys found under prefix that the manifest doesn't know about are
+        adopted as done; manifest entries whose object has disappeared are
+        marked failed so they get re-scheduled.
+        """
+        existing = {}
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                existing[obj['Key']] = obj['Size']
+
+        adopted = 0
+        missing = 0
+        with self._lock:
+            for key, size in existing.items():
+                if '/posts/' in key and key not in self.items:
+                    self.items[key] = {
+                        'url': None,
+                        'post_id': key.split('/')[-2],
+                        's3_key': key,
+                        'size': size,
+                        'status': STATUS_DONE
+                    }
+                    adopted += 1
+            for entry in self.items.values():
+                if entry['status'] == STATUS_DONE and entry['s3_key'] not in existing:
+                    entry['status'] = STATUS_FAILED
+                    missing += 1
+
+        print(f"📒 Manifest: {len(existing)} objects listed in s3://{bucket_name}/{prefix} "
+              f"({adopted} adopted, {missing} missing)")
+
+    def completed(self, logical_key):
+        """Return the manifest entry if this image is already migrated, else None"""
+        with self._lock:
+            entry = self.items.get(logical_key)
+        if entry and entry['status'] == STATUS_DONE:
+            return entry
+        return None
+
+    def schedule(self, image_tasks):
+        """
+        Split process_image task tuples into work still to do and work already done
+
+        Returns:
+            (pending_tasks, done) where done is a list of (source_url, stored_s3_key)
+        """
+        pending_tasks = []
+        done = []
+        for task in image_tasks:
+            url, logical_key = task[0], task[3]
+            entry = self.completed(logical_key)
+            if entry:
+                done.append((url, entry['s3_key']))
+            else:
+                pending_tasks.append(task)
+        return pending_tasks, done
+
+    def record(self, logical_key, url, s3_key, size, status, derivatives=None):
+        """Record a transfer outcome, checkpointing every few records"""
+        with self._lock:
+            self.items[logical_key] = {
+                'url': url,
+                'post_id': logical_key.split('/')[-2],
+                's3_key': s3_key,
+                'size': size,
+                'status': status,
+                'updated_at': datetime.now(timezone.utc).isoformat()
+            }
+            if derivatives:
+                self.items[logical_key]['derivatives'] = derivatives
+            self._unsaved += 1
+            checkpoint = self._unsaved >= self.checkpoint_every
+        if checkpoint:
+            self.save()
+
+    def save(self):
+        with self._save_lock:
+            with self._lock:
+                data = {'items': dict(self.items)}
+                self._unsaved = 0
+            save_json(self.location, data, self.s3_client)
+
+    def summary(self):
+        with self._lock:
+            statuses = [entry['status'] for entry in self.items.values()]
+        return {
+            'done': statuses.count(STATUS_DONE),
+            'failed': statuses.count(STATUS_FAILED)
+        }
@@ -0,0 +1,206 @@
+"""
+Streaming CDN → S3 transfers shared by the migration scripts.
+
+Response chunks are piped straight into an S3 multipart upload, so each
+in-flight transfer holds at most one part in memory no matter how large
+the source object is. Objects smaller than one part go up as a single PUT.
+An accept hook can look at the whole object (via a tee) before the PUT or the
+multipart completion, and discard it instead.
+
+Also holds small JSON helpers for state files (indexes, manifests) that may
+live either on local disk or as an object in the bucket.
+"""
+
+import json
+import os
+import time
+from http_pool import get_session
+from adaptive_scheduler import scheduler_slot, is_retryable_status, backoff_delay
+from transfer_metrics import measure, error_status
+
+# S3 rejects multipart parts smaller than 5 MB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+}
+
+def content_type_for_key(key):
+    """Guess the Content-Type from the S3 key extension"""
+    if key.endswith('.png'):
+        return 'image/png'
+    elif key.endswith('.webp'):
+        return 'image/webp'
+    elif key.endswith('.avif'):
+        return 'image/avif'
+    elif key.endswith('.mp4'):
+        return 'video/mp4'
+    return 'image/jpeg'
+
+def is_retryable_error(error):
+    """False for HTTP errors with a permanent status (404, 403, ...), True otherwise"""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    return status is None or is_retryable_status(status)
+
+class _Discarded(Exception):
+    """The accept hook turned the streamed object down"""
+
+def _upload_part(s3_client, bucket_name, key, upload_id, part_number, body):
+    """Upload one multipart part and return its completion record"""
+    response = s3_client.upload_part(
+        Bucket=bucket_name,
+        Key=key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=body
+    )
+    return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+def _stream_once(url, s3_client, bucket_name, key, part_size, headers, scheduler, tee, accept):
+    """Single streaming attempt. Returns bytes uploaded, raises on any failure"""
+    content_type = content_type_for_key(key)
+    upload_id = None
+    parts = []
+    buffer = bytearray()
+    total = 0
+
+    # Download and upload are interleaved, so hold a CDN slot and an S3 slot for the whole transfer
+    with scheduler_slot(scheduler, url) as slot, scheduler_slot(scheduler, 's3'), \
+            get_session().get(url, headers=headers, timeout=30, stream=True) as response:
+        slot.status = response.status_code
+        response.raise_for_status()
+
+        try:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                buffer.extend(chunk)
+                total += len(chunk)
+                if tee is not None:
+                    tee.write(chunk)
+
+                if len(buffer) >= part_size:
+                    if upload_id is None:
+                        upload_id = s3_client.create_multipart_upload(
+                            Bucket=bucket_name,
+                            Key=key,
+                            ContentType=content_type,
+                            CacheControl='public, max-age=31536000'
+                        )['UploadId']
+                    parts.append(_upload_part(s3_client, bucket_name, key, upload_id,
+                                              len(parts) + 1, bytes(buffer)))
+                    buffer.clear()
+
+            if accept is not None and not accept():
+                raise _Discarded()
+
+            if upload_id is None:
+                # Whole object fit in one part - a plain PUT is cheaper
+                s3_client.put_object(
+                    Bucket=bucket_name,
+                    Key=key,
+                    Body=bytes(buffer),
+                    ContentType=content_type,
+                    CacheControl='public, max-age=31536000'
+                )
+                return total
+
+            if buffer:
+                parts.append(_upload_part(s3_client, bucket_name, key, upload_id,
+                                          len(parts) + 1, bytes(buffer)))
+                buffer.clear()
+
+            s3_client.complete_multipart_upload(
+                Bucket=bucket_name,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+            return total
+
+        except Exception:
+            if upload_id is not None:
+                # Don't leave orphaned parts behind (they are billed until aborted)
+                try:
+                    s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+                except Exception:
+                    pass
+            raise
+
+def stream_to_s3(url, s3_client, bucket_name, key, part_size=DEFAULT_PART_SIZE, max_retries=3, headers=None,
+                 scheduler=None, tee=None, metrics=None, accept=None):
+    """
+    Stream an image/video from url into s3://bucket_name/key
+
+    Args:
+        part_size: Multipart part size in bytes (clamped to the 5 MB S3 minimum).
+                   Peak memory per transfer is roughly one part.
+        scheduler: Optional TransferScheduler gating CDN and S3 concurrency
+        tee: Optional seekable file that also receives every byte (rewound on retry)
+        accept: Optional callable run once the whole object is in tee, before it is committed;
+                returning False aborts the upload and stream_to_s3 returns None without retrying
+        metrics: Optional TransferMetrics recording the transfer as one 'stream' event
+
+    Returns:
+        Number of bytes uploaded, or None if every attempt failed
+    """
+    part_size = max(part_size, MIN_PART_SIZE)
+    headers = headers or DEFAULT_HEADERS
+
+    with measure(metrics, 'stream', url) as event:
+        for attempt in range(max_retries):
+            event.retries = attempt
+            if tee is not None:
+                tee.seek(0)
+                tee.truncate()
+            try:
+                event.size = _stream_once(url, s3_client, bucket_name, key, part_size, headers, scheduler, tee,
+                                          accept)
+                event.status, event.ok = 200, True
+                return event.size
+            except _Discarded:
+                return None
+            except Exception as e:
+                event.status = error_status(e)
+                if attempt == max_retries - 1 or not is_retryable_error(e):
+                    print(f"❌ Error streaming {url} to S3 {key}: {e}")
+                    return None
+            time.sleep(backoff_delay(attempt))
+        return None
+
+def _split_s3_uri(location):
+    """'s3://bucket/key' -> ('bucket', 'key')"""
+    bucket_name, _, key = location[len('s3://'):].partition('/')
+    return bucket_name, key
+
+def load_json(location, s3_client=None, default=None):
+    """Read JSON from a local path or s3://bucket/key, returning default if it doesn't exist"""
+    try:
+        if location.startswith('s3://'):
+            bucket_name, key = _split_s3_uri(location)
+            body = s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read()
+            return json.loads(body)
+        with open(location, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except Exception as e:
+        # botocore ClientError - a missing object just means "nothing saved yet"
+        error_code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+        if error_code in ('NoSuchKey', '404'):
+            return default
+        raise
+
+def save_json(location, data, s3_client=None):
+    """Write JSON to a local path or s3://bucket/key"""
+    body = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+    if location.startswith('s3://'):
+        bucket_name, key = _split_s3_uri(location)
+        s3_client.put_object(Bucket=bucket_name, Key=key, Body=body.encode('utf-8'),
+                             ContentType='application/json')
+        return
+    tmp_path = f"{location}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(body)
+    os.replace(tmp_path, location)
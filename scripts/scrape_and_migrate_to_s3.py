@@ -6,13 +6,30 @@ Processes images immediately to avoid URL expiration
 
 import os
 import json
-import requests
+import time
+import tempfile
+from itertools import chain
 import boto3
+from botocore.config import Config
 from dotenv import load_dotenv
 from apify_client import ApifyClient
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from urllib.parse import urlparse
+from s3_transfer import stream_to_s3, content_type_for_key, load_json, DEFAULT_PART_SIZE
+from adaptive_scheduler import TransferScheduler, scheduler_slot, is_retryable_status, backoff_delay
+from http_pool import get_session, configure_pool, print_pool_stats, DEFAULT_POOL_SIZE
+from async_transfer import run_async_transfers, check_engine, DEFAULT_CONCURRENCY
+from transfer_pipeline import run_pipeline, DEFAULT_QUEUE_SIZE
+from content_store import HashIndex, dedup_transfer, DEFAULT_INDEX_PATH
+from derivatives import DerivativeBuilder
+from storage_backends import S3Backend, open_mirrors
+from image_validation import ImageValidator, StreamedImageCheck
+from task_planner import TransferPlanner, post_media, post_media_urls, rewrite_media, media_kind, fan_out
+from transfer_metrics import TransferMetrics, measure, error_status, DEFAULT_METRICS_PATH
+from sharded_output import write_sharded_json, print_output_stats, DEFAULT_PAGE_SIZE
+from apify_runs import apify_client_url
+from migration_manifest import MigrationManifest, STATUS_DONE, STATUS_FAILED, DEFAULT_MANIFEST_PATH
+from scrape_state import ScrapeState, merge_posts, DEFAULT_STATE_PATH
 
 # Load environment variables
 load_dotenv('.env.local')
@@ -26,77 +43,191 @@ def get_image_extension(url):
         return ext.lower()
     return '.jpg'
 
-def generate_image_key(url, model_name, post_id, image_index):
-    """Generate a unique S3 key for the image"""
-    ext = get_image_extension(url)
-    return f"{model_name}/posts/{post_id}/image_{image_index:03d}{ext}"
-
-def download_image(url, max_retries=3):
-    """Download image from URL with retries"""
+def download_image(url, max_retries=3, scheduler=None, metrics=None):
+    """Download image from URL, retrying transient failures with jittered backoff"""
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
     }
 
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=30)
-            if response.status_code == 200:
-                return response.content
-            else:
-                if attempt == max_retries - 1:
+    with measure(metrics, 'download', url) as event:
+        for attempt in range(max_retries):
+            event.retries = attempt
+            try:
+                with scheduler_slot(scheduler, url) as slot:
+                    response = get_session().get(url, headers=headers, timeout=30)
+                    slot.status = response.status_code
+                event.status = response.status_code
+                if response.status_code == 200:
+                    event.size, event.ok = len(response.content), True
+                    return response.content
+                # 404/403 won't fix themselves - only retry throttling and server errors
+                if not is_retryable_status(response.status_code) or attempt == max_retries - 1:
                     print(f"❌ Failed to download {url}: Status {response.status_code}")
+                    return None
+            except Exception as e:
+                if attempt == max_retries - 1:
+                    print(f"❌ Error downloading {url}: {e}")
+                    return None
+            time.sleep(backoff_delay(attempt))
+        return None
+
+def upload_to_s3(s3_client, bucket_name, key, image_data, scheduler=None, metrics=None, content_type=None):
+    """Upload image data to the bucket's storage backend (content_type defaults to a guess from the key extension)"""
+    backend = S3Backend(bucket_name, s3_client=s3_client)
+    with measure(metrics, 'upload', key) as event:
+        event.size = len(image_data)
+        try:
+            response = backend.put(key, image_data, scheduler, content_type)
+            event.status, event.ok = 200, True
+            event.retries = response['ResponseMetadata'].get('RetryAttempts', 0)
+            return True
         except Exception as e:
-            if attempt == max_retries - 1:
-                print(f"❌ Error downloading {url}: {e}")
-    return None
-
-def upload_to_s3(s3_client, bucket_name, key, image_data):
-    """Upload image data to S3"""
-    try:
-        content_type = 'image/jpeg'
-        if key.endswith('.png'):
-            content_type = 'image/png'
-        elif key.endswith('.webp'):
-            content_type = 'image/webp'
-
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=key,
-            Body=image_data,
-            ContentType=content_type,
-            CacheControl='public, max-age=31536000'
-        )
-        return True
-    except Exception as e:
-        print(f"❌ Error uploading to S3 {key}: {e}")
-        return False
+            event.status = error_status(e)
+            print(f"❌ Error uploading to S3 {key}: {e}")
+            return False
 
 def process_image(args):
     """Process a single image: download and upload to S3"""
-    url, s3_client, bucket_name, s3_key, region = args
-
-    # Download image immediately
-    image_data = download_image(url)
-    if not image_data:
+    url, s3_client, bucket_name, s3_key, region, options = args
+    manifest = options.get('manifest')
+    scheduler = options.get('scheduler')
+    derivatives = options.get('derivatives')
+    metrics = options.get('metrics')
+    mirrors = options.get('mirrors')
+    validator = options.get('validator')
+    kind = media_kind(s3_key)
+    if kind != 'image':
+        # Videos and commenters' profile pictures get no viewer variants and no mirror copies
+        derivatives = mirrors = None
+
+    if kind == 'video':
+        # Videos can be hundreds of MB: always stream them into a multipart upload, whatever the mode
+        size = stream_to_s3(url, s3_client, bucket_name, s3_key, part_size=options['part_size'],
+                            scheduler=scheduler, metrics=metrics)
+        stored_key = s3_key if size is not None else None
+    elif options.get('hash_index') is not None:
+        # Content-addressed mode: hash the bytes and only upload digests the index hasn't seen
+        stored_key, size = dedup_transfer(url, s3_client, bucket_name, options['model_name'],
+                                          get_image_extension(url), options['hash_index'], options['part_size'],
+                                          scheduler=scheduler, derivatives=derivatives, region=region,
+                                          metrics=metrics, mirrors=mirrors, mirror_key=s3_key,
+                                          validator=validator)
+    elif options.get('stream'):
+        # Streaming mode: pipe the response into a multipart upload, never holding the whole image
+        # Validation, derivatives and mirrors need the whole image, so tee it into a spool that spills to disk
+        # past one part
+        needs_bytes = validator is not None or derivatives is not None or mirrors is not None
+        tee = tempfile.SpooledTemporaryFile(max_size=options['part_size']) if needs_bytes else None
+        check = StreamedImageCheck(validator, url, tee, content_type_for_key(s3_key)) \
+            if validator is not None else None
+        size = stream_to_s3(url, s3_client, bucket_name, s3_key, part_size=options['part_size'],
+                            scheduler=scheduler, tee=tee, metrics=metrics, accept=check)
+        stored_key = s3_key if size is not None else None
+        content_type = None
+        if check is not None and check.result is not None:
+            image_data, content_type = check.result
+            # The validator changed the bytes or the Content-Type, so the stream was discarded for its version
+            if check.rewritten and upload_to_s3(s3_client, bucket_name, s3_key, image_data, scheduler=scheduler,
+                                                metrics=metrics, content_type=content_type):
+                stored_key, size = s3_key, len(image_data)
+        elif stored_key and tee is not None:
+            tee.seek(0)
+            image_data = tee.read()
+        if stored_key and tee is not None:
+            if derivatives is not None:
+                derivatives.process(url, image_data, s3_client, bucket_name, stored_key, region, scheduler)
+            if mirrors is not None:
+                mirrors.put(s3_key, image_data, scheduler, content_type)
+        if tee is not None:
+            tee.close()
+    else:
+        # Download image immediately, then upload to S3
+        stored_key, size = None, None
+        content_type = None
+        image_data = download_image(url, scheduler=scheduler, metrics=metrics)
+        if image_data and validator is not None:
+            checked = validator.check(url, image_data, content_type_for_key(s3_key))
+            image_data, content_type = checked if checked else (None, None)
+        if image_data and upload_to_s3(s3_client, bucket_name, s3_key, image_data, scheduler=scheduler,
+                                       metrics=metrics, content_type=content_type):
+            stored_key, size = s3_key, len(image_data)
+            if derivatives is not None:
+                derivatives.process(url, image_data, s3_client, bucket_name, stored_key, region, scheduler)
+            if mirrors is not None:
+                mirrors.put(s3_key, image_data, scheduler, content_type)
+
+    if manifest is not None:
+        manifest.record(s3_key, url, stored_key, size, STATUS_DONE if stored_key else STATUS_FAILED,
+                        derivatives=derivatives.get(url) if derivatives is not None else None)
+
+    if stored_key is None:
         return None, None
-
-    # Upload to S3
-    if upload_to_s3(s3_client, bucket_name, s3_key, image_data):
-        # Generate S3 URL
-        s3_url = f"https://{bucket_name}.s3.{region}.amazonaws.com/{s3_key}"
-        return url, s3_url
-
-    return None, None
-
-def scrape_and_migrate(username, bucket_name, model_name, region='us-east-2', max_posts=100, max_workers=10):
+    return url, f"https://{bucket_name}.s3.{region}.amazonaws.com/{stored_key}"
+
+def scrape_and_migrate(username, bucket_name, model_name, region='us-east-2', max_posts=100, max_workers=10,
+                       stream=False, part_size=DEFAULT_PART_SIZE, pool_size=DEFAULT_POOL_SIZE,
+                       engine='threads', concurrency=DEFAULT_CONCURRENCY, dedup=False,
+                       hash_index_path=DEFAULT_INDEX_PATH, manifest_path=None, adaptive=False,
+                       queue_size=DEFAULT_QUEUE_SIZE, derivative_formats=None, page_size=DEFAULT_PAGE_SIZE,
+                       metrics_path=None, mirror_targets=None, validate=False, strip_metadata=False,
+                       recompress=False, state_path=None):
     """
     Main function to scrape Instagram and immediately migrate to S3
+
+    Args:
+        stream: Pipe downloads straight into multipart uploads instead of buffering whole images
+        part_size: Multipart part size in bytes when streaming (bounds memory per transfer)
+        pool_size: Keep-alive connections kept per host in each worker's HTTP session
+        engine: 'threads' (ThreadPoolExecutor) or 'async' (asyncio + aiohttp/aiobotocore)
+        concurrency: Transfers in flight at once with the async engine
+        dedup: Store images content-addressed ({model}/images/<sha256>) and upload each unique image once
+        hash_index_path: Local path or s3://bucket/key of the digest index used by dedup
+        manifest_path: Local path or s3://bucket/key of a migration manifest. When set, images a
+                       previous run already stored are skipped and an interrupted run resumes.
+        adaptive: Let per-host AIMD limiters pick the concurrency instead of max_workers
+        queue_size: Image tasks buffered between the dataset iterator and the workers (threads engine)
+        derivative_formats: Formats (e.g. ['webp']) to render thumb/medium copies in for the viewer;
+                            None skips derivatives
+        page_size: Posts per page shard of the paginated viewer output
+        metrics_path: JSON lines file receiving one event per download/upload plus a per-stage summary
+        mirror_targets: Extra storage targets (e.g. ['comfyui:/workspace/model/input_images']) that get
+                        every image in the same pass; see storage_backends
+        validate: Check every download decodes (rejecting HTML error pages and truncated bodies) and set
+                  ContentType from the actual format; runs in a process pool
+        strip_metadata: Also drop EXIF/XMP/IPTC metadata before storing (implies validate)
+        recompress: Also re-compress losslessly, keeping the result only when smaller (implies validate)
+        state_path: Local path or s3://bucket/key of per-account high-water marks. When set, only posts
+                    newer than the last run's are scraped and they're upserted into the existing JSON
     """
 
+    validate = validate or strip_metadata or recompress
+    check_engine(engine, dedup=dedup, derivatives=derivative_formats, mirrors=mirror_targets, validation=validate)
+
     # Initialize clients
     apify_token = os.getenv('APIFY_API_TOKEN')
-    client = ApifyClient(apify_token)
-    s3_client = boto3.client('s3', region_name=region)
+    client = ApifyClient(apify_token, api_url=apify_client_url())
+    scheduler = TransferScheduler() if adaptive else None
+    if scheduler is not None:
+        # botocore's adaptive retry mode adds client-side rate limiting when S3 says SlowDown
+        s3_config = Config(retries={'mode': 'adaptive', 'max_attempts': 10},
+                           max_pool_connections=scheduler.host_limits['s3']['max'])
+        s3_client = boto3.client('s3', region_name=region, config=s3_config)
+    else:
+        s3_client = boto3.client('s3', region_name=region)
+    configure_pool(pool_size=pool_size)
+    hash_index = HashIndex(hash_index_path, s3_client) if dedup else None
+    manifest = MigrationManifest(manifest_path, s3_client) if manifest_path else None
+    derivatives = DerivativeBuilder(derivative_formats) if derivative_formats else None
+    metrics = TransferMetrics(metrics_path)
+    mirrors = open_mirrors(mirror_targets, region)
+    validator = ImageValidator(strip_metadata, recompress) if validate else None
+    state = ScrapeState(state_path, s3_client) if state_path else None
+    output_file = f'viewer/public/instagram_data.json'
+    stored_posts = load_json(output_file, default=[]) if state is not None else []
+    transfer_options = {'stream': stream, 'part_size': part_size, 'hash_index': hash_index,
+                        'model_name': model_name, 'manifest': manifest, 'scheduler': scheduler,
+                        'derivatives': derivatives, 'metrics': metrics, 'mirrors': mirrors,
+                        'validator': validator}
 
     print(f"🔄 Scraping Instagram @{username}...")
 
@@ -106,6 +237,8 @@ def scrape_and_migrate(username, bucket_name, model_name, region='us-east-2', ma
         "resultsType": "posts",
         "resultsLimit": max_posts,
     }
+    if state is not None:
+        run_input = state.scrape_input(username, run_input)
 
     # Run the Actor and wait for it to finish
     print(f"⏳ Running Apify scraper (this may take a few minutes)...")
@@ -115,94 +248,224 @@ def scrape_and_migrate(username, bucket_name, model_name, region='us-east-2', ma
     dataset_id = run["defaultDatasetId"]
     print(f"✅ Scrape complete! Dataset: https://console.apify.com/storage/datasets/{dataset_id}")
 
-    # Fetch all items from dataset
     posts = []
-    print(f"📥 Fetching posts from dataset...")
-    for item in client.dataset(dataset_id).iterate_items():
-        posts.append(item)
-
-    print(f"✅ Found {len(posts)} posts")
-
-    # Collect all images to process IMMEDIATELY
-    image_tasks = []
-    url_to_post_map = {}
-
-    for post_idx, post in enumerate(posts):
-        post_id = post.get('id', f'post_{post_idx}')
-
-        # Process displayUrl
-        if 'displayUrl' in post and post['displayUrl']:
-            s3_key = generate_image_key(post['displayUrl'], model_name, post_id, 0)
-            image_tasks.append((post['displayUrl'], s3_client, bucket_name, s3_key, region))
-            url_to_post_map[post['displayUrl']] = (post_idx, 0, 'displayUrl')
-
-        # Process images array
-        if 'images' in post and post['images']:
-            for img_idx, img_url in enumerate(post['images']):
-                s3_key = generate_image_key(img_url, model_name, post_id, img_idx)
-                image_tasks.append((img_url, s3_client, bucket_name, s3_key, region))
-                url_to_post_map[img_url] = (post_idx, img_idx, 'images')
-
-    print(f"📸 Processing {len(image_tasks)} images immediately...")
-    print(f"⚡ Starting parallel upload to S3 (this will take a few minutes)...")
-
-    # Process images in parallel IMMEDIATELY
     url_mapping = {}
+    already_done = []
     successful = 0
     failed = 0
+    planner = TransferPlanner()
+
+    # Seed before the first item arrives so each post can be checked against the bucket as it streams in
+    if manifest is not None:
+        manifest.seed_from_bucket(bucket_name, f"{model_name}/")
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(process_image, task) for task in image_tasks]
+    stored_url_prefix = f"https://{bucket_name}.s3."
+
+    def post_tasks(post_idx, post):
+        """Record a dataset item and return the image tasks it still needs"""
+        posts.append(post)
+        post_id = post.get('id', f'post_{post_idx}')
+        tasks = []
+
+        # Images, videos, carousel children and commenters' profile pictures
+        for container, field, key in post_media(post, post_id):
+            if container[field].startswith(stored_url_prefix):
+                # A retried stored post only needs the media that isn't in the bucket yet
+                continue
+            s3_key = f"{model_name}/{key}"
+            tasks.append((container[field], s3_client, bucket_name, s3_key, region, transfer_options))
+
+        # displayUrl is usually images[0] - transfer each distinct image once
+        tasks = planner.plan(tasks)
+
+        # Skip images last night's (or an interrupted) run already stored
+        if manifest is not None:
+            if derivatives is not None:
+                derivatives.adopt(manifest, tasks)
+            tasks, done = manifest.schedule(tasks)
+            already_done.extend(done)
+            for old_url, stored_key in done:
+                url_mapping[old_url] = f"https://{bucket_name}.s3.{region}.amazonaws.com/{stored_key}"
+        return tasks
+
+    dataset = client.dataset(dataset_id)
+    items = dataset.iterate_items()
+    if state is not None:
+        # Only the posts newer than the mark, plus stored posts still pointing at the CDN
+        retry = state.retry_posts(username, stored_posts, stored_url_prefix, post_media_urls)
+        items = chain(state.new_posts(username, items), retry)
 
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Uploading to S3"):
-            old_url, new_url = future.result()
-            if old_url and new_url:
-                url_mapping[old_url] = new_url
-                successful += 1
-            else:
-                failed += 1
+    try:
+        if engine == 'async':
+            # The event loop takes its task list up front, so collect the dataset first
+            print(f"📥 Fetching posts from dataset...")
+            image_tasks = [task for post_idx, post in enumerate(planner.planned(items))
+                           for task in post_tasks(post_idx, post)]
+            print(f"✅ Found {len(posts)} posts")
+            print(f"📸 Processing {len(image_tasks)} images immediately...")
+            with tqdm(total=len(image_tasks), desc="Uploading to S3") as pbar:
+                results = run_async_transfers(
+                    [(task[0], task[3]) for task in image_tasks], bucket_name, region,
+                    concurrency=concurrency, on_complete=lambda result: pbar.update(), manifest=manifest,
+                    metrics=metrics, scheduler=scheduler
+                )
+        else:
+            # Pipeline: each post's images start transferring as soon as its dataset item arrives
+            print(f"⚡ Streaming posts from the dataset straight into parallel uploads to S3...")
+            with tqdm(desc="Uploading to S3", unit="img") as pbar:
+                results = run_pipeline(
+                    planner.planned(items), post_tasks, process_image,
+                    max_workers=scheduler.max_workers if scheduler else max_workers,
+                    queue_size=queue_size, on_result=lambda result: pbar.update()
+                )
+            print(f"✅ Found {len(posts)} posts")
+    finally:
+        # Persist progress even if the run is interrupted, so the next run resumes here
+        if manifest is not None:
+            manifest.save()
+        if derivatives is not None:
+            derivatives.close()
+        if validator is not None:
+            validator.close()
+        metrics.close()
+
+    skipped = len(already_done)
+    total_images = len(results)
+
+    for old_url, new_url in results:
+        if old_url and new_url:
+            url_mapping[old_url] = new_url
+            successful += 1
+        else:
+            failed += 1
+
+    if hash_index is not None:
+        hash_index.save()
+        hash_index.print_stats()
+    if validator is not None:
+        validator.print_stats()
+    if derivatives is not None:
+        derivatives.print_stats()
 
     print(f"\n📊 Upload Results:")
-    print(f"   ✅ Successful: {successful}/{len(image_tasks)}")
-    print(f"   ❌ Failed: {failed}/{len(image_tasks)}")
+    print(f"   ✅ Successful: {successful}/{total_images}")
+    print(f"   ❌ Failed: {failed}/{total_images}")
+    if manifest is not None:
+        print(f"   ⏭️  Already migrated: {skipped}")
+
+    # Point every duplicate reference at the copy that was transferred
+    referenced_urls = [url for post in posts for url in post_media_urls(post)]
+    fan_out(url_mapping, referenced_urls)
+    if derivatives is not None:
+        fan_out(derivatives.variants, referenced_urls)
 
     # Update posts with S3 URLs
     print("🔄 Updating posts with S3 URLs...")
     for post in posts:
-        if 'displayUrl' in post and post['displayUrl'] in url_mapping:
-            post['displayUrl'] = url_mapping[post['displayUrl']]
+        if derivatives is not None:
+            derivatives.annotate(post)
 
-        if 'images' in post and post['images']:
-            post['images'] = [
-                url_mapping.get(url, url) for url in post['images']
-            ]
+        rewrite_media(post, url_mapping)
+
+    # Upsert this run's posts into the ones saved by earlier runs
+    all_posts = merge_posts(stored_posts, posts) if state is not None else posts
 
     # Save updated JSON
-    output_file = f'viewer/public/instagram_data.json'
     print(f"💾 Saving to {output_file}...")
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(posts, f, indent=2, ensure_ascii=False)
+        json.dump(all_posts, f, separators=(',', ':'), ensure_ascii=False)
+    output_dir = 'viewer/public/instagram_data'
+    index = write_sharded_json(all_posts, output_dir, page_size=page_size)
+    if state is not None:
+        state.advance(username, posts)
+        state.save()
 
     print(f"\n✅ Complete!")
     print(f"   - Posts scraped: {len(posts)}")
-    print(f"   - Images uploaded: {successful}/{len(image_tasks)}")
+    if state is not None:
+        print(f"   - Posts stored: {len(all_posts)}")
+    print(f"   - Images uploaded: {successful}/{total_images}")
     print(f"   - S3 Bucket: https://s3.console.aws.amazon.com/s3/buckets/{bucket_name}")
     print(f"   - JSON saved: {output_file}")
+    print_output_stats(index, output_dir)
+    if mirrors is not None:
+        mirrors.print_stats()
+    metrics.print_summary()
+    print_pool_stats()
+    if scheduler is not None:
+        scheduler.print_stats()
 
     return posts, successful, failed
 
 if __name__ == "__main__":
-    import sys
-
-    if len(sys.argv) < 4:
-        print("Usage: python scrape_and_migrate_to_s3.py <username> <bucket_name> <model_name> [region] [max_posts]")
-        print("Example: python scrape_and_migrate_to_s3.py madison.moorgan madison-morgan-instagram madison-morgan us-east-2 100")
-        sys.exit(1)
-
-    username = sys.argv[1]
-    bucket_name = sys.argv[2]
-    model_name = sys.argv[3]
-    region = sys.argv[4] if len(sys.argv) > 4 else 'us-east-2'
-    max_posts = int(sys.argv[5]) if len(sys.argv) > 5 else 100
-
-    scrape_and_migrate(username, bucket_name, model_name, region, max_posts)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scrape Instagram and immediately migrate images to S3")
+    parser.add_argument('username')
+    parser.add_argument('bucket_name')
+    parser.add_argument('model_name')
+    parser.add_argument('region', nargs='?', default='us-east-2')
+    parser.add_argument('max_posts', nargs='?', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=10, help="Parallel transfers (default: 10)")
+    parser.add_argument('--stream', action='store_true',
+                        help="Stream downloads into S3 multipart uploads instead of buffering whole images")
+    parser.add_argument('--part-size-mb', type=int, default=DEFAULT_PART_SIZE // (1024 * 1024),
+                        help="Multipart part size in MB when streaming (min 5, default: 8)")
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help="Keep-alive connections per host per worker session (default: 10)")
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads',
+                        help="Transfer engine: thread pool or asyncio (default: threads)")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Transfers in flight with --engine async (default: 200)")
+    parser.add_argument('--dedup', action='store_true',
+                        help="Content-addressed layout: upload each unique image once, reference it from every post")
+    parser.add_argument('--hash-index', default=DEFAULT_INDEX_PATH,
+                        help=f"Digest index for --dedup, local path or s3://bucket/key (default: {DEFAULT_INDEX_PATH})")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="AIMD per-host concurrency (Instagram CDN / Shopify CDN / S3) with jittered backoff "
+                             "on throttling, instead of a fixed worker count")
+    parser.add_argument('--manifest', nargs='?', const=DEFAULT_MANIFEST_PATH, default=None,
+                        help=f"Resume/skip already-migrated images using a manifest, local path or "
+                             f"s3://bucket/key (default when given without a value: {DEFAULT_MANIFEST_PATH})")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f"Image tasks buffered between the dataset stream and the workers (default: {DEFAULT_QUEUE_SIZE})")
+    parser.add_argument('--derivatives', nargs='?', const='webp', default=None, metavar='FORMATS',
+                        help="Also upload resized thumb/medium copies for the viewer, comma-separated formats "
+                             "(default when given without a value: webp; e.g. webp,avif). Needs Pillow")
+    parser.add_argument('--metrics', nargs='?', const=DEFAULT_METRICS_PATH, default=None, metavar='PATH',
+                        help=f"Append per-transfer latency/bytes/status events and a per-stage summary as JSON lines "
+                             f"(default when given without a value: {DEFAULT_METRICS_PATH})")
+    parser.add_argument('--mirror', action='append', default=None, metavar='TARGET',
+                        help="Also write every image to TARGET (repeatable): comfyui:/path/to/input_images for a flat "
+                             "ComfyUI input folder, file:/path, s3://bucket or s3+https://host/bucket?profile=name")
+    parser.add_argument('--validate', action='store_true',
+                        help="Reject downloads that don't decode (HTML error pages, truncated bodies) and set "
+                             "ContentType from the actual image format")
+    parser.add_argument('--strip-metadata', action='store_true',
+                        help="Drop EXIF/XMP/IPTC metadata before storing (implies --validate)")
+    parser.add_argument('--recompress', action='store_true',
+                        help="Re-compress losslessly (PNG optimize, jpegtran for JPEG) when smaller "
+                             "(implies --validate)")
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                        help=f"Posts per page shard written for the viewer (default: {DEFAULT_PAGE_SIZE})")
+    parser.add_argument('--incremental', nargs='?', const=DEFAULT_STATE_PATH, default=None, metavar='STATE',
+                        help=f"Only scrape posts newer than the last run and merge them into the existing JSON, "
+                             f"keeping high-water marks in STATE, local path or s3://bucket/key "
+                             f"(default when given without a value: {DEFAULT_STATE_PATH})")
+    args = parser.parse_args()
+    try:
+        check_engine(args.engine, dedup=args.dedup, derivatives=args.derivatives, mirrors=args.mirror,
+                     validation=args.validate or args.strip_metadata or args.recompress)
+    except ValueError as e:
+        parser.error(f"{e} (drop --engine async or the option)")
+
+    scrape_and_migrate(args.username, args.bucket_name, args.model_name, args.region, args.max_posts,
+                       max_workers=args.workers, stream=args.stream,
+                       part_size=args.part_size_mb * 1024 * 1024, pool_size=args.pool_size,
+                       engine=args.engine, concurrency=args.concurrency, dedup=args.dedup,
+                       hash_index_path=args.hash_index, manifest_path=args.manifest,
+                       adaptive=args.adaptive, queue_size=args.queue_size,
+                       derivative_formats=args.derivatives.split(',') if args.derivatives else None,
+                       page_size=args.page_size, metrics_path=args.metrics, mirror_targets=args.mirror,
+                       validate=args.validate, strip_metadata=args.strip_metadata, recompress=args.recompress,
+                       state_path=args.incremental)
@@ -2,54 +2,65 @@
 """Scrape brand Instagram - matches ISMÊ structure"""
 import os
 import json
-import requests
+from apify_runs import ApifyRunManager, INSTAGRAM_SCRAPER, instagram_input, run_actor
+from scrape_state import ScrapeState, merge_posts
+from s3_transfer import load_json
 import sys
 from dotenv import load_dotenv
 
 load_dotenv('.env.local')
 APIFY_TOKEN = os.getenv('APIFY_API_TOKEN')
 
-def scrape_instagram(username, max_posts=1000):
-    """Scrape Instagram posts using Apify"""
-    print(f"\n📸 Scraping @{username} (up to {max_posts} posts)")
+def brand_state(brand_slug):
+    """High-water marks of the brand's Instagram accounts"""
+    return ScrapeState(f"brands/{brand_slug}/instagram/scrape_state.json")
 
-    url = f"https://api.apify.com/v2/acts/apify~instagram-scraper/run-sync-get-dataset-items?token={APIFY_TOKEN}"
-
-    payload = {
-        "directUrls": [f"https://www.instagram.com/{username}/"],
-        "resultsType": "posts",
-        "resultsLimit": max_posts,
-        "addParentData": False
-    }
-
-    try:
-        print("⏳ This will take 2-5 minutes...")
-        response = requests.post(
-            url,
-            json=payload,
-            headers={'Content-Type': 'application/json'},
-            timeout=300
-        )
-
-        if response.status_code in [200, 201]:
-            posts = response.json()
-            print(f"✅ Scraped {len(posts)} posts")
-            return posts
-        else:
-            print(f"❌ Failed: HTTP {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        return None
+def scrape_instagram(username, max_posts=1000, state=None):
+    """Scrape Instagram posts using Apify - only the ones newer than state's mark when given"""
+    print(f"\n📸 Scraping @{username} (up to {max_posts} posts)")
+    run_input = instagram_input(username, max_posts=max_posts)
+    if state is not None:
+        run_input = state.scrape_input(username, run_input)
+
+    print("⏳ This will take 2-5 minutes...")
+    posts = run_actor(APIFY_TOKEN, INSTAGRAM_SCRAPER, run_input, label=f"@{username}")
+    if posts is not None and state is not None:
+        posts = list(state.new_posts(username, posts))
+    return posts
+
+def scrape_brands(brands, max_posts=1000):
+    """
+    Scrape several brands' Instagram at once, saving each brand as soon as its run finishes
+
+    Args:
+        brands: (brand_slug, instagram_username, brand_name) tuples
+    """
+    def saver(brand_slug, username, brand_name, state):
+        def save(run, posts):
+            posts = list(state.new_posts(username, posts))
+            total_posts, total_images = save_instagram_data(brand_slug, posts)
+            state.advance(username, posts)
+            state.save()
+            print_summary(brand_name, total_posts, total_images, brand_slug, len(posts))
+        return save
+
+    manager = ApifyRunManager(APIFY_TOKEN)
+    for brand_slug, username, brand_name in brands:
+        print(f"📸 Queueing @{username} (up to {max_posts} posts)")
+        state = brand_state(brand_slug)
+        manager.add(INSTAGRAM_SCRAPER, state.scrape_input(username, instagram_input(username, max_posts=max_posts)),
+                    label=f"@{username}", on_dataset=saver(brand_slug, username, brand_name, state))
+    manager.run()
+    manager.print_summary()
+    return manager.runs
 
 def save_instagram_data(brand_slug, posts):
-    """Save Instagram data - matches ISMÊ structure"""
+    """Save Instagram data - matches ISMÊ structure, upserting posts into the ones already saved"""
     instagram_dir = f"brands/{brand_slug}/instagram"
     os.makedirs(instagram_dir, exist_ok=True)
 
     # Process posts
     processed = []
-    all_images = []
 
     for post in posts:
         item = {
@@ -67,11 +78,6 @@ def save_instagram_data(brand_slug, posts):
         # Main image
         if post.get('displayUrl'):
             item['images'].append(post['displayUrl'])
-            all_images.append({
-                'url': post['displayUrl'],
-                'post_url': post.get('url'),
-                'likes': post.get('likesCount', 0)
-            })
 
         # Video
         if post.get('type') == 'Video' and post.get('videoUrl'):
@@ -82,19 +88,18 @@ def save_instagram_data(brand_slug, posts):
             for child in post['childPosts']:
                 if child.get('displayUrl'):
                     item['images'].append(child['displayUrl'])
-                    all_images.append({
-                        'url': child['displayUrl'],
-                        'post_url': post.get('url'),
-                        'likes': post.get('likesCount', 0)
-                    })
 
         processed.append(item)
 
     # Save like ISMÊ: {brand}_instagram_processed.json
     posts_file = f"{instagram_dir}/{brand_slug}_instagram_processed.json"
+    processed = merge_posts(load_json(posts_file, default=[]), processed, key=lambda item: item['post_id'])
     with open(posts_file, 'w') as f:
         json.dump(processed, f, indent=2)
 
+    all_images = [{'url': url, 'post_url': item['post_url'], 'likes': item['likes']}
+                  for item in processed for url in item['images']]
+
     # Save images
     images_file = f"{instagram_dir}/{brand_slug}_instagram_images.json"
     with open(images_file, 'w') as f:
@@ -102,12 +107,12 @@ def save_instagram_data(brand_slug, posts):
 
     return len(processed), len(all_images)
 
-def print_summary(brand_name, total_posts, total_images, brand_slug):
+def print_summary(brand_name, total_posts, total_images, brand_slug, new_posts=None):
     """Print summary"""
     print(f"\n{'='*60}")
     print(f"✅ {brand_name.upper()} INSTAGRAM - COMPLETE")
     print('='*60)
-    print(f"\n📸 Posts: {total_posts}")
+    print(f"\n📸 Posts: {total_posts}{f' ({new_posts} new)' if new_posts is not None else ''}")
     print(f"🖼️  Images: {total_images}")
     print(f"\n💾 Saved to: brands/{brand_slug}/instagram/")
     print(f"   - {brand_slug}_instagram_processed.json")
@@ -115,19 +120,32 @@ def print_summary(brand_name, total_posts, total_images, brand_slug):
     print('='*60)
 
 if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == '--brands':
+        # python scrape_brand_instagram.py --brands isme:ismeswim vitamin-a:vitaminaswim ...
+        brands = []
+        for spec in sys.argv[2:]:
+            brand_slug, _, instagram_username = spec.partition(':')
+            brands.append((brand_slug, instagram_username or brand_slug, brand_slug))
+        runs = scrape_brands(brands, max_posts=1000)
+        sys.exit(0 if all(run.succeeded for run in runs) else 1)
+
     if len(sys.argv) < 3:
-        print("Usage: python scrape_brand_instagram.py <brand-slug> <instagram-username>")
+        print("Usage: python scrape_brand_instagram.py <brand-slug> <instagram-username> [brand-name]")
+        print("       python scrape_brand_instagram.py --brands <brand-slug>:<instagram-username> ...")
         sys.exit(1)
 
     brand_slug = sys.argv[1]
     instagram_username = sys.argv[2]
     brand_name = sys.argv[3] if len(sys.argv) > 3 else brand_slug
 
-    # Scrape
-    posts = scrape_instagram(instagram_username, max_posts=1000)
+    # Scrape only what's newer than the last run
+    state = brand_state(brand_slug)
+    posts = scrape_instagram(instagram_username, max_posts=1000, state=state)
 
-    if posts:
+    if posts is not None:
         total_posts, total_images = save_instagram_data(brand_slug, posts)
-        print_summary(brand_name, total_posts, total_images, brand_slug)
+        state.advance(instagram_username, posts)
+        state.save()
+        print_summary(brand_name, total_posts, total_images, brand_slug, len(posts))
     else:
         print("\n❌ Instagram scraping failed!")
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """Scrape brand Shopify - matches ISMÊ folder structure"""
 import json
-import requests
+from http_cache import cached_get
 import os
 import sys
 
@@ -12,7 +12,7 @@ def scrape_shopify(website_url, brand_name):
 
     try:
         url = f"{website_url.rstrip('/')}/products.json?limit=250"
-        response = requests.get(url, timeout=30)
+        response = cached_get(url, timeout=30)
 
         if response.status_code == 200:
             data = response.json()
@@ -1,13 +1,14 @@
 import os
 import json
 import requests
+from http_pool import get_session
+from apify_runs import INSTAGRAM_SCRAPER, run_sync_url
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv('.env.local')
 
 APIFY_API_TOKEN = os.getenv('APIFY_API_TOKEN')
-APIFY_API_URL = os.getenv('APIFY_API_URL')
 
 def scrape_instagram_profile(username, max_posts=100):
     """
@@ -33,14 +34,14 @@ def scrape_instagram_profile(username, max_posts=100):
 
     # Make request to Apify API
     try:
-        response = requests.post(
-            f"{APIFY_API_URL}?token={APIFY_API_TOKEN}",
+        response = get_session().post(
+            f"{run_sync_url(INSTAGRAM_SCRAPER)}?token={APIFY_API_TOKEN}",
             json=payload,
             headers={'Content-Type': 'application/json'},
             timeout=300  # 5 minute timeout for sync API
         )
 
-        if response.status_code == 200:
+        if response.status_code in [200, 201]:
             data = response.json()
             print(f"✅ Successfully scraped {len(data)} posts!")
             return data
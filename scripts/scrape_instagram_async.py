@@ -1,7 +1,7 @@
 import os
-import json
-import requests
-import time
+import heapq
+from http_pool import get_session
+from apify_runs import apify_api_base, wait_for_run, iter_dataset_items, JsonlTee
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -25,10 +25,10 @@ def start_instagram_scrape(username, max_posts=100):
     print(f"🚀 Starting Instagram scrape for @{username}...")
 
     # Start the actor run
-    url = f"https://api.apify.com/v2/acts/apify~instagram-scraper/runs?token={APIFY_API_TOKEN}"
+    url = f"{apify_api_base()}/acts/apify~instagram-scraper/runs?token={APIFY_API_TOKEN}"
 
     try:
-        response = requests.post(
+        response = get_session().post(
             url,
             json=payload,
             headers={'Content-Type': 'application/json'}
@@ -48,78 +48,13 @@ def start_instagram_scrape(username, max_posts=100):
         print(f"❌ Error: {str(e)}")
         return None
 
-def check_run_status(run_id):
-    """Check if the scrape is complete"""
-    url = f"https://api.apify.com/v2/acts/apify~instagram-scraper/runs/{run_id}?token={APIFY_API_TOKEN}"
-
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            status = data['data']['status']
-            return status
-        return None
-    except Exception as e:
-        print(f"❌ Error checking status: {str(e)}")
-        return None
-
-def wait_for_completion(run_id, max_wait=600):
-    """Wait for the scrape to complete"""
-    print("⏳ Waiting for scrape to complete...")
-    start_time = time.time()
-
-    while (time.time() - start_time) < max_wait:
-        status = check_run_status(run_id)
-
-        if status == "SUCCEEDED":
-            print("✅ Scrape completed successfully!")
-            return True
-        elif status in ["FAILED", "ABORTED", "TIMED-OUT"]:
-            print(f"❌ Scrape {status}")
-            return False
-        elif status == "RUNNING":
-            elapsed = int(time.time() - start_time)
-            print(f"⏳ Still running... ({elapsed}s elapsed)")
-            time.sleep(10)
-        else:
-            print(f"📊 Status: {status}")
-            time.sleep(5)
-
-    print("⏰ Timeout waiting for scrape to complete")
-    return False
-
 def get_results(run_id):
-    """Fetch the scraped data"""
-    url = f"https://api.apify.com/v2/acts/apify~instagram-scraper/runs/{run_id}/dataset/items?token={APIFY_API_TOKEN}"
-
+    """Stream the scraped posts page by page, saving them to isme_instagram_full.jsonl as they arrive"""
     print("📥 Fetching results...")
-
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Retrieved {len(data)} posts!")
-            return data
-        else:
-            print(f"❌ Error fetching results: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        return None
-
-def save_data(data, filename):
-    """Save data to JSON file"""
-    if data:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        print(f"💾 Data saved to {filename}")
-        return True
-    return False
+    return JsonlTee(iter_dataset_items(APIFY_API_TOKEN, run_id=run_id), 'isme_instagram_full.jsonl')
 
 def extract_image_urls(data):
-    """Extract just image URLs and metadata"""
-    simplified = []
-
+    """Extract just image URLs and metadata, one post at a time"""
     for post in data:
         item = {
             'post_id': post.get('id'),
@@ -146,9 +81,7 @@ def extract_image_urls(data):
                 if child.get('displayUrl'):
                     item['images'].append(child['displayUrl'])
 
-        simplified.append(item)
-
-    return simplified
+        yield item
 
 if __name__ == "__main__":
     username = "ismeswim"
@@ -159,25 +92,30 @@ if __name__ == "__main__":
 
     if run_id:
         # Wait for completion
-        if wait_for_completion(run_id):
-            # Get results
+        if wait_for_run(APIFY_API_TOKEN, run_id, max_wait=600, label="Scrape"):
+            # Stream results: full posts and the simplified version are written as they arrive
             data = get_results(run_id)
-
-            if data:
-                # Save full data
-                save_data(data, 'isme_instagram_full.json')
-
-                # Extract and save simplified version
-                simplified = extract_image_urls(data)
-                save_data(simplified, 'isme_instagram_images.json')
-
+            simplified = JsonlTee(extract_image_urls(data), 'isme_instagram_images.jsonl')
+            total_images = 0
+            top_posts = []
+
+            try:
+                for post in simplified:
+                    total_images += len(post['images'])
+                    # Keep only the 5 most liked posts in memory
+                    heapq.heappush(top_posts, (post.get('likes', 0), simplified.count, post))
+                    if len(top_posts) > 5:
+                        heapq.heappop(top_posts)
+            except Exception as e:
+                print(f"❌ Error fetching results: {str(e)}")
+
+            if data.count:
                 # Print summary
                 print("\n📊 SUMMARY:")
-                print(f"Total posts: {len(data)}")
-                print(f"Total images: {sum(len(p['images']) for p in simplified)}")
+                print(f"Total posts: {data.count}")
+                print(f"Total images: {total_images}")
                 print(f"\nTop 5 most engaged posts:")
-                sorted_posts = sorted(simplified, key=lambda x: x.get('likes', 0), reverse=True)
-                for i, post in enumerate(sorted_posts[:5], 1):
+                for i, (_, _, post) in enumerate(sorted(top_posts, key=lambda x: x[:2], reverse=True), 1):
                     print(f"{i}. {post['likes']:,} likes | {len(post['images'])} images | {post['url']}")
 
-                print(f"\n✅ All data saved! Check isme_instagram_full.json and isme_instagram_images.json")
+                print(f"\n✅ All data saved! Check isme_instagram_full.jsonl and isme_instagram_images.jsonl")
@@ -1,7 +1,6 @@
 import os
-import json
-import requests
-import time
+from http_pool import get_session
+from apify_runs import apify_api_base, wait_for_run, iter_dataset_items, JsonlTee
 from dotenv import load_dotenv
 
 load_dotenv('.env.local')
@@ -34,9 +33,9 @@ def crawl_isme_website():
     print("🚀 Starting Website Content Crawler for ISMÊ Swim...")
 
     # Start the crawler
-    url = f"https://api.apify.com/v2/acts/apify~website-content-crawler/runs?token={APIFY_API_TOKEN}"
+    url = f"{apify_api_base()}/acts/apify~website-content-crawler/runs?token={APIFY_API_TOKEN}"
 
-    response = requests.post(url, json=payload, headers={'Content-Type': 'application/json'})
+    response = get_session().post(url, json=payload, headers={'Content-Type': 'application/json'})
 
     if response.status_code in [200, 201]:
         run_data = response.json()
@@ -48,55 +47,13 @@ def crawl_isme_website():
         print(response.text)
         return None
 
-def check_status(run_id):
-    """Check crawler status"""
-    url = f"https://api.apify.com/v2/acts/apify~website-content-crawler/runs/{run_id}?token={APIFY_API_TOKEN}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()['data']['status']
-    return None
-
-def wait_for_completion(run_id, max_wait=600):
-    """Wait for crawler to finish"""
-    print("⏳ Crawling website...")
-    start_time = time.time()
-
-    while (time.time() - start_time) < max_wait:
-        status = check_status(run_id)
-
-        if status == "SUCCEEDED":
-            print("✅ Crawl completed!")
-            return True
-        elif status in ["FAILED", "ABORTED", "TIMED-OUT"]:
-            print(f"❌ Crawl {status}")
-            return False
-        elif status == "RUNNING":
-            elapsed = int(time.time() - start_time)
-            print(f"⏳ Still running... ({elapsed}s)", end='\r')
-            time.sleep(5)
-
-    print("⏰ Timeout")
-    return False
-
 def get_results(run_id):
-    """Fetch crawled data"""
-    url = f"https://api.apify.com/v2/acts/apify~website-content-crawler/runs/{run_id}/dataset/items?token={APIFY_API_TOKEN}"
-
+    """Stream crawled pages page by page, saving them to isme_website_full_crawl.jsonl as they arrive"""
     print("📥 Fetching results...")
-    response = requests.get(url)
-
-    if response.status_code == 200:
-        data = response.json()
-        print(f"✅ Retrieved {len(data)} pages!")
-        return data
-    else:
-        print(f"❌ Error: {response.status_code}")
-        return None
+    return JsonlTee(iter_dataset_items(APIFY_API_TOKEN, run_id=run_id), 'isme_website_full_crawl.jsonl')
 
 def extract_products(data):
-    """Extract product information from crawled pages"""
-    products = []
-
+    """Extract product information from crawled pages, one page at a time"""
     for page in data:
         url = page.get('url', '')
 
@@ -114,9 +71,7 @@ def extract_products(data):
                 'markdown': markdown,
                 'crawled_at': page.get('crawl', {}).get('loadedTime', '')
             }
-            products.append(product)
-
-    return products
+            yield product
 
 if __name__ == "__main__":
     # Start crawl
@@ -124,22 +79,18 @@ if __name__ == "__main__":
 
     if run_id:
         # Wait for completion
-        if wait_for_completion(run_id):
-            # Get results
+        if wait_for_run(APIFY_API_TOKEN, run_id, max_wait=600, label="Crawl"):
+            # Stream results: the full crawl and the product pages are written as they arrive
             data = get_results(run_id)
-
-            if data:
-                # Save full crawl
-                with open('isme_website_full_crawl.json', 'w') as f:
-                    json.dump(data, f, indent=2)
-                print(f"💾 Full crawl saved to isme_website_full_crawl.json")
-
-                # Extract products
-                products = extract_products(data)
-                with open('isme_products_extracted.json', 'w') as f:
-                    json.dump(products, f, indent=2)
-
+            products = JsonlTee(extract_products(data), 'isme_products_extracted.jsonl')
+            try:
+                for _ in products:
+                    pass
+            except Exception as e:
+                print(f"❌ Error fetching results: {str(e)}")
+
+            if data.count:
                 print(f"\n📊 SUMMARY:")
-                print(f"   Total pages crawled: {len(data)}")
-                print(f"   Product pages found: {len(products)}")
-                print(f"\n✅ Done! Check isme_website_full_crawl.json and isme_products_extracted.json")
+                print(f"   Total pages crawled: {data.count}")
+                print(f"   Product pages found: {products.count}")
+                print(f"\n✅ Done! Check isme_website_full_crawl.jsonl and isme_products_extracted.jsonl")
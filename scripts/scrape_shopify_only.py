@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """Simple Shopify product scraper - no Apify needed"""
 import json
-import requests
+from http_cache import cached_get
 import os
 
 def scrape_shopify_products(website_url, brand_name):
@@ -10,7 +10,7 @@ def scrape_shopify_products(website_url, brand_name):
 
     try:
         products_url = f"{website_url.rstrip('/')}/products.json?limit=250"
-        response = requests.get(products_url, timeout=30)
+        response = cached_get(products_url, timeout=30)
 
         if response.status_code == 200:
             data = response.json()
@@ -2,7 +2,8 @@
 """Scrape single brand - products + Instagram"""
 import os
 import json
-import requests
+from http_cache import cached_get
+from apify_runs import INSTAGRAM_SCRAPER, instagram_input, run_actor
 import time
 from dotenv import load_dotenv
 
@@ -16,7 +17,7 @@ def scrape_shopify_products(website_url, brand_name):
     try:
         # Try Shopify products.json API
         products_url = f"{website_url.rstrip('/')}/products.json?limit=250"
-        response = requests.get(products_url, timeout=30)
+        response = cached_get(products_url, timeout=30)
 
         if response.status_code == 200:
             data = response.json()
@@ -34,35 +35,9 @@ def scrape_instagram(username, max_posts=1000):
     """Scrape Instagram posts using Apify"""
     print(f"\n📸 SCRAPING INSTAGRAM @{username} (up to {max_posts} posts)")
 
-    url = f"https://api.apify.com/v2/acts/apify~instagram-scraper/run-sync-get-dataset-items?token={APIFY_TOKEN}"
-
-    payload = {
-        "directUrls": [f"https://www.instagram.com/{username}/"],
-        "resultsType": "posts",
-        "resultsLimit": max_posts,
-        "addParentData": False
-    }
-
-    try:
-        print("⏳ Starting Instagram scrape (this may take 2-5 minutes)...")
-        response = requests.post(
-            url,
-            json=payload,
-            headers={'Content-Type': 'application/json'},
-            timeout=300
-        )
-
-        if response.status_code in [200, 201]:
-            posts = response.json()
-            print(f"✅ Scraped {len(posts)} Instagram posts")
-            return posts
-        else:
-            print(f"❌ Instagram scrape failed: {response.status_code}")
-            print(response.text[:500])
-            return None
-    except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        return None
+    print("⏳ Starting Instagram scrape (this may take 2-5 minutes)...")
+    return run_actor(APIFY_TOKEN, INSTAGRAM_SCRAPER, instagram_input(username, max_posts=max_posts),
+                     label=f"@{username}")
 
 def save_brand_data(brand_name, products, instagram_posts):
     """Save all brand data to organized folders"""
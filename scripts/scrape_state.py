@@ -0,0 +1,150 @@
+"""
+Per-account high-water marks, so repeat scrapes only fetch posts newer than the last run.
+
+Every run used to ask Apify for a fixed resultsLimit and overwrite the output,
+although only a handful of posts are new each day. ScrapeState remembers, per
+account, the newest post timestamp and the ids of the latest posts ingested:
+
+- scrape_input() adds onlyPostsNewerThan (the day of the newest ingested post),
+  so the actor doesn't scrape - or bill for - older posts
+- new_posts() drops dataset items that were already ingested and stops reading
+  once only known posts follow
+- merge_posts() upserts the delta into the stored posts by post id
+- retry_posts() picks the stored posts whose media never reached the bucket,
+  giving up on a post after MAX_RETRIES runs (its CDN links have expired by then)
+
+Marks are advanced with advance() and should only be saved once the merged
+output is written, so a failed run scrapes the same delta again.
+"""
+
+from datetime import datetime, timezone
+from s3_transfer import load_json, save_json
+
+DEFAULT_STATE_PATH = 'scrape_state.json'
+RECENT_IDS = 50        # ids of the newest ingested posts remembered per account
+STOP_AFTER_KNOWN = 4   # Instagram pins up to 3 older posts above new ones; 4 known in a row means no more new
+MAX_RETRIES = 3        # runs that retry a stored post's missing media before giving up on it
+
+def post_key(post):
+    """Stable id of a scraped post"""
+    return post.get('id') or post.get('shortCode') or post.get('url')
+
+def merge_posts(stored, delta, key=post_key):
+    """
+    Keyed upsert of delta into stored
+
+    Posts in delta replace the stored post with the same key in place; posts that are
+    new go in front, in delta's order (the actor returns newest first).
+    """
+    updates = {key(post): post for post in delta}
+    merged = [updates.pop(key(post), post) for post in stored]
+    return [post for post in delta if key(post) in updates] + merged
+
+def unmigrated_posts(posts, stored_url_prefix, media_urls):
+    """Stored posts that still reference media outside stored_url_prefix (e.g. a transfer that failed)"""
+    return [post for post in posts
+            if any(not url.startswith(stored_url_prefix) for url in media_urls(post))]
+
+class ScrapeState:
+    """High-water marks and retry counts keyed by Instagram username, stored as JSON locally or on S3"""
+
+    def __init__(self, location, s3_client=None):
+        self.location = location
+        self.s3_client = s3_client
+        data = load_json(location, s3_client, default={})
+        self.accounts = data.get('accounts', {})
+        self.retries = data.get('retries', {})
+
+    def mark(self, username):
+        """{'timestamp', 'post_id', 'recent_ids', 'updated_at'} of the newest post ingested, or None"""
+        return self.accounts.get(username)
+
+    def scrape_input(self, username, run_input):
+        """run_input limited to posts newer than the account's mark"""
+        mark = self.mark(username)
+        if not mark:
+            print(f"📌 @{username}: no high-water mark yet - scraping up to {run_input.get('resultsLimit')} posts")
+            return run_input
+        # Whole days only: the newest day is fetched again and merge_posts() makes that harmless
+        since = mark['timestamp'][:10]
+        print(f"📌 @{username}: only posts newer than {since} (newest ingested: {mark['post_id']})")
+        return dict(run_input, onlyPostsNewerThan=since)
+
+    def new_posts(self, username, items, mark=None):
+        """
+        Yield the items that weren't ingested yet
+
+        Args:
+            mark: Compare against this mark instead of the current one (a continuation
+                  whose first invocation already advanced it)
+        """
+        mark = mark or self.mark(username)
+        if not mark:
+            yield from items
+            return
+
+        recent_ids = set(mark.get('recent_ids', []))
+        skipped = 0
+        known_in_a_row = 0
+        for item in items:
+            if post_key(item) in recent_ids or (item.get('timestamp') or '') <= mark['timestamp']:
+                skipped += 1
+                known_in_a_row += 1
+                if known_in_a_row >= STOP_AFTER_KNOWN:
+                    break
+                continue
+            known_in_a_row = 0
+            yield item
+        print(f"📌 @{username}: {skipped} already-ingested posts skipped")
+
+    def retry_posts(self, username, stored, stored_url_prefix, media_urls):
+        """
+        Stored posts whose media should be transferred again, counting one attempt for each
+
+        Posts that made it into the bucket are forgotten; the others are retried by at most
+        MAX_RETRIES runs.
+        """
+        attempts = self.retries.get(username, {})
+        retry = []
+        remaining = {}
+        given_up = 0
+        for post in unmigrated_posts(stored, stored_url_prefix, media_urls):
+            key = post_key(post)
+            count = attempts.get(key, 0)
+            if count >= MAX_RETRIES:
+                given_up += 1
+            else:
+                count += 1
+                retry.append(post)
+            remaining[key] = count
+        self.retries[username] = remaining
+        if retry:
+            print(f"📌 @{username}: retrying media of {len(retry)} stored posts that aren't fully in the bucket")
+        if given_up:
+            print(f"📌 @{username}: {given_up} stored posts given up on after {MAX_RETRIES} attempts")
+        return retry
+
+    def advance(self, username, posts):
+        """Move the account's mark past the newest of posts"""
+        dated = [post for post in posts if post.get('timestamp')]
+        if not dated:
+            return
+        mark = self.accounts.get(username) or {}
+        newest = max(dated, key=lambda post: post['timestamp'])
+        if mark.get('timestamp', '') > newest['timestamp']:
+            newest = {'timestamp': mark['timestamp'], 'id': mark['post_id']}
+
+        recent_ids = []
+        for post_id in [post_key(post) for post in sorted(dated, key=lambda post: post['timestamp'], reverse=True)] + \
+                mark.get('recent_ids', []):
+            if post_id not in recent_ids:
+                recent_ids.append(post_id)
+        self.accounts[username] = {
+            'timestamp': newest['timestamp'],
+            'post_id': newest['id'],
+            'recent_ids': recent_ids[:RECENT_IDS],
+            'updated_at': datetime.now(timezone.utc).isoformat()
+        }
+
+    def save(self):
+        save_json(self.location, {'accounts': self.accounts, 'retries': self.retries}, self.s3_client)
@@ -49,6 +49,7 @@ cat > /tmp/lambda-s3-policy.json <<EOF
       "Action": [
         "s3:PutObject",
         "s3:PutObjectAcl",
+        "s3:AbortMultipartUpload",
         "s3:GetObject",
         "s3:ListBucket"
       ],
@@ -56,6 +57,11 @@ cat > /tmp/lambda-s3-policy.json <<EOF
         "arn:aws:s3:::*-instagram/*",
         "arn:aws:s3:::*-instagram"
       ]
+    },
+    {
+      "Effect": "Allow",
+      "Action": "lambda:InvokeFunction",
+      "Resource": "arn:aws:lambda:*:*:function:instagram-scraper-daily"
     }
   ]
 }
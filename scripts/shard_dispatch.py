@@ -0,0 +1,280 @@
+"""
+Split a migration's transfer list into shards and run them side by side.
+
+One process moving thousands of carousel images is bound by one NIC and by
+the GIL (JSON, hashing, boto3 request signing). With sharding, the planned
+and manifest-filtered tasks are dealt round-robin into shards, and a
+dispatcher runs each shard somewhere else:
+
+    process      one worker process per shard on this machine (spawned, each with
+                 its own S3 client, HTTP sessions and transfer threads)
+    process:N    the same, at most N shards at a time
+    lambda:NAME  one synchronous invocation of the Lambda function NAME per shard
+                 (deployed from lambda_scrape_migrate.py, which runs {"shard": ...} events)
+
+Every shard reports its url_mapping, manifest records, new digest index
+entries, derivative variants, counters and metric events, and the parent
+merges them as if its own threads had done the work - so the output JSON,
+the manifest and the run summary are the same as an unsharded run.
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from adaptive_scheduler import TransferScheduler
+from http_pool import configure_pool, DEFAULT_POOL_SIZE
+from content_store import HashIndex
+from derivatives import DerivativeBuilder
+from image_validation import ImageValidator
+from storage_backends import open_mirrors
+from transfer_metrics import TransferMetrics
+
+# Counters each shard reports for the parent's run summary
+SHARD_COUNTERS = {
+    'hash_index': ('uploads', 'hits', 'bytes_skipped'),
+    'validator': ('validated', 'rejected', 'relabelled', 'bytes_saved'),
+    'derivatives': ('rendered', 'failed'),
+    'mirrors': ('written', 'failed'),
+}
+
+# A synchronous Lambda invocation returns at most 6 MB; a shard reports roughly 2 KB per image
+MAX_LAMBDA_SHARD_TASKS = 1000
+
+class RecordingManifest:
+    """Stands in for MigrationManifest in a shard: keeps the records for the parent to replay"""
+
+    def __init__(self):
+        self.records = []
+
+    def record(self, logical_key, url, s3_key, size, status, derivatives=None):
+        self.records.append([logical_key, url, s3_key, size, status, derivatives])
+
+def split_shards(tasks, shard_count):
+    """Deal tasks round-robin into shard_count shards, so every shard gets a mix of posts"""
+    shard_count = max(1, min(shard_count, len(tasks)))
+    return [tasks[index::shard_count] for index in range(shard_count)]
+
+def _new_s3_client(region, scheduler=None):
+    import boto3
+
+    if scheduler is None:
+        return boto3.client('s3', region_name=region)
+    from botocore.config import Config
+
+    s3_config = Config(retries={'mode': 'adaptive', 'max_attempts': 10},
+                       max_pool_connections=scheduler.host_limits['s3']['max'])
+    return boto3.client('s3', region_name=region, config=s3_config)
+
+def run_shard(spec, process_image, s3_client=None, scheduler=None):
+    """
+    Run one shard's transfers on threads in this process (the worker side of every dispatcher)
+
+    Args:
+        spec: Shard description built by run_sharded() - JSON only, since it may travel as a Lambda event
+        process_image: The calling script's process_image
+        s3_client, scheduler: Reuse these instead of creating new ones (a warm Lambda container)
+
+    Returns:
+        JSON-serializable report that merge_shard() folds into the parent's run
+    """
+    started = time.monotonic()
+    region = spec['region']
+    if scheduler is None and spec.get('adaptive'):
+        scheduler = TransferScheduler()
+    if s3_client is None:
+        s3_client = _new_s3_client(region, scheduler)
+    configure_pool(pool_size=spec.get('pool_size', DEFAULT_POOL_SIZE))
+
+    # Shards share the machine's cores, so each one gets its share for decoding and rendering
+    cpu_share = spec.get('cpu_share')
+    hash_index = HashIndex(spec['hash_index_path'], s3_client) if spec.get('hash_index_path') else None
+    known_digests = set(hash_index.entries) if hash_index is not None else set()
+    known_derived = dict(hash_index.derived) if hash_index is not None else {}
+    manifest = RecordingManifest()
+    derivatives = DerivativeBuilder(spec['derivative_formats'], max_workers=cpu_share) \
+        if spec.get('derivative_formats') else None
+    metrics = TransferMetrics()
+    mirrors = open_mirrors(spec.get('mirror_targets'), region)
+    validator = ImageValidator(spec.get('strip_metadata'), spec.get('recompress'), max_workers=cpu_share) \
+        if spec.get('validate') else None
+    options = {'stream': spec.get('stream', False), 'part_size': spec['part_size'], 'hash_index': hash_index,
+               'model_name': spec['model_name'], 'manifest': manifest, 'scheduler': scheduler,
+               'derivatives': derivatives, 'metrics': metrics, 'mirrors': mirrors, 'validator': validator}
+    tasks = [(url, s3_client, spec['bucket_name'], s3_key, region, options) for url, s3_key in spec['tasks']]
+
+    try:
+        with ThreadPoolExecutor(max_workers=scheduler.max_workers if scheduler else spec.get('max_workers', 10)) \
+                as executor:
+            results = list(executor.map(process_image, tasks))
+    finally:
+        if derivatives is not None:
+            derivatives.close()
+        if validator is not None:
+            validator.close()
+
+    parts = {'hash_index': hash_index, 'validator': validator, 'derivatives': derivatives, 'mirrors': mirrors}
+    return {
+        'shard': spec['shard'],
+        'seconds': round(time.monotonic() - started, 1),
+        'results': [[old_url, new_url] for old_url, new_url in results if old_url and new_url],
+        'manifest': manifest.records,
+        'hash_index': {digest: key for digest, key in hash_index.entries.items() if digest not in known_digests}
+                      if hash_index is not None else {},
+        'hash_index_derived': {digest: names for digest, names in hash_index.derived.items()
+                               if known_derived.get(digest) != names} if hash_index is not None else {},
+        'variants': derivatives.variants if derivatives is not None else {},
+        'counts': {name: {counter: getattr(part, counter) for counter in SHARD_COUNTERS[name]}
+                   for name, part in parts.items() if part is not None},
+        'events': metrics.events()
+    }
+
+class ProcessDispatcher:
+    """Runs each shard in its own spawned worker process on this machine"""
+
+    local = True
+    max_shard_tasks = None
+
+    def __init__(self, process_image, max_workers=None):
+        self.process_image = process_image
+        self.max_workers = max_workers
+
+    def map(self, specs):
+        """Yield (spec, future) as shards finish"""
+        # spawn, not fork: the parent is full of threads holding locks
+        with ProcessPoolExecutor(max_workers=self.max_workers or len(specs),
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {executor.submit(run_shard, spec, self.process_image): spec for spec in specs}
+            for future in as_completed(futures):
+                yield futures[future], future
+
+    def __str__(self):
+        return f"process pool{f' of {self.max_workers}' if self.max_workers else ''}"
+
+class LambdaDispatcher:
+    """Runs each shard as a synchronous invocation of a deployed lambda_scrape_migrate function"""
+
+    local = False
+    max_shard_tasks = MAX_LAMBDA_SHARD_TASKS
+
+    def __init__(self, function_name, region='us-east-2', max_workers=None):
+        self.function_name = function_name
+        self.region = region
+        self.max_workers = max_workers
+
+    def _invoke(self, client, spec):
+        response = client.invoke(FunctionName=self.function_name, InvocationType='RequestResponse',
+                                 Payload=json.dumps({'shard': spec}))
+        payload = json.loads(response['Payload'].read())
+        if response.get('FunctionError'):
+            raise RuntimeError(payload.get('errorMessage', payload) if isinstance(payload, dict) else payload)
+        return payload
+
+    def map(self, specs):
+        """Yield (spec, future) as shards finish"""
+        import boto3
+        from botocore.config import Config
+
+        # A shard may run for the full 15 minutes; retrying one that timed out would run it twice
+        config = Config(read_timeout=910, connect_timeout=10, retries={'max_attempts': 0},
+                        max_pool_connections=max(10, len(specs)))
+        client = boto3.client('lambda', region_name=self.region, config=config)
+        with ThreadPoolExecutor(max_workers=self.max_workers or len(specs)) as executor:
+            futures = {executor.submit(self._invoke, client, spec): spec for spec in specs}
+            for future in as_completed(futures):
+                yield futures[future], future
+
+    def __str__(self):
+        return f"Lambda {self.function_name}"
+
+DISPATCHERS = {
+    'process': lambda argument, process_image, region:
+        ProcessDispatcher(process_image, int(argument) if argument else None),
+    'lambda': lambda argument, process_image, region: LambdaDispatcher(argument, region),
+}
+
+def open_dispatcher(target, process_image, region='us-east-2'):
+    """Build a dispatcher from 'process', 'process:N' or 'lambda:FUNCTION_NAME'"""
+    name, _, argument = target.partition(':')
+    if name not in DISPATCHERS:
+        raise ValueError(f"Unknown dispatcher: {target} (expected one of {', '.join(DISPATCHERS)})")
+    if name == 'lambda' and not argument:
+        raise ValueError("The lambda dispatcher needs a function name, e.g. lambda:instagram-scraper")
+    return DISPATCHERS[name](argument, process_image, region)
+
+def _add_counts(part, counts):
+    for counter, value in counts.items():
+        if isinstance(value, dict):
+            totals = getattr(part, counter)
+            for name, amount in value.items():
+                totals[name] = totals.get(name, 0) + amount
+        else:
+            setattr(part, counter, getattr(part, counter) + value)
+
+def merge_shard(report, options):
+    """Fold one shard's report into the parent's manifest, digest index, derivatives, counters and metrics"""
+    manifest = options.get('manifest')
+    if manifest is not None:
+        for record in report['manifest']:
+            *arguments, derivatives = record
+            manifest.record(*arguments, derivatives=derivatives)
+    hash_index = options.get('hash_index')
+    if hash_index is not None:
+        hash_index.merge(report['hash_index'], report.get('hash_index_derived'))
+    derivatives = options.get('derivatives')
+    if derivatives is not None:
+        for url, info in report['variants'].items():
+            derivatives.record(url, info)
+    for name, counts in report['counts'].items():
+        if options.get(name) is not None:
+            _add_counts(options[name], counts)
+    if options.get('metrics') is not None:
+        options['metrics'].extend(report['events'])
+
+def run_sharded(dispatcher, image_tasks, shard_count, spec):
+    """
+    Run image_tasks as shards on dispatcher and merge their reports into the tasks' options
+
+    Args:
+        image_tasks: Planned (url, s3_client, bucket_name, s3_key, region, options) tasks
+        shard_count: Shards to split into (raised when the dispatcher caps the tasks per shard)
+        spec: JSON settings every shard runs with (bucket, region, model, transfer options)
+
+    Returns:
+        (old_url, new_url) results like the thread path; every task of a failed shard counts as failed
+    """
+    if not image_tasks:
+        return []
+    options = image_tasks[0][5]
+    if dispatcher.max_shard_tasks:
+        shard_count = max(shard_count, math.ceil(len(image_tasks) / dispatcher.max_shard_tasks))
+    if not dispatcher.local and spec.get('mirror_targets'):
+        print(f"⚠️  Mirrors are only written by local shards; {dispatcher} shards skip them")
+        spec = dict(spec, mirror_targets=None)
+    if not dispatcher.local and spec.get('hash_index_path') and not spec['hash_index_path'].startswith('s3://'):
+        print("⚠️  Remote shards can't read a local digest index; they start empty (use an s3:// --hash-index)")
+
+    shards = split_shards(image_tasks, shard_count)
+    cpu_share = max(1, (os.cpu_count() or 1) // len(shards)) if dispatcher.local else None
+    specs = [dict(spec, shard=index, shards=len(shards), cpu_share=cpu_share,
+                  tasks=[[task[0], task[3]] for task in shard])
+             for index, shard in enumerate(shards)]
+    print(f"🧩 Running {len(image_tasks)} transfers as {len(shards)} shards on {dispatcher}")
+
+    results = []
+    for shard_spec, future in dispatcher.map(specs):
+        label = f"Shard {shard_spec['shard'] + 1}/{len(shards)}"
+        try:
+            report = future.result()
+        except Exception as e:
+            # Nothing was recorded for this shard, so a manifest retries all of it next run
+            print(f"❌ {label} failed: {e}")
+            results.extend((None, None) for _ in shard_spec['tasks'])
+            continue
+        merge_shard(report, options)
+        results.extend(tuple(result) for result in report['results'])
+        results.extend((None, None) for _ in range(len(shard_spec['tasks']) - len(report['results'])))
+        print(f"🧩 {label}: {len(report['results'])}/{len(shard_spec['tasks'])} stored in {report['seconds']}s")
+    return results
@@ -0,0 +1,131 @@
+"""
+Paginated JSON output for the viewer.
+
+Instead of one indented document holding every post, the posts are written
+as fixed-size page shards next to a small index:
+
+    viewer/public/instagram_data/index.json
+    viewer/public/instagram_data/page-001.json
+    viewer/public/instagram_data/page-002.json
+    ...
+
+The index carries the counts and the per-post sort keys, so the viewer can
+draw page 1 and its totals before the remaining pages arrive. Every file is
+written with compact separators and gets pre-compressed .gz / .br siblings
+(in S3 they're stored with the matching Content-Encoding).
+
+Brotli siblings need: pip install brotli
+"""
+
+import gzip
+import json
+import math
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_PAGE_SIZE = 24
+INDEX_FILE = 'index.json'
+
+# Post fields copied into the index so the viewer can order every post up front
+SORT_KEY_FIELDS = ('id', 'likesCount', 'commentsCount', 'timestamp')
+
+def page_file(page_number):
+    """1 -> 'page-001.json'"""
+    return f"page-{page_number:03d}.json"
+
+def encode_json(data):
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def compressed_variants(body):
+    """Return [(suffix, content_encoding, data)] for the pre-compressed siblings of body"""
+    # mtime=0 keeps the .gz byte-identical when the content hasn't changed
+    variants = [('.gz', 'gzip', gzip.compress(body, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', 'br', brotli.compress(body)))
+    return variants
+
+def build_index(posts, page_size):
+    """Counts, page list and sort keys for posts split into pages of page_size"""
+    page_count = max(1, math.ceil(len(posts) / page_size))
+    return {
+        'version': 1,
+        'pageSize': page_size,
+        'totalPosts': len(posts),
+        'totalImages': sum(len(post.get('images') or []) for post in posts),
+        'totalLikes': sum(post.get('likesCount') or 0 for post in posts),
+        'totalComments': sum(post.get('commentsCount') or 0 for post in posts),
+        'pages': [
+            {'file': page_file(page_number), 'count': len(posts[(page_number - 1) * page_size:page_number * page_size])}
+            for page_number in range(1, page_count + 1)
+        ],
+        # One row per post in page order: post i lives on page i // pageSize + 1
+        'sortKeys': {
+            'fields': list(SORT_KEY_FIELDS),
+            'values': [[post.get(field) for field in SORT_KEY_FIELDS] for post in posts]
+        }
+    }
+
+def _write_local(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _remove_stale_pages(directory, page_count):
+    """Delete page shards (and siblings) left over from an earlier, longer output"""
+    for name in os.listdir(directory):
+        if not name.startswith('page-'):
+            continue
+        number = name[len('page-'):].split('.')[0]
+        if number.isdigit() and int(number) > page_count:
+            os.remove(os.path.join(directory, name))
+
+def write_sharded_json(posts, location, page_size=DEFAULT_PAGE_SIZE, s3_client=None):
+    """
+    Write posts as page shards plus index.json under a directory or s3://bucket/prefix
+
+    Args:
+        posts: List of post dicts, in the order the pages should hold them
+        location: Local directory or s3://bucket/prefix (created / overwritten)
+        page_size: Posts per page shard
+        s3_client: boto3 client, required for s3:// locations
+
+    Returns:
+        The index dict that was written
+    """
+    index = build_index(posts, page_size)
+    files = [(page['file'], posts[number * page_size:(number + 1) * page_size])
+             for number, page in enumerate(index['pages'])]
+    # Index last, so a reader never sees it pointing at pages that aren't written yet
+    files.append((INDEX_FILE, index))
+
+    if location.startswith('s3://'):
+        bucket_name, _, prefix = location[len('s3://'):].partition('/')
+        prefix = prefix.rstrip('/')
+        for name, data in files:
+            body = encode_json(data)
+            key = f"{prefix}/{name}" if prefix else name
+            for suffix, encoding, compressed in compressed_variants(body):
+                s3_client.put_object(Bucket=bucket_name, Key=key + suffix, Body=compressed,
+                                     ContentType='application/json', ContentEncoding=encoding)
+            s3_client.put_object(Bucket=bucket_name, Key=key, Body=body, ContentType='application/json')
+        return index
+
+    os.makedirs(location, exist_ok=True)
+    _remove_stale_pages(location, len(index['pages']))
+    for name, data in files:
+        body = encode_json(data)
+        path = os.path.join(location, name)
+        for suffix, _, compressed in compressed_variants(body):
+            _write_local(path + suffix, compressed)
+        _write_local(path, body)
+    return index
+
+def print_output_stats(index, location):
+    formats = 'json/gz/br' if brotli is not None else 'json/gz (pip install brotli for .br)'
+    print(f"📄 Paginated output: {index['totalPosts']} posts in {len(index['pages'])} pages of "
+          f"{index['pageSize']} ({formats}) → {location}")
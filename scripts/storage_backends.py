@@ -0,0 +1,152 @@
+"""
+Storage targets for migrated images, and fan-out to several of them at once.
+
+The migration archives every image in the primary S3 bucket (an S3Backend
+around the run's client). Extra targets
+("mirrors") receive the same bytes in the same pass, so e.g. the ComfyUI box
+gets its source images without pulling them back down from S3:
+
+    comfyui:/workspace/madison-morgan/input_images   flat folder for LoadImageListFromDir / LoadImage
+    file:/data/instagram-archive                      local copy keeping the S3 key layout
+    s3://backup-bucket                                another AWS bucket
+    s3+https://minio.local:9000/bucket?profile=minio  S3-compatible endpoint (MinIO, R2, ...)
+
+Mirror failures are reported but never fail the transfer - the primary S3
+copy is the source of truth.
+"""
+
+import os
+import threading
+from urllib.parse import urlsplit, parse_qs
+from adaptive_scheduler import scheduler_slot
+from s3_transfer import content_type_for_key
+
+class S3Backend:
+    """Bucket on AWS S3 or on any S3-compatible endpoint"""
+
+    def __init__(self, bucket_name, region='us-east-2', endpoint_url=None, public_base_url=None, profile=None,
+                 s3_client=None):
+        self.bucket_name = bucket_name
+        self.region = region
+        self.endpoint_url = endpoint_url
+        if s3_client is None:
+            import boto3
+
+            session = boto3.Session(profile_name=profile) if profile else boto3
+            s3_client = session.client('s3', region_name=region, endpoint_url=endpoint_url)
+        self.s3_client = s3_client
+        if public_base_url:
+            self.public_base_url = public_base_url.rstrip('/')
+        elif endpoint_url:
+            self.public_base_url = f"{endpoint_url.rstrip('/')}/{bucket_name}"
+        else:
+            self.public_base_url = f"https://{bucket_name}.s3.{region}.amazonaws.com"
+
+    def put(self, key, data, scheduler=None, content_type=None):
+        """Store data under key (content_type defaults to a guess from the key extension); returns the S3 response"""
+        with scheduler_slot(scheduler, 's3'):
+            return self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                Body=data,
+                ContentType=content_type or content_type_for_key(key),
+                CacheControl='public, max-age=31536000'
+            )
+
+    def url(self, key):
+        return f"{self.public_base_url}/{key}"
+
+    def __str__(self):
+        return f"{self.endpoint_url or 's3:/'}/{self.bucket_name}"
+
+class LocalBackend:
+    """
+    Directory on local disk
+
+    With flat=True every image goes straight into root as <post_id>_<file>
+    (madison-morgan/posts/123/image_000.jpg -> 123_image_000.jpg), which is what
+    ComfyUI's directory loaders expect; otherwise the key layout is kept.
+    """
+
+    def __init__(self, root, flat=False):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.flat = flat
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        if self.flat:
+            return os.path.join(self.root, '_'.join(key.split('/')[-2:]))
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key, data, scheduler=None, content_type=None):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a workflow reading the folder never sees half a file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def url(self, key):
+        return self.path(key)
+
+    def __str__(self):
+        return f"{'comfyui' if self.flat else 'file'}:{self.root}"
+
+def open_backend(uri, region='us-east-2'):
+    """Build a backend from a target URI (see the module docstring for the forms)"""
+    scheme, _, rest = uri.partition(':')
+    if scheme == 'comfyui':
+        return LocalBackend(rest, flat=True)
+    if scheme == 'file':
+        return LocalBackend(urlsplit(uri).path or rest)
+    if scheme in ('s3', 's3+http', 's3+https'):
+        parts = urlsplit(uri)
+        options = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+        if scheme == 's3':
+            return S3Backend(parts.netloc, options.get('region', region), profile=options.get('profile'))
+        endpoint_url = f"{scheme[len('s3+'):]}://{parts.netloc}"
+        bucket_name = parts.path.strip('/')
+        if not bucket_name:
+            raise ValueError(f"No bucket in {uri} (expected s3+https://host/bucket)")
+        return S3Backend(bucket_name, options.get('region', region), endpoint_url=endpoint_url,
+                         public_base_url=options.get('public_url'), profile=options.get('profile'))
+    if '://' not in uri:
+        # Bare path
+        return LocalBackend(uri)
+    raise ValueError(f"Unknown storage target: {uri}")
+
+class MirrorSet:
+    """Writes every stored image to a list of extra backends, counting failures per backend"""
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+        self.written = {str(backend): 0 for backend in self.backends}
+        self.failed = {str(backend): 0 for backend in self.backends}
+        self._lock = threading.Lock()
+
+    def put(self, key, data, scheduler=None, content_type=None):
+        """Copy data to every mirror under key; returns the number of mirrors that failed"""
+        failures = 0
+        for backend in self.backends:
+            try:
+                backend.put(key, data, scheduler, content_type)
+                outcome = self.written
+            except Exception as e:
+                print(f"⚠️  Mirror {backend} failed for {key}: {e}")
+                outcome = self.failed
+                failures += 1
+            with self._lock:
+                outcome[str(backend)] += 1
+        return failures
+
+    def print_stats(self):
+        for name in self.written:
+            print(f"🪞 Mirror {name}: {self.written[name]} written, {self.failed[name]} failed")
+
+def open_mirrors(uris, region='us-east-2'):
+    """MirrorSet for a list of target URIs, or None when there are none"""
+    uris = [uri for uri in uris or [] if uri]
+    if not uris:
+        return None
+    return MirrorSet(open_backend(uri, region) for uri in uris)
@@ -0,0 +1,160 @@
+"""
+Collapse duplicate image references into one transfer each.
+
+A scraped post usually lists the same picture twice (displayUrl is
+images[0]), and Instagram CDN URLs for one file differ between references
+in their signature and tracking parameters (oh, oe, _nc_*) and even in the
+edge host. Both used to be downloaded and uploaded separately.
+
+URLs are reduced to a canonical form - CDN edge host folded, signing and
+tracking parameters dropped, the rest sorted - and only the first reference
+to each canonical URL is scheduled. Once the transfers finish, fan_out()
+gives every other reference the S3 URL of the one that was transferred.
+
+post_media() is the one place that knows where a scraped post keeps media:
+displayUrl, images, videoUrl, childPosts and the commenters' profile pictures
+in latestComments. Tasks are built from it and rewrite_media() points the same
+fields at S3 afterwards, so nothing is left on an expiring CDN link.
+"""
+
+import os
+import threading
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from adaptive_scheduler import host_class
+
+# Query parameters that sign, expire or track a URL without changing the bytes served.
+# Rendition parameters (Instagram's stp, Shopify's width) are kept.
+SIGNING_PARAMS = frozenset({
+    'oh', 'oe', 'ccb', 'edm', 'efg', 'ig_cache_key',
+    'expires', 'signature', 'key-pair-id', 'policy',
+})
+SIGNING_PREFIXES = ('_nc_', 'x-amz-')
+
+def canonical_url(url):
+    """Reduce url to the form shared by every reference to the same image"""
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    # Any Instagram edge serves any path, so the edge a URL happens to name doesn't matter
+    if host_class(url) == 'instagram-cdn':
+        host = 'instagram-cdn'
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in SIGNING_PARAMS and not name.lower().startswith(SIGNING_PREFIXES)
+    )
+    canonical = f"{host}{parts.path}"
+    return f"{canonical}?{urlencode(query)}" if query else canonical
+
+MEDIA_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.mp4')
+
+def media_extension(url, default='.jpg'):
+    """Extension of the file a URL points at, or default"""
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    return ext if ext in MEDIA_EXTENSIONS else default
+
+def media_kind(s3_key):
+    """'video', 'profile' (a commenter's profile picture) or 'image' for a key built by post_media()"""
+    if s3_key.endswith('.mp4'):
+        return 'video'
+    if '/profiles/' in s3_key:
+        return 'profile'
+    return 'image'
+
+def _comment_media(item):
+    """Profile pictures of the commenters (and repliers) in item's latestComments"""
+    for comment in item.get('latestComments') or []:
+        for entry in [comment] + list(comment.get('replies') or []):
+            owner = entry.get('owner') or {}
+            username = entry.get('ownerUsername') or owner.get('username') or 'unknown'
+            for container, field in ((entry, 'ownerProfilePicUrl'), (owner, 'profile_pic_url')):
+                url = container.get(field)
+                if url:
+                    # The file name changes with the picture, so a new picture gets a new key
+                    name = os.path.basename(urlsplit(url).path) or 'profile.jpg'
+                    yield container, field, f"profiles/{username}/{name}"
+
+def post_media(post, post_id):
+    """
+    Every media URL field of a scraped post
+
+    Yields:
+        (container, field, key) - container[field] is the URL and key its S3 key below the
+        model prefix, e.g. posts/<post_id>/image_000.jpg, posts/<post_id>/video.mp4,
+        posts/<post_id>/child_001.jpg or profiles/<username>/<file>.jpg
+    """
+    if post.get('displayUrl'):
+        yield post, 'displayUrl', f"posts/{post_id}/image_000{media_extension(post['displayUrl'])}"
+    for index, url in enumerate(post.get('images') or []):
+        yield post['images'], index, f"posts/{post_id}/image_{index:03d}{media_extension(url)}"
+    if post.get('videoUrl'):
+        yield post, 'videoUrl', f"posts/{post_id}/video{media_extension(post['videoUrl'], '.mp4')}"
+
+    # Carousel items: usually the same pictures as images, which the planner collapses
+    for child_index, child in enumerate(post.get('childPosts') or []):
+        stem = f"posts/{post_id}/child_{child_index:03d}"
+        if child.get('displayUrl'):
+            yield child, 'displayUrl', f"{stem}{media_extension(child['displayUrl'])}"
+        for index, url in enumerate(child.get('images') or []):
+            yield child['images'], index, f"{stem}_{index:03d}{media_extension(url)}"
+        if child.get('videoUrl'):
+            yield child, 'videoUrl', f"{stem}{media_extension(child['videoUrl'], '.mp4')}"
+        yield from _comment_media(child)
+
+    yield from _comment_media(post)
+
+def post_media_urls(post):
+    """Every media URL a post references"""
+    return [container[field] for container, field, _ in post_media(post, post.get('id'))]
+
+def rewrite_media(post, url_mapping):
+    """Replace every media URL of post that url_mapping has a new location for"""
+    for container, field, _ in post_media(post, post.get('id')):
+        container[field] = url_mapping.get(container[field], container[field])
+
+class TransferPlanner:
+    """Keeps the first task per canonical URL and counts how many references it stands for"""
+
+    def __init__(self):
+        self.total = 0
+        self._first = {}
+        self._lock = threading.Lock()
+
+    @property
+    def unique(self):
+        return len(self._first)
+
+    def plan(self, tasks):
+        """Return the tasks whose URL hasn't been planned yet (task[0] is the source URL)"""
+        planned = []
+        with self._lock:
+            for task in tasks:
+                self.total += 1
+                key = canonical_url(task[0])
+                if key not in self._first:
+                    self._first[key] = task[0]
+                    planned.append(task)
+        return planned
+
+    def planned(self, items):
+        """Pass items through, printing the plan once the iterator is exhausted"""
+        yield from items
+        self.print_plan()
+
+    def print_plan(self):
+        duplicates = self.total - self.unique
+        print(f"🗺️  Plan: {self.unique} unique images for {self.total} references "
+              f"({duplicates} duplicate{'s' if duplicates != 1 else ''} collapsed)")
+
+def fan_out(mapping, urls):
+    """
+    Copy mapping values to every url in urls that has the same canonical form as a mapped URL
+
+    Used after the transfers for url_mapping (old URL -> S3 URL) and the derivative variants,
+    both of which only hold the reference that was actually transferred.
+    """
+    by_canonical = {canonical_url(url): value for url, value in mapping.items()}
+    for url in urls:
+        if url not in mapping:
+            value = by_canonical.get(canonical_url(url))
+            if value is not None:
+                mapping[url] = value
+    return mapping
@@ -0,0 +1,191 @@
+"""
+Per-stage transfer metrics for the migration scripts.
+
+Every download, upload and streamed transfer records one event: stage,
+latency, bytes, final HTTP status, retries and whether it succeeded. Events
+can be appended to a JSON lines file as they happen; at the end of a run they
+are aggregated per stage into latency percentiles (p50/p95/p99) and
+throughput (MB/s, objects/s over the stage's wall-clock span).
+
+In Lambda the aggregates are printed in CloudWatch Embedded Metric Format, so
+they become CloudWatch metrics straight from the log stream without any
+PutMetricData calls.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+DEFAULT_METRICS_PATH = 'transfer_metrics.jsonl'
+DEFAULT_NAMESPACE = 'InstagramScraper'
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def error_status(error):
+    """HTTP status carried by a requests or botocore exception, if any"""
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return getattr(response, 'status_code', None)
+
+class _Event:
+    """Handle yielded by measure(); fill in what the stage observed"""
+
+    def __init__(self):
+        self.size = 0
+        self.status = None
+        self.retries = 0
+        self.ok = False
+
+class TransferMetrics:
+    """Thread-safe collector of transfer events, optionally mirrored to a JSON lines file"""
+
+    def __init__(self, events_path=None):
+        self.events_path = events_path
+        self._events = []
+        self._lock = threading.Lock()
+        self._file = open(events_path, 'a', encoding='utf-8') if events_path else None
+
+    def record(self, stage, seconds, size=0, status=None, retries=0, ok=True, target=None, started=None):
+        """Record one finished stage of one transfer (target is the source URL or the S3 key)"""
+        finished = time.time()
+        event = {
+            'stage': stage,
+            'started': round(started if started is not None else finished - seconds, 3),
+            'finished': round(finished, 3),
+            'latency_ms': round(seconds * 1000, 1),
+            'bytes': size or 0,
+            'status': status,
+            'retries': retries,
+            'ok': ok,
+            'target': target
+        }
+        with self._lock:
+            self._events.append(event)
+            if self._file is not None:
+                self._file.write(json.dumps(event, separators=(',', ':')) + '\n')
+
+    def events(self):
+        """Copy of every event recorded so far"""
+        with self._lock:
+            return list(self._events)
+
+    def extend(self, events):
+        """Add events recorded by another collector (e.g. a shard in another process)"""
+        with self._lock:
+            self._events.extend(events)
+            if self._file is not None:
+                for event in events:
+                    self._file.write(json.dumps(event, separators=(',', ':')) + '\n')
+
+    @contextmanager
+    def measure(self, stage, target=None):
+        """Time the block as one event of stage; an exception records it as failed"""
+        event = _Event()
+        started = time.time()
+        start = time.monotonic()
+        try:
+            yield event
+        except BaseException:
+            event.ok = False
+            raise
+        finally:
+            self.record(stage, time.monotonic() - start, event.size, event.status, event.retries,
+                        event.ok, target, started)
+
+    def summary(self):
+        """Aggregate the events per stage: counts, bytes, latency percentiles and throughput"""
+        with self._lock:
+            events = list(self._events)
+
+        stages = {}
+        for stage in sorted({event['stage'] for event in events}):
+            stage_events = [event for event in events if event['stage'] == stage]
+            succeeded = [event for event in stage_events if event['ok']]
+            latencies = sorted(event['latency_ms'] for event in succeeded)
+            total_bytes = sum(event['bytes'] for event in succeeded)
+            span = max(event['finished'] for event in stage_events) - min(event['started'] for event in stage_events)
+            span = max(span, 1e-3)
+            stages[stage] = {
+                'count': len(stage_events),
+                'failed': len(stage_events) - len(succeeded),
+                'retries': sum(event['retries'] for event in stage_events),
+                'bytes': total_bytes,
+                'p50_ms': percentile(latencies, 0.50),
+                'p95_ms': percentile(latencies, 0.95),
+                'p99_ms': percentile(latencies, 0.99),
+                'mb_per_s': round(total_bytes / (1024 * 1024) / span, 2),
+                'objects_per_s': round(len(succeeded) / span, 2),
+                'statuses': {
+                    str(status): sum(1 for event in stage_events if event['status'] == status)
+                    for status in sorted({event['status'] for event in stage_events if event['status'] is not None})
+                }
+            }
+        return stages
+
+    def close(self):
+        """Append the per-stage summary to the events file and close it"""
+        with self._lock:
+            if self._file is None:
+                return
+            events_file, self._file = self._file, None
+        events_file.write(json.dumps({'stage': 'summary', 'stages': self.summary()}, separators=(',', ':')) + '\n')
+        events_file.close()
+
+    def print_summary(self):
+        for stage, stats in self.summary().items():
+            if stats['p50_ms'] is None:
+                print(f"📈 {stage}: {stats['count']} transfers, all failed")
+                continue
+            print(f"📈 {stage}: {stats['count'] - stats['failed']}/{stats['count']} ok, "
+                  f"p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms, p99 {stats['p99_ms']:.0f} ms, "
+                  f"{stats['mb_per_s']} MB/s, {stats['objects_per_s']} objects/s, {stats['retries']} retries")
+        if self.events_path:
+            print(f"📈 Transfer events written to {self.events_path}")
+
+    def emit_emf(self, namespace=DEFAULT_NAMESPACE, dimensions=None):
+        """Print one CloudWatch Embedded Metric Format record per stage"""
+        dimensions = dict(dimensions or {})
+        units = {
+            'Transfers': 'Count', 'Failed': 'Count', 'Retries': 'Count', 'Bytes': 'Bytes',
+            'LatencyP50': 'Milliseconds', 'LatencyP95': 'Milliseconds', 'LatencyP99': 'Milliseconds',
+            'Throughput': 'Megabytes/Second', 'ObjectsPerSecond': 'Count/Second'
+        }
+        for stage, stats in self.summary().items():
+            values = {
+                'Transfers': stats['count'], 'Failed': stats['failed'], 'Retries': stats['retries'],
+                'Bytes': stats['bytes'], 'LatencyP50': stats['p50_ms'], 'LatencyP95': stats['p95_ms'],
+                'LatencyP99': stats['p99_ms'], 'Throughput': stats['mb_per_s'],
+                'ObjectsPerSecond': stats['objects_per_s']
+            }
+            # Percentiles are missing when every transfer of the stage failed
+            print_emf(namespace, {**dimensions, 'Stage': stage},
+                      {name: (value, units[name]) for name, value in values.items() if value is not None})
+
+def print_emf(namespace, dimensions, values):
+    """Print one CloudWatch Embedded Metric Format record; values maps name -> (value, unit)"""
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in values.items()]
+            }]
+        },
+        **dimensions,
+        **{name: value for name, (value, _) in values.items()}
+    }
+    print(json.dumps(record, separators=(',', ':')))
+
+def measure(metrics, stage, target=None):
+    """metrics.measure(...) or a no-op context when running without metrics"""
+    if metrics is None:
+        return nullcontext(_Event())
+    return metrics.measure(stage, target)
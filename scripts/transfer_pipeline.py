@@ -0,0 +1,125 @@
+"""
+Bounded producer/consumer pipeline from a dataset iterator into transfer workers.
+
+Instead of collecting every Apify dataset item before the first download,
+each item is expanded into transfer tasks as soon as it arrives and queued
+for a fixed set of worker threads. Images start moving while later dataset
+pages are still being fetched, so signed CDN URLs are used as fresh as
+possible. The queue is bounded: when transfers fall behind, the dataset
+iterator blocks instead of buffering the whole scrape in memory.
+
+Several pipelines (e.g. one per account) can share a single TransferPool so
+the total number of transfer threads stays fixed however many run at once.
+"""
+
+import queue
+import threading
+from functools import partial
+from http_pool import close_session
+
+DEFAULT_QUEUE_SIZE = 100
+
+_DONE = object()
+
+class TransferPool:
+    """Fixed set of worker threads fed from one bounded queue"""
+
+    def __init__(self, max_workers, queue_size=DEFAULT_QUEUE_SIZE):
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(max_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is _DONE:
+                # Release this worker's keep-alive connections with it
+                close_session()
+                return
+            job()
+
+    def put(self, job):
+        """Queue a no-argument callable, blocking while the queue is full"""
+        self._jobs.put(job)
+
+    def close(self):
+        """Let the workers finish what is queued, then stop them"""
+        for _ in self._threads:
+            self._jobs.put(_DONE)
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def run_pipeline(items, expand, worker, max_workers=None, queue_size=DEFAULT_QUEUE_SIZE, on_result=None,
+                 should_stop=None, deferred=None, pool=None):
+    """
+    Stream items through expand() into worker threads running worker()
+
+    Args:
+        items: Iterable of source items (e.g. dataset.iterate_items()), consumed lazily
+        expand: Called as expand(index, item) on the calling thread, returns that item's tasks
+        worker: Called with each task on a worker thread, returns its result
+        max_workers: Number of worker threads (when no shared pool is given)
+        queue_size: Maximum tasks waiting between the iterator and the workers
+        on_result: Optional callback invoked with each result (from worker threads)
+        should_stop: Optional callable; once it returns True, tasks are no longer started
+                     but appended to deferred (e.g. when a Lambda runs out of time)
+        deferred: List collecting the tasks skipped because of should_stop
+        pool: Optional TransferPool shared with other pipelines
+
+    Returns:
+        List of worker results in completion order, once every task of this pipeline is done
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = TransferPool(max_workers, queue_size)
+
+    results = []
+    errors = []
+    outstanding = [0]
+    lock = threading.Condition()
+
+    def run(task):
+        try:
+            if should_stop is not None and should_stop():
+                with lock:
+                    deferred.append(task)
+                return
+            try:
+                result = worker(task)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                return
+            with lock:
+                results.append(result)
+            if on_result:
+                on_result(result)
+        finally:
+            with lock:
+                outstanding[0] -= 1
+                lock.notify_all()
+
+    try:
+        for index, item in enumerate(items):
+            for task in expand(index, item):
+                with lock:
+                    outstanding[0] += 1
+                pool.put(partial(run, task))
+    finally:
+        # Let the workers drain what was queued, even if the iterator failed part way
+        with lock:
+            while outstanding[0]:
+                lock.wait()
+        if own_pool:
+            pool.close()
+
+    if errors:
+        raise errors[0]
+    return results
@@ -1,51 +1,49 @@
 #!/usr/bin/env python3
 """Verify Instagram follower counts for brands"""
 import os
-import requests
+from apify_runs import ApifyRunManager, INSTAGRAM_SCRAPER, instagram_input, run_actor
 import json
 from dotenv import load_dotenv
 
 load_dotenv('.env.local')
 APIFY_TOKEN = os.getenv('APIFY_API_TOKEN')
 
+def profile_summary(username, data):
+    """Follower count and bio from a details scrape, or None if it came back empty"""
+    if data and len(data) > 0:
+        profile = data[0]
+        followers = profile.get('followersCount', 0)
+        full_name = profile.get('fullName', '')
+        bio = (profile.get('biography') or '')[:100]
+        print(f"✅ @{username}: {followers:,} followers - {full_name}")
+        return {
+            'username': username,
+            'followers': followers,
+            'full_name': full_name,
+            'bio': bio,
+            'url': f"https://www.instagram.com/{username}/"
+        }
+    print(f"❌ @{username}: No data returned")
+    return None
+
 def check_instagram_profile(username):
     """Check Instagram profile using Apify"""
-    url = f"https://api.apify.com/v2/acts/apify~instagram-scraper/run-sync-get-dataset-items?token={APIFY_TOKEN}"
-
-    payload = {
-        "directUrls": [f"https://www.instagram.com/{username}/"],
-        "resultsType": "details",
-        "resultsLimit": 1
-    }
+    print(f"🔍 Checking @{username}...")
+    data = run_actor(APIFY_TOKEN, INSTAGRAM_SCRAPER, instagram_input(username, 'details', 1),
+                     label=f"@{username}")
+    return profile_summary(username, data) if data is not None else None
 
-    try:
+def check_instagram_profiles(usernames):
+    """Check several profiles at once; returns the summaries in the order of usernames"""
+    manager = ApifyRunManager(APIFY_TOKEN)
+    runs = []
+    for username in usernames:
         print(f"🔍 Checking @{username}...")
-        response = requests.post(url, json=payload, headers={'Content-Type': 'application/json'}, timeout=120)
-
-        if response.status_code in [200, 201]:
-            data = response.json()
-            if data and len(data) > 0:
-                profile = data[0]
-                followers = profile.get('followersCount', 0)
-                full_name = profile.get('fullName', '')
-                bio = profile.get('biography', '')[:100]
-                print(f"✅ @{username}: {followers:,} followers - {full_name}")
-                return {
-                    'username': username,
-                    'followers': followers,
-                    'full_name': full_name,
-                    'bio': bio,
-                    'url': f"https://www.instagram.com/{username}/"
-                }
-            else:
-                print(f"❌ @{username}: No data returned")
-                return None
-        else:
-            print(f"❌ @{username}: Error {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"❌ @{username}: {str(e)}")
-        return None
+        runs.append(manager.add(INSTAGRAM_SCRAPER, instagram_input(username, 'details', 1), label=f"@{username}"))
+    manager.run()
+    manager.print_summary()
+    return [profile_summary(username, run.items) if run.succeeded else None
+            for username, run in zip(usernames, runs)]
 
 if __name__ == "__main__":
     # Brands to verify
@@ -56,11 +54,7 @@ if __name__ == "__main__":
         "coverswim",
     ]
 
-    results = []
-    for username in brands_to_check:
-        result = check_instagram_profile(username)
-        if result:
-            results.append(result)
+    results = [result for result in check_instagram_profiles(brands_to_check) if result]
 
     # Save results
     with open('../research/verified_followers.json', 'w') as f:
@@ -3,6 +3,7 @@
 import { useState, useEffect } from 'react';
 import PostGrid from '@/components/PostGrid';
 import PostModal from '@/components/PostModal';
+import { fetchJson, type ImageVariants, type PostIndex } from '@/lib/utils';
 
 interface InstagramPost {
   id: string;
@@ -13,6 +14,9 @@ interface InstagramPost {
   commentsCount: number;
   images: string[];
   displayUrl: string;
+  videoUrl?: string;
+  displayVariants?: ImageVariants | null;
+  imageVariants?: (ImageVariants | null)[];
   ownerUsername: string;
   ownerId: string;
   engagementScore?: number;
@@ -39,6 +43,7 @@ export default function Home() {
   const [activeTab, setActiveTab] = useState<Tab>('posts');
   const [allPosts, setAllPosts] = useState<InstagramPost[]>([]);
   const [posts, setPosts] = useState<InstagramPost[]>([]);
+  const [postIndex, setPostIndex] = useState<PostIndex | null>(null);
   const [creations, setCreations] = useState<Creation[]>([]);
   const [selectedPost, setSelectedPost] = useState<InstagramPost | null>(null);
   const [selectedCreation, setSelectedCreation] = useState<Creation | null>(null);
@@ -46,44 +51,53 @@ export default function Home() {
   const [sortBy, setSortBy] = useState<SortOption>('algorithm');
 
   useEffect(() => {
-    // Load Instagram posts
-    fetch('/instagram_data.json')
-      .then(res => res.json())
-      .then(data => {
-        // Calculate engagement scores
-        const totalEngagement = data.reduce((sum: number, p: InstagramPost) =>
-          sum + p.likesCount + p.commentsCount, 0
-        );
-        const avgEngagement = totalEngagement / data.length;
-
-        // Add scores to each post
-        const scoredPosts = data.map((post: InstagramPost, index: number) => {
-          const rawEngagement = post.likesCount + (post.commentsCount * 2); // Comments worth 2x
-          const performanceMultiplier = rawEngagement / avgEngagement;
-          const engagementScore = rawEngagement * performanceMultiplier;
-
-          return {
-            ...post,
-            rawEngagement,
-            engagementScore,
-            originalIndex: index
-          };
-        });
-
-        setAllPosts(scoredPosts);
-
-        // Default sort by algorithm
-        const sorted = [...scoredPosts].sort((a, b) =>
-          (b.engagementScore || 0) - (a.engagementScore || 0)
-        );
-        setPosts(sorted);
-        setLoading(false);
-      })
-      .catch(err => {
-        console.error('Error loading posts:', err);
-        setLoading(false);
+    // Comments worth 2x, scaled by how the post performs against the account average
+    const scorePosts = (data: InstagramPost[], avgEngagement: number) =>
+      data.map((post, index) => {
+        const rawEngagement = post.likesCount + (post.commentsCount * 2);
+        const performanceMultiplier = rawEngagement / avgEngagement;
+        const engagementScore = rawEngagement * performanceMultiplier;
+
+        return {
+          ...post,
+          rawEngagement,
+          engagementScore,
+          originalIndex: index
+        };
       });
 
+    const loadPosts = async () => {
+      let index: PostIndex;
+      try {
+        index = await fetchJson<PostIndex>('/instagram_data/index.json');
+      } catch {
+        // No paginated output yet - load the single JSON file
+        const data: InstagramPost[] = await fetchJson('/instagram_data.json');
+        const totalEngagement = data.reduce((sum, p) => sum + p.likesCount + p.commentsCount, 0);
+        setAllPosts(scorePosts(data, totalEngagement / data.length));
+        setLoading(false);
+        return;
+      }
+
+      // Draw page 1 as soon as it arrives, then fill in the rest
+      setPostIndex(index);
+      const avgEngagement = (index.totalLikes + index.totalComments) / index.totalPosts;
+      const [firstPage, ...otherPages] = index.pages;
+      const firstPosts: InstagramPost[] = await fetchJson(`/instagram_data/${firstPage.file}`);
+      setAllPosts(scorePosts(firstPosts, avgEngagement));
+      setLoading(false);
+
+      const rest = await Promise.all(
+        otherPages.map(page => fetchJson<InstagramPost[]>(`/instagram_data/${page.file}`))
+      );
+      setAllPosts(scorePosts([firstPosts, ...rest].flat(), avgEngagement));
+    };
+
+    loadPosts().catch(err => {
+      console.error('Error loading posts:', err);
+      setLoading(false);
+    });
+
     // Load creations
     fetch('/creations_data.json')
       .then(res => res.json())
@@ -154,7 +168,7 @@ export default function Home() {
             >
               📸 Instagram Posts
               <span className="ml-2 bg-gray-100 text-gray-600 px-2 py-0.5 rounded-full text-xs">
-                {posts.length}
+                {postIndex?.totalPosts ?? posts.length}
               </span>
             </button>
             <button
@@ -192,7 +206,8 @@ export default function Home() {
               </select>
 
               <div className="ml-auto text-sm text-gray-500">
-                {posts.length} posts, {posts.reduce((sum, p) => sum + p.images.length, 0)} images
+                {postIndex?.totalPosts ?? posts.length} posts,{' '}
+                {postIndex?.totalImages ?? posts.reduce((sum, p) => sum + p.images.length, 0)} images
               </div>
             </div>
 
@@ -1,4 +1,4 @@
-import { getProxiedImageUrl } from '@/lib/utils';
+import { getVariantUrl, type ImageVariants } from '@/lib/utils';
 
 interface InstagramPost {
   id: string;
@@ -9,6 +9,8 @@ interface InstagramPost {
   commentsCount: number;
   images: string[];
   displayUrl: string;
+  displayVariants?: ImageVariants | null;
+  imageVariants?: (ImageVariants | null)[];
   ownerUsername: string;
   ownerId: string;
 }
@@ -30,7 +32,7 @@ export default function PostGrid({ posts, onPostClick }: PostGridProps) {
             className="relative aspect-square bg-gray-200 rounded-lg overflow-hidden cursor-pointer group hover:opacity-90 transition-opacity"
           >
             <img
-              src={getProxiedImageUrl(post.displayUrl)}
+              src={getVariantUrl(post.displayUrl, post.displayVariants, 'thumb')}
               alt={post.caption?.slice(0, 100) || 'Instagram post'}
               className="w-full h-full object-cover"
             />
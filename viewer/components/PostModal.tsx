@@ -1,7 +1,7 @@
 'use client';
 
 import { useState } from 'react';
-import { getProxiedImageUrl } from '@/lib/utils';
+import { getVariantUrl, type ImageVariants } from '@/lib/utils';
 
 interface InstagramPost {
   id: string;
@@ -12,6 +12,9 @@ interface InstagramPost {
   commentsCount: number;
   images: string[];
   displayUrl: string;
+  videoUrl?: string;
+  displayVariants?: ImageVariants | null;
+  imageVariants?: (ImageVariants | null)[];
   ownerUsername: string;
   ownerId: string;
 }
@@ -27,6 +30,7 @@ export default function PostModal({ post, onClose }: PostModalProps) {
 
   // Use images array if available, otherwise use displayUrl
   const allImages = post.images && post.images.length > 0 ? post.images : [post.displayUrl];
+  const allVariants = post.images && post.images.length > 0 ? post.imageVariants : [post.displayVariants];
 
   const handleCopyUrl = (url: string) => {
     navigator.clipboard.writeText(url);
@@ -53,11 +57,22 @@ export default function PostModal({ post, onClose }: PostModalProps) {
       >
         {/* Image Section */}
         <div className="lg:w-2/3 bg-black flex items-center justify-center relative">
-          <img
-            src={getProxiedImageUrl(allImages[currentImageIndex])}
-            alt={`Image ${currentImageIndex + 1}`}
-            className="max-h-[70vh] lg:max-h-[90vh] w-auto object-contain"
-          />
+          {/* Video posts: the migration stores the video in S3 next to its cover image */}
+          {post.videoUrl ? (
+            <video
+              src={post.videoUrl}
+              poster={getVariantUrl(post.displayUrl, post.displayVariants, 'medium')}
+              controls
+              playsInline
+              className="max-h-[70vh] lg:max-h-[90vh] w-auto object-contain"
+            />
+          ) : (
+            <img
+              src={getVariantUrl(allImages[currentImageIndex], allVariants?.[currentImageIndex], 'medium')}
+              alt={`Image ${currentImageIndex + 1}`}
+              className="max-h-[70vh] lg:max-h-[90vh] w-auto object-contain"
+            />
+          )}
 
           {allImages.length > 1 && (
             <>
@@ -2,3 +2,55 @@ export function getProxiedImageUrl(originalUrl: string): string {
   // Return the original URL directly without proxying
   return originalUrl;
 }
+
+export interface ImageVariant {
+  name: string;
+  format: string;
+  url: string;
+  width: number;
+  height: number;
+}
+
+export interface ImageVariants {
+  width: number;
+  height: number;
+  variants: ImageVariant[];
+}
+
+// Resized copy written by the S3 migration ('thumb' for the grid, 'medium' for the modal),
+// falling back to the original when the post was migrated without derivatives
+export function getVariantUrl(originalUrl: string, variants: ImageVariants | null | undefined, name: string): string {
+  const variant = variants?.variants.find((v) => v.name === name && v.format === 'webp');
+  return variant ? variant.url : getProxiedImageUrl(originalUrl);
+}
+
+export interface PostIndex {
+  version: number;
+  pageSize: number;
+  totalPosts: number;
+  totalImages: number;
+  totalLikes: number;
+  totalComments: number;
+  pages: { file: string; count: number }[];
+  sortKeys: { fields: string[]; values: unknown[][] };
+}
+
+// Fetch JSON written by the migration scripts, preferring the pre-compressed .gz copy
+// where the browser can inflate it itself
+export async function fetchJson<T>(path: string): Promise<T> {
+  if (typeof DecompressionStream !== 'undefined') {
+    try {
+      const res = await fetch(`${path}.gz`);
+      if (res.ok && res.body) {
+        return await new Response(res.body.pipeThrough(new DecompressionStream('gzip'))).json();
+      }
+    } catch {
+      // No .gz, or the host already decoded it - fall back to the plain file
+    }
+  }
+  const res = await fetch(path);
+  if (!res.ok) {
+    throw new Error(`Failed to load ${path}: ${res.status}`);
+  }
+  return res.json();
+}